@@ -1,9 +1,10 @@
 # api/main.py
 from fastapi import FastAPI, HTTPException, status
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import Dict, Any, Optional, List
 import uvicorn
+import json
 import os
 
 from services.rag_service import EnterpriseRAGService
@@ -68,6 +69,8 @@ async def shutdown_event():
     if rag_service:
         # rag_service.export_metrics_to_file("rag_api_metrics_final.json") # 移除metrics输出
         logger.logger.info("RAG service metrics exported.")
+        if hasattr(rag_service.llm, "close"):
+            rag_service.llm.close()  # 关闭外部LLM服务的连接池
     logger.logger.info("FastAPI application shutdown completed.")
 
 
@@ -110,7 +113,7 @@ async def query_rag(request: QueryRequest):
         )
 
     try:
-        response = rag_service.query(
+        response = await rag_service.aquery(
             request.query,
             user_id=request.user_id,
             use_cache=request.use_cache,
@@ -134,6 +137,35 @@ async def query_rag(request: QueryRequest):
         )
 
 
+@app.post("/query/stream", summary="RAG流式查询接口（SSE）")
+async def query_rag_stream(request: QueryRequest):
+    """
+    以 Server-Sent Events 返回：先发送检索来源（sources），再逐段发送生成的文本（token），
+    最后发送包含耗时与置信度的 final 事件；出错时发送 error 事件。
+    """
+    if not rag_service or not rag_service.is_initialized:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="RAG service is not initialized or failed to start."
+        )
+
+    async def event_source():
+        async for event in rag_service.astream_query(
+                request.query,
+                user_id=request.user_id,
+                use_cache=request.use_cache,
+                include_debug=request.include_debug
+        ):
+            data = json.dumps(event["data"], ensure_ascii=False, default=str)
+            yield f"event: {event['event']}\ndata: {data}\n\n"
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @app.get("/metrics", summary="获取系统指标", response_model=Dict[str, Any])
 async def get_metrics():
     """获取当前RAG系统的运行指标。"""
@@ -145,21 +177,62 @@ async def get_metrics():
     return rag_service.get_system_status()
 
 
-@app.post("/clear_cache", summary="清空Redis缓存", response_model=Dict[str, Any])
-async def clear_redis_cache():
-    """清空RAG系统使用的Redis缓存。"""
+class FalseHitRequest(BaseModel):
+    query: str
+
+
+@app.get("/semantic_cache/audit", summary="语义答案缓存审计", response_model=Dict[str, Any])
+async def semantic_cache_audit():
+    """返回语义缓存命中率及最近的命中记录（相似度、字面重合度、可疑标记）。"""
+    if not rag_service or not rag_service.is_initialized:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="RAG service is not initialized or failed to start."
+        )
+    return rag_service.get_semantic_cache_audit()
+
+
+@app.post("/semantic_cache/false_hit", summary="上报语义缓存误命中", response_model=Dict[str, Any])
+async def report_semantic_false_hit(request: FalseHitRequest):
+    """上报某个问题命中了不相符的缓存答案，对应条目将被剔除。"""
+    if not rag_service or not rag_service.is_initialized:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="RAG service is not initialized or failed to start."
+        )
+    result = rag_service.report_semantic_false_hit(request.query)
+    if not result.get("success"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=result.get("error", "Failed to report false hit.")
+        )
+    return result
+
+
+class ClearCacheRequest(BaseModel):
+    namespaces: Optional[List[str]] = None  # queries / embeddings / expansions / answers，默认全部
+
+
+@app.post("/clear_cache", summary="按命名空间清除缓存", response_model=Dict[str, Any])
+async def clear_redis_cache(request: Optional[ClearCacheRequest] = None):
+    """清除RAG系统的缓存，可只清除指定命名空间；不带请求体时清除全部。"""
     if not rag_service or not rag_service.is_initialized:
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             detail="RAG service is not initialized or failed to start."
         )
-    result = rag_service.clear_cache()
+    result = rag_service.clear_cache(request.namespaces if request else None)
     if not result.get("success"):
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=result.get("error", "Failed to clear cache.")
         )
-    return {"message": "Redis cache cleared successfully.", "success": True}
+    return {
+        "message": "Cache cleared successfully.",
+        "success": True,
+        "namespaces": result["namespaces"],
+        "deleted": result["deleted"]
+    }
 
 
 # 运行 FastAPI 的主函数（用于调试或直接启动）
@@ -0,0 +1,114 @@
+# build_index.py
+import os
+import sys
+import time
+import argparse
+
+from llama_index.core.schema import MetadataMode
+
+from config.settings import Settings
+from models.embeddings import EnterpriseEmbedding
+from services.document_processor import DocumentProcessor
+from services.index_manifest import build_index_signature, build_cache_namespaces
+from services.retriever import build_bm25_index, build_field_index
+from services.index_snapshot import write_snapshot, default_snapshot_version
+from utils.cache import cache_manager
+from utils.logger import logger
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="离线构建RAG索引快照（节点、向量、BM25统计与清单）")
+    parser.add_argument("--data-dir", default=None, help="知识库目录，默认使用 AppConfig.data_dir")
+    parser.add_argument("--output-dir", default=None, help="快照输出目录，默认使用 AppConfig.snapshot_dir")
+    parser.add_argument("--version", default=None, help="快照版本号，默认使用当前时间戳")
+    parser.add_argument("--no-latest", action="store_true", help="不更新 LATEST 指针")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    os.makedirs("logs", exist_ok=True)
+
+    settings = Settings()
+    data_dir = args.data_dir or settings.app.data_dir
+    output_dir = args.output_dir or settings.app.snapshot_dir
+    version = args.version or default_snapshot_version()
+
+    start_time = time.time()
+    try:
+        # 1. 加载嵌入模型（文档编码只在离线构建时进行）
+        cache_manager.configure(settings.app)
+        cache_manager.set_namespace_versions(build_cache_namespaces(settings))
+        embed_model = EnterpriseEmbedding(
+            model_path=settings.model.embed_model_path,
+            device=settings.model.device,
+            max_length=settings.model.max_length,
+            batch_size=settings.model.batch_size,
+            batching=settings.model.embed_batching,
+            max_batch_tokens=settings.model.embed_max_batch_tokens,
+            backend=settings.model.embed_backend,
+            onnx_quantize=settings.model.onnx_quantize,
+            onnx_intra_op_threads=settings.model.onnx_intra_op_threads,
+            onnx_cache_dir=settings.model.onnx_cache_dir
+        )
+
+        # 2. 流式解析与分块（多进程），3. 编码与后续文件的解析重叠进行
+        doc_processor = DocumentProcessor(
+            chunk_size=settings.retrieval.chunk_size,
+            chunk_overlap=settings.retrieval.chunk_overlap,
+            json_stream_threshold=settings.app.json_stream_threshold_mb * 1024 * 1024
+        )
+        documents, nodes, embeddings = [], [], []
+        pending_nodes = []
+        flush_size = settings.model.batch_size * 8
+
+        def flush():
+            # 与 VectorStoreIndex 使用相同的嵌入文本
+            texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in pending_nodes]
+            embeddings.extend(embed_model.get_text_embedding_batch(texts))
+            nodes.extend(pending_nodes)
+            pending_nodes.clear()
+            logger.logger.info(f"Embedded {len(nodes)} nodes from {len(documents)} documents so far")
+
+        for processed in doc_processor.iter_processed_files(
+                data_dir,
+                workers=settings.app.ingest_workers,
+                max_pending=settings.app.ingest_max_pending,
+                parallel_min_bytes=settings.app.ingest_parallel_min_mb * 1024 * 1024
+        ):
+            # 快照中缺失的文件在加载时会被当作已删除，解析失败必须中止构建
+            if processed.error is not None:
+                raise RuntimeError(f"Failed to parse {processed.file_path}: {processed.error}")
+            documents.extend(processed.documents)
+            pending_nodes.extend(processed.nodes)
+            if len(pending_nodes) >= flush_size:
+                flush()
+        if pending_nodes:
+            flush()
+
+        # 4. BM25统计
+        bm25 = build_bm25_index(documents, settings.retrieval)
+        field_index = build_field_index(documents, settings.retrieval)
+
+        snapshot_path = write_snapshot(
+            output_dir=output_dir,
+            version=version,
+            nodes=nodes,
+            embeddings=embeddings,
+            documents=documents,
+            bm25=bm25,
+            field_index=field_index,
+            signature=build_index_signature(settings, embed_model.embed_dim),
+            update_latest=not args.no_latest
+        )
+    except Exception as e:
+        logger.log_error(e, {"stage": "build_index"})
+        print(f"❌ 索引快照构建失败: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    print(f"✅ 快照 {version} 已写入 {snapshot_path}，耗时 {time.time() - start_time:.2f} 秒")
+    print(f"   服务端设置 INDEX_SNAPSHOT_PATH={output_dir} 即可直接加载")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 # config/settings.py
-from dataclasses import dataclass
-from typing import Optional
+from dataclasses import dataclass, field
+from typing import Optional, Dict, List
 import os
 from pathlib import Path
 
@@ -21,9 +21,34 @@ class ModelConfig:
     device: str = "auto"
     max_length: int = 512
     batch_size: int = 32 # 用于Embedding和Rerank的默认批量大小
+    embed_batching: str = "fixed"  # fixed：按输入顺序定长分批 | length：按长度分桶、按token预算组批
+    embed_max_batch_tokens: int = 16384  # length模式下每批 padding 后的token总数上限
+    embed_backend: str = "torch"  # torch | onnx（ONNX Runtime CPU推理）
+    onnx_quantize: bool = True  # onnx后端是否使用int8动态量化模型
+    onnx_intra_op_threads: int = 0  # ONNX Runtime 算子内线程数，0 表示由运行时决定
+    onnx_cache_dir: str = ".cache/onnx"  # 导出的ONNX模型存放目录
+
+    # 跨请求微批：并发请求的查询编码与重排合并为一批执行
+    micro_batching: bool = True
+    micro_batch_max_wait_ms: float = 5.0  # 攒批最长等待时间
+    query_embed_max_batch: int = 32  # 每批最多合并的查询数
+    rerank_max_batch_pairs: int = 256  # 每批最多合并的（查询, 文档）对数
+
+    llm_prefix_cache: bool = False  # 预填充并复用答案提示模板静态前缀的KV缓存（hf后端，见 tests/test_llm_prefix_cache.py）
+
+    # LLM后端：hf：进程内加载HuggingFaceLLM | openai：外部OpenAI兼容补全服务（vLLM、llama.cpp server 等）
+    llm_backend: str = "hf"
+    llm_api_base: str = "http://localhost:8001/v1"
+    llm_api_key: Optional[str] = None
+    llm_api_model: Optional[str] = None  # 服务端的模型名，默认使用 llm_model_path
+    llm_max_new_tokens: int = 512
+    llm_temperature: float = 0.7
+    llm_timeout: float = 120.0  # 读取超时（流式时为两个分片之间的最长间隔）
+    llm_connect_timeout: float = 5.0
+    llm_max_connections: int = 16  # keep-alive 连接池大小
 
     # vLLM specific settings (removed)
-    use_vllm: bool = False # 是否使用vLLM作为LLM  # ✅ 确保有这个属性
+    use_vllm: bool = False # 是否使用vLLM作为LLM，为 True 时按 llm_backend="openai" 连接vLLM服务
     # vllm_tensor_parallel_size: int = 1
     # vllm_gpu_memory_utilization: float = 0.9
     # vllm_max_model_len: Optional[int] = None # 如果不设置，vLLM会尝试自动检测
@@ -40,6 +65,14 @@ class VectorStoreConfig:
     dim: int = 1024
     index_type: str = "HNSW"
     metric_type: str = "COSINE"
+    incremental: bool = True  # 基于索引清单增量构建，False时每次启动全量重建
+    backend: str = "milvus"  # milvus | local（进程内内存映射向量库，无需Milvus服务）
+    local_path: str = ".cache/vector_store"  # local后端的数据目录
+    local_dtype: str = "float32"  # local后端向量存储精度：float32 | float16
+    hnsw_m: int = 16
+    hnsw_ef_construction: int = 200
+    hnsw_ef_search: int = 64
+    local_compact_ratio: float = 0.3  # local后端失效行（删除/覆盖）占比超过该值时压缩数据文件，0 表示不压缩
 
 
 @dataclass
@@ -48,10 +81,45 @@ class RetrievalConfig:
     rerank_top_k: int = 8
     score_threshold: float = 0.4
     min_good_results: int = 2
-    max_context_chars: int = 1800
+    max_context_chars: int = 1800  # 拿不到LLM tokenizer时按字符计算的上下文预算
+    max_context_tokens: int = 1024  # 上下文的LLM token预算
+    context_sentence_scoring: str = "embedding"  # 超出预算时的选句依据：embedding | lexical | none
+    context_chunk_weight: float = 0.3  # 选句时所属检索结果分数（归一化后）的权重
+    context_max_embedded_sentences: int = 64  # embedding 选句最多嵌入的句数，超出时先按字面相关度预选
     chunk_size: int = 512
     chunk_overlap: int = 50
     batch_size: int = 32
+    sparse_tokenizer: str = "bigram"  # bigram | jieba | jieba+bigram
+    bm25_k1: float = 1.5
+    bm25_b: float = 0.75
+
+    # TCM结构化字段检索
+    enable_pattern_lookup: bool = False  # 整个查询恰为证型名时，按名称查到的记录作为额外候选参与融合与重排
+    use_field_sparse: bool = False  # 稀疏检索叠加按字段加权的BM25分数
+    field_weights: Dict[str, float] = field(default_factory=lambda: {
+        "pattern": 2.0,
+        "symptom": 1.5,
+        "comorbid_symptoms": 1.0,
+        "pathogenesis": 0.8,
+        "treatment_suggestion": 0.8
+    })
+    field_embedding_fields: List[str] = field(default_factory=list)  # 单独编码的字段，如 ["pattern", "symptom"]
+
+    # 查询扩展：优先使用离线术语词典，词典没有命中时才调用LLM改写
+    term_dictionary_path: Optional[str] = "config/tcm_terms.json"
+    llm_expansion_fallback: bool = True
+
+    # 候选融合与重排策略
+    fusion_mode: str = "union"  # union：合并去重后全部重排 | rrf：倒数排名融合 | weighted：归一化分数加权融合
+    rrf_k: int = 60
+    fusion_dense_weight: float = 0.6  # weighted模式下密集检索（含字段向量）的权重
+    fusion_sparse_weight: float = 0.4  # weighted模式下稀疏检索的权重
+    rerank_policy: str = "always"  # always | adaptive（密集与稀疏高度一致时跳过重排，仅融合模式下生效） | never；跳过时按密集检索相似度过滤与打分
+    rerank_agreement_top_n: int = 5  # 计算一致度时比较双方前N个文档
+    rerank_agreement_threshold: float = 0.6  # 前N重合比例达到该值视为一致
+    max_rerank_pairs: int = 0  # 每个请求送入重排模型的候选对上限，0 表示不限制
+    retrieval_workers: int = 4  # 并行执行密集/稀疏检索的线程数
+    rerank_workers: int = 2  # 异步查询路径中同时执行重排（未开启微批时）与查询扩展的请求数上限
 
 
 @dataclass
@@ -62,6 +130,33 @@ class AppConfig:
     max_query_length: int = 200
     rate_limit: int = 100  # requests per minute
     redis_url: str = "redis://localhost:6379/0" # Redis连接URL
+    embedding_cache_dtype: str = "float32"  # Redis中向量缓存的存储精度：float32 | float16（体积减半）
+    embedding_cache_ttl: int = 86400
+    l1_cache_max_items: int = 10000  # 进程内L1缓存条数上限，0 表示关闭L1
+    l1_cache_ttl: int = 300  # L1条目最长存活秒数（不超过对应Redis条目的TTL）
+    cache_invalidation_channel: Optional[str] = None  # 设置后通过Redis pub/sub 在工作进程间同步L1失效
+    docstore_max_nodes: int = 50000  # 进程内登记的分块节点上限，用于从 (node_id, score) 缓存还原检索结果
+    snapshot_dir: str = "snapshots"  # 离线构建快照的输出目录
+    snapshot_path: Optional[str] = None  # 设置后从快照加载索引，跳过文档解析与编码
+    ingest_workers: int = 0  # 文档解析/分块进程数，0 表示CPU核数，1 表示串行
+    ingest_parallel_min_mb: int = 32  # 新增/修改文件总大小达到该值才启动解析进程池，否则在当前进程串行处理
+    ingest_max_pending: int = 64  # 在途文件数上限，限制流式摄取的内存占用
+    json_stream_threshold_mb: int = 64  # 超过该大小的JSON文件逐条流式解析
+    generation_workers: int = 2  # 异步查询路径中同时执行LLM生成的请求数上限
+
+    # 语义答案缓存：相近且关键术语（证型、药名、否定词等）一致的问题直接复用已生成的答案
+    semantic_cache_enabled: bool = False
+    semantic_cache_threshold: float = 0.95  # 问题向量余弦相似度阈值
+    semantic_cache_max_entries: int = 5000
+    semantic_cache_ttl: int = 3600
+    semantic_cache_audit_size: int = 200  # 保留最近多少条命中记录供审计
+    semantic_cache_suspect_overlap: float = 0.3  # 命中但字面重合度低于该值时标记为可疑
+    single_flight_enabled: bool = True  # 合并进程内并发的相同查询
+    single_flight_distributed: bool = False  # 多个工作进程时开启：通过Redis锁跨进程合并（单进程部署无需额外的Redis往返）
+    single_flight_lock_ttl: int = 15  # 跨进程锁的过期秒数；leader 执行期间自动续期，进程崩溃后最多这么久由其他进程接手
+    single_flight_wait_timeout: float = 60.0  # 跟随者最长等待秒数，超时后自行执行
+    single_flight_result_ttl: int = 10  # leader 结果在Redis中保留的秒数，供其他进程的跟随者读取
+    single_flight_poll_ms: float = 50.0
 
     # FastAPI settings
     api_host: str = "127.0.0.1"  # ✅ 确保有这个属性
@@ -72,8 +167,13 @@ class Settings:
         self.model = ModelConfig(
             embed_model_path=os.getenv("EMBED_MODEL_PATH", "/path/to/embed/model"),
             llm_model_path=os.getenv("LLM_MODEL_PATH", "/path/to/llm/model"),
-            rerank_model_path=os.getenv("RERANK_MODEL_PATH", "/path/to/rerank/model")
+            rerank_model_path=os.getenv("RERANK_MODEL_PATH", "/path/to/rerank/model"),
+            llm_backend=os.getenv("LLM_BACKEND", "hf"),
+            llm_api_base=os.getenv("LLM_API_BASE", "http://localhost:8001/v1"),
+            llm_api_key=os.getenv("LLM_API_KEY"),
+            llm_api_model=os.getenv("LLM_API_MODEL"),
+            use_vllm=os.getenv("USE_VLLM", "false").lower() in ("1", "true", "yes")
         )
         self.vector_store = VectorStoreConfig()
         self.retrieval = RetrievalConfig()
-        self.app = AppConfig()
+        self.app = AppConfig(snapshot_path=os.getenv("INDEX_SNAPSHOT_PATH"))
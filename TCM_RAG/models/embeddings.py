@@ -2,11 +2,14 @@
 import torch
 import torch.nn.functional as F
 from typing import List, Any
-from transformers import AutoTokenizer, AutoModel
+from transformers import AutoTokenizer, AutoModel, AutoConfig
 from llama_index.core.embeddings import BaseEmbedding
+from models.onnx_backend import OnnxEncoder, prepare_onnx_model
+from utils.batching import MicroBatcher
 from utils.cache import cache_manager
 from utils.logger import logger
 import time
+import asyncio
 
 
 class EnterpriseEmbedding(BaseEmbedding):
@@ -20,6 +23,11 @@ class EnterpriseEmbedding(BaseEmbedding):
     max_length: int = 512
     batch_size: int = 32
     use_cache: bool = True
+    batching: str = "fixed"
+    max_batch_tokens: int = 16384
+    backend: str = "torch"
+    onnx_encoder: Any = None
+    query_batcher: Any = None
 
     def __init__(
         self,
@@ -28,11 +36,35 @@ class EnterpriseEmbedding(BaseEmbedding):
         max_length: int = 512,
         batch_size: int = 32,
         use_cache: bool = True,
+        batching: str = "fixed",
+        max_batch_tokens: int = 16384,
+        backend: str = "torch",
+        onnx_quantize: bool = True,
+        onnx_intra_op_threads: int = 0,
+        onnx_cache_dir: str = ".cache/onnx",
         **kwargs: Any
     ):
         """
         初始化本地Embedding模型
+
+        batching:
+            - fixed：按输入顺序每 batch_size 条一批
+            - length：按分词长度排序后在 max_batch_tokens 的token预算内组批，
+              同批文本长度相近，减少padding带来的无效计算，结果按原顺序返回
+
+        backend:
+            - torch：PyTorch AutoModel
+            - onnx：ONNX Runtime（CPU），首次使用时导出到 onnx_cache_dir，可选int8动态量化
         """
+        if batching not in ("fixed", "length"):
+            raise ValueError(f"Unknown embedding batching mode: {batching}")
+        if backend not in ("torch", "onnx"):
+            raise ValueError(f"Unknown embedding backend: {backend}")
+
+        # 父类按 embed_batch_size 切分后再调用 _get_text_embeddings，
+        # 长度分桶模式下放大该值，使排序能覆盖更多文本
+        kwargs.setdefault("embed_batch_size", 1024 if batching == "length" else batch_size)
+
         # ✅ 先调用父类构造，初始化Pydantic内部
         super().__init__(embed_dim=0, **kwargs)
 
@@ -40,23 +72,38 @@ class EnterpriseEmbedding(BaseEmbedding):
         object.__setattr__(self, "max_length", max_length)
         object.__setattr__(self, "batch_size", batch_size)
         object.__setattr__(self, "use_cache", use_cache)
+        object.__setattr__(self, "batching", batching)
+        object.__setattr__(self, "max_batch_tokens", max_batch_tokens)
+        object.__setattr__(self, "backend", backend)
 
-        # 设备选择
-        if device == "auto":
+        # 设备选择（ONNX后端固定在CPU上推理）
+        if backend == "onnx":
+            device_str = "cpu"
+        elif device == "auto":
             device_str = "cuda" if torch.cuda.is_available() else "cpu"
         else:
             device_str = device
 
         try:
             tokenizer = AutoTokenizer.from_pretrained(model_path, trust_remote_code=True)
+            object.__setattr__(self, "tokenizer", tokenizer)
+            object.__setattr__(self, "device", device_str)
+
+            if backend == "onnx":
+                onnx_path = prepare_onnx_model(model_path, tokenizer, onnx_cache_dir, quantize=onnx_quantize)
+                object.__setattr__(self, "onnx_encoder", OnnxEncoder(onnx_path, onnx_intra_op_threads))
+                object.__setattr__(self, "embed_dim", AutoConfig.from_pretrained(
+                    model_path, trust_remote_code=True
+                ).hidden_size)
+                logger.logger.info(f"Embedding model loaded with ONNX Runtime: {onnx_path}")
+                return
+
             model = AutoModel.from_pretrained(model_path, trust_remote_code=True).to(device_str)
             model.eval()
             embed_dim = model.config.hidden_size
 
             # ✅ 保存模型与设备信息
-            object.__setattr__(self, "tokenizer", tokenizer)
             object.__setattr__(self, "model", model)
-            object.__setattr__(self, "device", device_str)
             object.__setattr__(self, "embed_dim", embed_dim)
 
             logger.logger.info(f"Embedding model loaded on {device_str}")
@@ -76,8 +123,7 @@ class EnterpriseEmbedding(BaseEmbedding):
             uncached_sentences = []
             uncached_indices = []
 
-            for i, sentence in enumerate(sentences):
-                cached = cache_manager.get_embeddings(sentence)
+            for i, (sentence, cached) in enumerate(zip(sentences, cache_manager.get_embeddings_batch(sentences))):
                 if cached:
                     cached_results.append((i, cached))
                 else:
@@ -94,26 +140,11 @@ class EnterpriseEmbedding(BaseEmbedding):
         # 处理未缓存的句子
         start_time = time.time()
         try:
-            encoded_input = self.tokenizer(
-                uncached_sentences,
-                padding=True,
-                truncation=True,
-                return_tensors="pt",
-                max_length=self.max_length
-            )
-            encoded_input = {k: v.to(self.model.device) for k, v in encoded_input.items()}
-
-            with torch.no_grad():
-                model_output = self.model(**encoded_input)
-                sentence_embeddings = model_output[0][:, 0]  # 取 CLS token
-                sentence_embeddings = F.normalize(sentence_embeddings, p=2, dim=1)
-
-            embeddings = sentence_embeddings.cpu().tolist()
+            embeddings = self._encode(uncached_sentences)
 
             # 缓存结果
             if self.use_cache:
-                for sentence, embedding in zip(uncached_sentences, embeddings):
-                    cache_manager.cache_embeddings(sentence, embedding)
+                cache_manager.cache_embeddings_batch(uncached_sentences, embeddings)
 
             logger.logger.info(
                 f"Embedded {len(uncached_sentences)} sentences in {time.time() - start_time:.2f}s"
@@ -130,10 +161,73 @@ class EnterpriseEmbedding(BaseEmbedding):
         else:
             return embeddings
 
+    def _encode(self, sentences: List[str]) -> List[List[float]]:
+        """模型前向：取 CLS token 并做L2归一化"""
+        if self.onnx_encoder is not None:
+            encoded_input = self.tokenizer(
+                sentences,
+                padding=True,
+                truncation=True,
+                return_tensors="np",
+                max_length=self.max_length
+            )
+            return self.onnx_encoder.encode(dict(encoded_input)).tolist()
+
+        encoded_input = self.tokenizer(
+            sentences,
+            padding=True,
+            truncation=True,
+            return_tensors="pt",
+            max_length=self.max_length
+        )
+        encoded_input = {k: v.to(self.model.device) for k, v in encoded_input.items()}
+
+        with torch.no_grad():
+            model_output = self.model(**encoded_input)
+            sentence_embeddings = model_output[0][:, 0]  # 取 CLS token
+            sentence_embeddings = F.normalize(sentence_embeddings, p=2, dim=1)
+
+        return sentence_embeddings.cpu().tolist()
+
     def _get_text_embedding(self, text: str) -> List[float]:
         return self._embed_batch([text])[0]
 
+    def _length_bucketed_batches(self, texts: List[str]) -> List[List[int]]:
+        """按分词长度降序排列，在token预算内贪心组批，返回每批的原始下标
+
+        批次的padding后长度等于批内最长文本，降序排列时即批内第一条，
+        因此每批的实际计算量为 len(batch) * 首条长度，不超过 max_batch_tokens。
+        """
+        lengths = [
+            len(ids) for ids in self.tokenizer(
+                texts,
+                truncation=True,
+                max_length=self.max_length
+            )["input_ids"]
+        ]
+        order = sorted(range(len(texts)), key=lambda i: lengths[i], reverse=True)
+
+        batches = []
+        batch: List[int] = []
+        for idx in order:
+            padded_len = lengths[batch[0]] if batch else lengths[idx]
+            if batch and (len(batch) + 1) * padded_len > self.max_batch_tokens:
+                batches.append(batch)
+                batch = []
+            batch.append(idx)
+        if batch:
+            batches.append(batch)
+        return batches
+
     def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        if self.batching == "length" and len(texts) > 1:
+            all_embeddings: List[List[float]] = [None] * len(texts)
+            for batch in self._length_bucketed_batches(texts):
+                batch_embeddings = self._embed_batch([texts[i] for i in batch])
+                for idx, embedding in zip(batch, batch_embeddings):
+                    all_embeddings[idx] = embedding
+            return all_embeddings
+
         # 分批处理
         all_embeddings = []
         for i in range(0, len(texts), self.batch_size):
@@ -142,10 +236,29 @@ class EnterpriseEmbedding(BaseEmbedding):
             all_embeddings.extend(batch_embeddings)
         return all_embeddings
 
+    def enable_query_batching(self, max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        """开启跨请求微批：并发请求的单条查询编码合并为一次前向计算"""
+        # 合并后的查询一次前向计算（批大小不超过 max_batch_size，不再按 batch_size 拆分）
+        object.__setattr__(self, "query_batcher", MicroBatcher(
+            "query_embedding",
+            self._embed_batch,
+            max_batch_size=max_batch_size,
+            max_wait_ms=max_wait_ms
+        ))
+
+    def get_query_embeddings(self, queries: List[str]) -> List[List[float]]:
+        """多个查询一次前向计算（查询与文本使用相同的编码方式）"""
+        return self._get_text_embeddings(queries)
+
     def _get_query_embedding(self, query: str) -> List[float]:
+        if self.query_batcher is not None:
+            return self.query_batcher(query)
         return self._get_text_embedding(query)
 
     async def _aget_query_embedding(self, query: str) -> List[float]:
+        # 在事件循环中提交到微批调度器并等待，不占用线程池线程
+        if self.query_batcher is not None:
+            return await asyncio.wrap_future(self.query_batcher.submit(query))
         return self._get_query_embedding(query)
 
     async def _aget_text_embedding(self, text: str) -> List[float]:
@@ -0,0 +1,154 @@
+# models/hf_llm.py
+import copy
+import threading
+from typing import Any, Dict, Iterator, Optional
+
+import torch
+from transformers import StoppingCriteria, StoppingCriteriaList, TextIteratorStreamer
+from llama_index.core.llms import CompletionResponse
+from utils.logger import logger
+
+
+class StopOnEvent(StoppingCriteria):
+    """事件被设置后在下一个token处结束生成（客户端断开时取消流式生成）"""
+
+    def __init__(self, event: threading.Event):
+        self.event = event
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        return torch.full((input_ids.shape[0],), self.event.is_set(), dtype=torch.bool, device=input_ids.device)
+
+
+class HFGenerationLLM:
+    """直接调用 model.generate 的 HuggingFaceLLM 包装
+
+    stream_complete 可传入 stop_event：事件被设置后，生成线程通过 StoppingCriteria 在下一个
+    token 处停止，而不是跑满 max_new_tokens。其余调用与属性原样交给被包装的 HuggingFaceLLM。
+    """
+
+    def __init__(self, llm):
+        self.llm = llm
+        self.model = llm._model
+        self.tokenizer = llm._tokenizer
+
+    def __getattr__(self, name: str):
+        return getattr(self.llm, name)
+
+    def _encode(self, prompt: str):
+        inputs = self.tokenizer(prompt, return_tensors="pt")
+        for key in self.llm.tokenizer_outputs_to_remove:
+            inputs.pop(key, None)
+        return inputs.to(self.model.device)
+
+    def _prepare(self, prompt: str):
+        """返回 (编码后的prompt, 可复用的KV缓存或 None)"""
+        return self._encode(prompt), None
+
+    def _generate_kwargs(self, inputs, cache, stop_event: Optional[threading.Event] = None, **kwargs) -> Dict[str, Any]:
+        stopping_criteria = self.llm._stopping_criteria
+        if stop_event is not None:
+            stopping_criteria = StoppingCriteriaList(list(stopping_criteria or []) + [StopOnEvent(stop_event)])
+        generate_kwargs = {
+            **inputs,
+            "max_new_tokens": self.llm.max_new_tokens,
+            "stopping_criteria": stopping_criteria,
+            **self.llm.generate_kwargs,
+            **kwargs
+        }
+        if cache is not None:
+            generate_kwargs["past_key_values"] = cache
+        return generate_kwargs
+
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        inputs, cache = self._prepare(prompt)
+        with torch.no_grad():
+            tokens = self.model.generate(**self._generate_kwargs(inputs, cache, **kwargs))
+        completion_tokens = tokens[0][inputs["input_ids"].size(1):]
+        text = self.tokenizer.decode(completion_tokens, skip_special_tokens=True)
+        return CompletionResponse(text=text, raw={"model_output": tokens})
+
+    def stream_complete(
+            self,
+            prompt: str,
+            formatted: bool = False,
+            stop_event: Optional[threading.Event] = None,
+            **kwargs: Any
+    ) -> Iterator[CompletionResponse]:
+        inputs, cache = self._prepare(prompt)
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        generate_kwargs = self._generate_kwargs(inputs, cache, stop_event=stop_event, streamer=streamer, **kwargs)
+        errors = []
+
+        def run():
+            try:
+                with torch.no_grad():
+                    self.model.generate(**generate_kwargs)
+            except Exception as e:
+                errors.append(e)
+                # 生成失败时 streamer 收不到结束信号，补发以免迭代方一直等待
+                streamer.end()
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+
+        def gen() -> Iterator[CompletionResponse]:
+            text = ""
+            for delta in streamer:
+                text += delta
+                yield CompletionResponse(text=text, delta=delta)
+            if errors:
+                raise errors[0]
+
+        return gen()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"backend": "hf"}
+
+
+class PrefixCachedLLM(HFGenerationLLM):
+    """为固定提示前缀复用KV缓存的 HFGenerationLLM
+
+    register_prefix 对静态前缀做一次预填充并保存 past_key_values（按模板版本区分）；
+    prompt 以已登记前缀开头时，生成从缓存的副本继续，只需预填充前缀之后的部分
+    （检索资料与问题）。
+    """
+
+    def __init__(self, llm):
+        super().__init__(llm)
+        self._prefixes: Dict[str, Dict[str, Any]] = {}  # 模板版本 -> {text, ids, cache}
+        self._lock = threading.Lock()
+        self._stats = {"prefix_hits": 0, "prefix_misses": 0, "prefix_tokens_saved": 0}
+
+    def register_prefix(self, version: str, prefix: str):
+        """预填充静态前缀；同一版本已登记且文本未变时跳过"""
+        with self._lock:
+            entry = self._prefixes.get(version)
+            if entry is not None and entry["text"] == prefix:
+                return
+
+            ids = self.tokenizer(prefix, return_tensors="pt", add_special_tokens=True)["input_ids"]
+            with torch.no_grad():
+                output = self.model(input_ids=ids.to(self.model.device), use_cache=True)
+            self._prefixes[version] = {"text": prefix, "ids": ids[0].tolist(), "cache": output.past_key_values}
+        logger.logger.info(f"Prompt prefix cached: version={version}, tokens={ids.shape[1]}")
+
+    def _prepare(self, prompt: str):
+        """编码完整prompt，并在其token序列以已登记前缀开头时返回前缀KV缓存的副本"""
+        inputs = self._encode(prompt)
+        prompt_ids = inputs["input_ids"][0].tolist()
+        for entry in self._prefixes.values():
+            # 前缀与后续文本在边界处可能被合并成一个token，此时不能复用
+            num_prefix = len(entry["ids"])
+            if prompt.startswith(entry["text"]) and prompt_ids[:num_prefix] == entry["ids"] and len(prompt_ids) > num_prefix:
+                self._stats["prefix_hits"] += 1
+                self._stats["prefix_tokens_saved"] += num_prefix
+                # generate 会原地扩展缓存，每个请求使用独立副本
+                return inputs, copy.deepcopy(entry["cache"])
+        self._stats["prefix_misses"] += 1
+        return inputs, None
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = super().get_stats()
+        stats.update(self._stats)
+        stats["prefixes"] = {version: len(entry["ids"]) for version, entry in self._prefixes.items()}
+        return stats
@@ -0,0 +1,163 @@
+# models/llm.py
+import os
+import json
+import threading
+from typing import Any, Dict, Iterator, Optional
+
+import httpx
+from llama_index.core.llms import CompletionResponse
+from utils.logger import logger
+
+
+LLM_BACKENDS = ("hf", "openai")
+
+
+class OpenAICompatibleLLM:
+    """外部OpenAI兼容补全服务（vLLM、llama.cpp server 等）的客户端
+
+    使用 /completions 接口，接口与 HuggingFaceLLM 一致：complete 返回 CompletionResponse，
+    stream_complete 逐个产出带 delta 的 CompletionResponse。底层为带连接池的 keep-alive
+    httpx.Client（线程安全），生成线程池中的并发请求复用连接。提前结束流式迭代或设置
+    stop_event 会关闭响应，服务端随之中止生成。静态前缀的KV复用由服务端完成（如vLLM的 --enable-prefix-caching）。
+    """
+
+    def __init__(
+            self,
+            api_base: str,
+            model: str,
+            api_key: Optional[str] = None,
+            max_new_tokens: int = 512,
+            temperature: float = 0.7,
+            timeout: float = 120.0,
+            connect_timeout: float = 5.0,
+            max_connections: int = 16,
+            tokenizer_path: Optional[str] = None,
+            transport: Optional[httpx.BaseTransport] = None
+    ):
+        """transport 用于替换底层连接（如测试中的 httpx.MockTransport），默认使用连接池"""
+        self.model = model
+        self.max_new_tokens = max_new_tokens
+        self.temperature = temperature
+        headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        self.client = httpx.Client(
+            base_url=api_base.rstrip("/"),
+            headers=headers,
+            timeout=httpx.Timeout(timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            transport=transport
+        )
+        # 本地有模型的tokenizer时用于上下文token预算，否则按字符计算
+        self.tokenizer = None
+        if tokenizer_path and os.path.isdir(tokenizer_path):
+            from transformers import AutoTokenizer
+
+            self.tokenizer = AutoTokenizer.from_pretrained(tokenizer_path, trust_remote_code=True)
+
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "stream_requests": 0, "errors": 0}
+
+    def _payload(self, prompt: str, stream: bool, **kwargs: Any) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "prompt": prompt,
+            "max_tokens": kwargs.pop("max_tokens", self.max_new_tokens),
+            "temperature": kwargs.pop("temperature", self.temperature),
+            "stream": stream,
+            **kwargs
+        }
+
+    def _count(self, key: str):
+        with self._lock:
+            self._stats[key] += 1
+
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        self._count("requests")
+        try:
+            response = self.client.post("/completions", json=self._payload(prompt, False, **kwargs))
+            response.raise_for_status()
+            data = response.json()
+        except Exception:
+            self._count("errors")
+            raise
+        return CompletionResponse(text=data["choices"][0]["text"], raw=data)
+
+    def stream_complete(
+            self,
+            prompt: str,
+            formatted: bool = False,
+            stop_event: Optional[threading.Event] = None,
+            **kwargs: Any
+    ) -> Iterator[CompletionResponse]:
+        payload = self._payload(prompt, True, **kwargs)
+
+        def gen() -> Iterator[CompletionResponse]:
+            self._count("stream_requests")
+            text = ""
+            try:
+                with self.client.stream("POST", "/completions", json=payload) as response:
+                    response.raise_for_status()
+                    for line in response.iter_lines():
+                        # SSE：每个事件为 "data: {...}"，以 "data: [DONE]" 结束
+                        if not line.startswith("data:"):
+                            continue
+                        data = line[len("data:"):].strip()
+                        if data == "[DONE]" or (stop_event is not None and stop_event.is_set()):
+                            break
+                        choices = json.loads(data).get("choices") or [{}]
+                        delta = choices[0].get("text") or ""
+                        if delta:
+                            text += delta
+                            yield CompletionResponse(text=text, delta=delta)
+            except Exception:
+                self._count("errors")
+                raise
+
+        return gen()
+
+    def close(self):
+        self.client.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["backend"] = "openai"
+        stats["model"] = self.model
+        return stats
+
+
+def resolve_llm_backend(config) -> str:
+    """use_vllm 表示通过vLLM的OpenAI兼容服务生成"""
+    backend = "openai" if config.use_vllm else config.llm_backend
+    if backend not in LLM_BACKENDS:
+        raise ValueError(f"Unknown LLM backend: {backend}, expected one of {LLM_BACKENDS}")
+    return backend
+
+
+def create_llm(config):
+    """按 ModelConfig 创建LLM：进程内HuggingFaceLLM（可带前缀KV缓存）或外部补全服务客户端"""
+    if resolve_llm_backend(config) == "openai":
+        llm = OpenAICompatibleLLM(
+            api_base=config.llm_api_base,
+            model=config.llm_api_model or config.llm_model_path,
+            api_key=config.llm_api_key,
+            max_new_tokens=config.llm_max_new_tokens,
+            temperature=config.llm_temperature,
+            timeout=config.llm_timeout,
+            connect_timeout=config.llm_connect_timeout,
+            max_connections=config.llm_max_connections,
+            tokenizer_path=config.llm_model_path
+        )
+        logger.logger.info(f"Using OpenAI-compatible LLM server: {config.llm_api_base} ({llm.model})")
+        return llm
+
+    from llama_index.llms.huggingface import HuggingFaceLLM
+    from models.hf_llm import HFGenerationLLM, PrefixCachedLLM
+
+    llm = HuggingFaceLLM(
+        model_name=config.llm_model_path,
+        tokenizer_name=config.llm_model_path,
+        device_map="auto",
+        model_kwargs={"trust_remote_code": True, "torch_dtype": "auto"},
+        tokenizer_kwargs={"trust_remote_code": True}
+    )
+    return PrefixCachedLLM(llm) if config.llm_prefix_cache else HFGenerationLLM(llm)
@@ -0,0 +1,191 @@
+# models/onnx_backend.py
+import os
+import argparse
+from pathlib import Path
+from typing import List, Dict
+
+import numpy as np
+from utils.logger import logger
+
+try:
+    import onnxruntime as ort
+except ImportError:  # onnxruntime为可选依赖，仅 embed_backend="onnx" 时需要
+    ort = None
+
+
+ONNX_INPUT_NAMES = ["input_ids", "attention_mask", "token_type_ids"]
+
+# 导出后用于检查精度漂移的样例文本
+SAMPLE_TEXTS = [
+    "风湿困表证的主要症状有哪些？",
+    "肝郁气滞，胸胁胀痛，情志抑郁，善太息，舌苔薄白，脉弦。",
+    "脾胃虚弱型患者常见食少便溏、神疲乏力，治宜健脾益气。",
+    "外感风寒表实证，恶寒发热，无汗，头身疼痛，可用麻黄汤加减。",
+    "阴虚火旺，五心烦热，潮热盗汗，口燥咽干，舌红少苔，脉细数。",
+    "What are the common symptoms of qi deficiency?"
+]
+
+
+def _require_onnxruntime():
+    if ort is None:
+        raise ImportError("onnxruntime is required for embed_backend='onnx', install it with `pip install onnxruntime`")
+
+
+def onnx_model_paths(model_path: str, cache_dir: str) -> Dict[str, Path]:
+    """导出文件位置：{cache_dir}/{模型目录名}/model.onnx 与 model.int8.onnx"""
+    root = Path(cache_dir) / Path(model_path.rstrip("/\\")).name
+    return {"fp32": root / "model.onnx", "int8": root / "model.int8.onnx"}
+
+
+def export_onnx(model, tokenizer, output_path: Path, opset: int = 14):
+    """将HF编码器导出为ONNX，batch 与序列长度为动态维度，输出 last_hidden_state"""
+    import torch
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    sample = tokenizer(SAMPLE_TEXTS[:2], padding=True, return_tensors="pt")
+    input_names = [name for name in ONNX_INPUT_NAMES if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    model = model.to("cpu").eval()
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(sample[name] for name in input_names),
+            str(output_path),
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+            do_constant_folding=True
+        )
+    logger.logger.info(f"Embedding model exported to ONNX: {output_path}")
+
+
+def quantize_onnx(source_path: Path, output_path: Path):
+    """动态int8量化（仅量化权重，激活在推理时动态量化），适合CPU推理"""
+    _require_onnxruntime()
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    quantize_dynamic(str(source_path), str(output_path), weight_type=QuantType.QInt8)
+    logger.logger.info(f"ONNX model quantized to int8: {output_path}")
+
+
+class OnnxEncoder:
+    """ONNX Runtime 推理会话，输出与PyTorch路径一致：CLS向量 + L2归一化"""
+
+    def __init__(self, onnx_path: Path, intra_op_threads: int = 0):
+        _require_onnxruntime()
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads > 0:
+            options.intra_op_num_threads = intra_op_threads
+        self.session = ort.InferenceSession(str(onnx_path), options, providers=["CPUExecutionProvider"])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+        self.onnx_path = onnx_path
+
+    def encode(self, encoded_input: Dict[str, np.ndarray]) -> np.ndarray:
+        feeds = {name: encoded_input[name].astype(np.int64) for name in self.input_names}
+        last_hidden_state = self.session.run(None, feeds)[0]
+        embeddings = last_hidden_state[:, 0]  # 取 CLS token
+        return embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+
+
+def prepare_onnx_model(
+        model_path: str,
+        tokenizer,
+        cache_dir: str,
+        quantize: bool = True,
+        torch_model=None
+) -> Path:
+    """返回可用的ONNX模型路径，不存在时导出（并量化）；导出时顺带报告精度漂移"""
+    paths = onnx_model_paths(model_path, cache_dir)
+    target = paths["int8"] if quantize else paths["fp32"]
+    if target.exists():
+        return target
+
+    if torch_model is None:
+        from transformers import AutoModel
+        torch_model = AutoModel.from_pretrained(model_path, trust_remote_code=True)
+    if not paths["fp32"].exists():
+        export_onnx(torch_model, tokenizer, paths["fp32"])
+    if quantize:
+        quantize_onnx(paths["fp32"], paths["int8"])
+
+    drift = check_accuracy(torch_model, tokenizer, target, SAMPLE_TEXTS)
+    logger.logger.info(f"ONNX accuracy check ({target.name}): {drift}")
+    return target
+
+
+def _torch_embeddings(model, tokenizer, texts: List[str], max_length: int) -> np.ndarray:
+    import torch
+    import torch.nn.functional as F
+
+    model = model.to("cpu").eval()
+    encoded = tokenizer(texts, padding=True, truncation=True, return_tensors="pt", max_length=max_length)
+    with torch.no_grad():
+        output = model(**encoded)[0][:, 0]
+        return F.normalize(output, p=2, dim=1).numpy()
+
+
+def check_accuracy(
+        torch_model,
+        tokenizer,
+        onnx_path: Path,
+        texts: List[str],
+        max_length: int = 512,
+        intra_op_threads: int = 0
+) -> Dict[str, float]:
+    """对比PyTorch与ONNX输出的余弦相似度，返回漂移统计（1 - cos）"""
+    reference = _torch_embeddings(torch_model, tokenizer, texts, max_length)
+    encoded = tokenizer(texts, padding=True, truncation=True, return_tensors="np", max_length=max_length)
+    candidate = OnnxEncoder(onnx_path, intra_op_threads).encode(dict(encoded))
+
+    drift = 1.0 - np.sum(reference * candidate, axis=1)
+    return {
+        "num_texts": len(texts),
+        "mean_cosine_drift": float(drift.mean()),
+        "max_cosine_drift": float(drift.max()),
+        "min_cosine_similarity": float(1.0 - drift.max())
+    }
+
+
+def main():
+    """导出/量化嵌入模型并报告与PyTorch的精度漂移
+
+    python -m models.onnx_backend --model-path /path/to/bge-large-zh --quantize --texts-file samples.txt
+    """
+    from transformers import AutoTokenizer, AutoModel
+    from config.settings import Settings
+
+    settings = Settings()
+    parser = argparse.ArgumentParser(description="导出ONNX嵌入模型并检查精度漂移")
+    parser.add_argument("--model-path", default=settings.model.embed_model_path)
+    parser.add_argument("--cache-dir", default=settings.model.onnx_cache_dir)
+    parser.add_argument("--quantize", action="store_true", help="导出int8动态量化模型")
+    parser.add_argument("--texts-file", default=None, help="每行一条文本，默认使用内置样例")
+    parser.add_argument("--threads", type=int, default=settings.model.onnx_intra_op_threads)
+    args = parser.parse_args()
+
+    os.makedirs("logs", exist_ok=True)
+    texts = SAMPLE_TEXTS
+    if args.texts_file:
+        with open(args.texts_file, "r", encoding="utf-8") as f:
+            texts = [line.strip() for line in f if line.strip()]
+
+    tokenizer = AutoTokenizer.from_pretrained(args.model_path, trust_remote_code=True)
+    torch_model = AutoModel.from_pretrained(args.model_path, trust_remote_code=True)
+    onnx_path = prepare_onnx_model(args.model_path, tokenizer, args.cache_dir, args.quantize, torch_model)
+
+    report = check_accuracy(
+        torch_model, tokenizer, onnx_path, texts,
+        max_length=settings.model.max_length,
+        intra_op_threads=args.threads
+    )
+    print(f"ONNX model: {onnx_path}")
+    for key, value in report.items():
+        print(f"  {key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
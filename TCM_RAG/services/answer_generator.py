@@ -1,19 +1,17 @@
 # services/answer_generator.py
 import time
-from typing import List, Dict, Any, Tuple
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Tuple, AsyncIterator
 from llama_index.core.schema import NodeWithScore
 from llama_index.core.prompts import PromptTemplate
+from services.context_packer import ContextPacker
 from utils.logger import logger
 from config.settings import RetrievalConfig
 
 
-class AnswerGenerator:
-    def __init__(self, llm, config: RetrievalConfig):
-        self.llm = llm
-        self.config = config
-
-        self.prompt_template = PromptTemplate(
-            """你是一个专业的知识助手，请基于以下检索到的资料回答用户问题。
+PROMPT_TEMPLATE = """你是一个专业的知识助手，请基于以下检索到的资料回答用户问题。
 
 === 检索到的资料 ===
 {context_str}
@@ -29,45 +27,124 @@ class AnswerGenerator:
 5. 如果涉及多个方面，请分点说明
 
 请提供你的答案："""
+
+# 前缀KV缓存（PrefixCachedLLM）使用的模板：静态前缀（角色与回答要求）放在最前面，预先计算
+# KV缓存供所有请求复用；其他LLM仍使用上面的原模板。修改前缀内容时同步更新版本号
+PROMPT_TEMPLATE_VERSION = "v2"
+PROMPT_PREFIX = """你是一个专业的知识助手，请基于检索到的资料回答用户问题。
+
+=== 回答要求 ===
+1. 答案必须基于提供的资料，不得编造信息
+2. 如果资料不足以回答问题，请明确说明
+3. 答案要准确、完整、条理清晰
+4. 使用专业但易懂的语言
+5. 如果涉及多个方面，请分点说明
+
+"""
+PREFIX_CACHED_PROMPT_TEMPLATE = PROMPT_PREFIX + """=== 检索到的资料 ===
+{context_str}
+
+=== 用户问题 ===
+{query_str}
+
+请提供你的答案："""
+
+
+def _llm_tokenizer(llm):
+    """HuggingFaceLLM 的tokenizer，其他LLM没有时返回 None（上下文预算退化为按字符计算）"""
+    return getattr(llm, "_tokenizer", None) or getattr(llm, "tokenizer", None)
+
+
+class AnswerGenerator:
+    def __init__(self, llm, config: RetrievalConfig, max_workers: int = 2, embed_model=None):
+        self.llm = llm
+        self.config = config
+        # 异步路径中限制同时进行的生成数量
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="generation")
+
+        tokenizer = _llm_tokenizer(llm)
+        if tokenizer is None:
+            logger.logger.warning("LLM tokenizer unavailable, context budget falls back to max_context_chars")
+        self.packer = ContextPacker(
+            tokenizer=tokenizer,
+            max_tokens=config.max_context_tokens,
+            max_chars=config.max_context_chars,
+            sentence_scoring=config.context_sentence_scoring,
+            chunk_weight=config.context_chunk_weight,
+            embed_model=embed_model,
+            max_embedded_sentences=config.context_max_embedded_sentences
         )
 
-    def _compress_context_with_sources(
+        self.prompt_template = PromptTemplate(PROMPT_TEMPLATE)
+        if hasattr(llm, "register_prefix"):
+            try:
+                llm.register_prefix(PROMPT_TEMPLATE_VERSION, PROMPT_PREFIX)
+                self.prompt_template = PromptTemplate(PREFIX_CACHED_PROMPT_TEMPLATE)
+            except Exception as e:
+                logger.log_error(e, {"operation": "register_prompt_prefix", "version": PROMPT_TEMPLATE_VERSION})
+
+    def _pack_context(
             self,
             query: str,
             results: List[NodeWithScore]
     ) -> Tuple[str, List[Dict[str, Any]]]:
-        """压缩上下文并提取来源信息"""
-        compressed_context = ""
-        sources = []
-        current_length = 0
-
-        for i, result in enumerate(results):
-            text = result.node.text
-            metadata = result.node.metadata
-
-            # 检查是否超过长度限制
-            if current_length + len(text) > self.config.max_context_chars:
-                # 尝试截断
-                remaining_chars = self.config.max_context_chars - current_length
-                if remaining_chars > 100:  # 至少保留100字符
-                    text = text[:remaining_chars] + "..."
-                else:
-                    break
+        """按token预算组装去重后的上下文并提取来源信息"""
+        context, sources, stats = self.packer.pack(query, results)
+        logger.logger.debug(f"Context packed: {stats}")
+        return context, sources
 
-            compressed_context += f"\n[资料{i + 1}] {text}\n"
-            current_length += len(text)
+    async def _apack_context(
+            self,
+            query: str,
+            results: List[NodeWithScore]
+    ) -> Tuple[str, List[Dict[str, Any]]]:
+        """组装上下文需要分词和句子编码，在生成线程池中执行，不占用事件循环"""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._pack_context, query, results)
+
+    def _empty_answer(self, start_time: float) -> Dict[str, Any]:
+        return {
+            "answer": "抱歉，我无法从检索到的资料中找到相关信息来回答您的问题。",
+            "sources": [],
+            "generation_time": time.time() - start_time,
+            "context_used": "",
+            "confidence": 0.0
+        }
+
+    def _error_answer(self, query: str, e: Exception, start_time: float) -> Dict[str, Any]:
+        # 捕获异常返回默认信息
+        logger.log_error(e, {"query": query})
 
-            # 提取来源信息
-            source_info = {
-                "index": i + 1,
-                "score": result.score,
-                "file_name": metadata.get("file_name", "未知来源"),
-                "preview": text.replace("\n", " ")[:80] + "..." if len(text) > 80 else text,
-                "metadata": metadata
-            }
-            sources.append(source_info)
+        return {
+            "answer": "抱歉，生成答案时发生错误，请稍后再试。",
+            "sources": [],
+            "generation_time": time.time() - start_time,
+            "context_used": "",
+            "confidence": 0.0,
+            "error": str(e)
+        }
+
+    def _build_answer(
+            self,
+            response_text: str,
+            retrieval_results: List[NodeWithScore],
+            context: str,
+            sources: List[Dict[str, Any]],
+            include_sources: bool,
+            start_time: float
+    ) -> Dict[str, Any]:
+        answer = response_text.strip()
 
-        return compressed_context.strip(), sources
+        # 4. 计算置信度
+        avg_score = sum(r.score for r in retrieval_results) / len(retrieval_results) if retrieval_results else 0
+        confidence = min(avg_score, 1.0)
+
+        return {
+            "answer": answer,
+            "sources": sources if include_sources else [],
+            "generation_time": time.time() - start_time,
+            "context_used": context,
+            "confidence": confidence
+        }
 
     def generate_answer(
             self,
@@ -79,16 +156,10 @@ class AnswerGenerator:
 
         try:
             # 1. 压缩上下文
-            context, sources = self._compress_context_with_sources(query, retrieval_results)
+            context, sources = self._pack_context(query, retrieval_results)
 
             if not context:
-                return {
-                    "answer": "抱歉，我无法从检索到的资料中找到相关信息来回答您的问题。",
-                    "sources": [],
-                    "generation_time": time.time() - start_time,
-                    "context_used": "",
-                    "confidence": 0.0
-                }
+                return self._empty_answer(start_time)
 
             # 2. 生成 Prompt
             prompt = self.prompt_template.format(
@@ -98,30 +169,106 @@ class AnswerGenerator:
 
             # 3. 调用 LLM 生成答案
             response = self.llm.complete(prompt)
-            answer = response.text.strip()
+            return self._build_answer(response.text, retrieval_results, context, sources, include_sources, start_time)
+
+        except Exception as e:
+            return self._error_answer(query, e, start_time)
+
+    async def agenerate_answer(
+            self,
+            query: str,
+            retrieval_results: List[NodeWithScore],
+            include_sources: bool = True
+    ) -> Dict[str, Any]:
+        """异步生成：本地HF模型的生成是阻塞计算，在有界线程池中执行"""
+        start_time = time.time()
+
+        try:
+            context, sources = await self._apack_context(query, retrieval_results)
+
+            if not context:
+                return self._empty_answer(start_time)
+
+            prompt = self.prompt_template.format(
+                context_str=context,
+                query_str=query
+            )
 
-            # 4. 计算置信度
-            avg_score = sum(r.score for r in retrieval_results) / len(retrieval_results) if retrieval_results else 0
-            confidence = min(avg_score, 1.0)
+            response = await asyncio.get_running_loop().run_in_executor(self._executor, self.llm.complete, prompt)
+            return self._build_answer(response.text, retrieval_results, context, sources, include_sources, start_time)
 
-            return {
-                "answer": answer,
-                "sources": sources if include_sources else [],
-                "generation_time": time.time() - start_time,
-                "context_used": context,
-                "confidence": confidence
-            }
+        except Exception as e:
+            return self._error_answer(query, e, start_time)
+
+    async def _astream_completion(self, prompt: str) -> AsyncIterator[str]:
+        """在生成线程池中迭代 llm.stream_complete，把增量文本转交给事件循环
+
+        调用方提前结束迭代（如客户端断开）时设置 stop 事件：本地模型通过 StoppingCriteria
+        在下一个token处结束 generate，外部服务的流式响应随之关闭。
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        stop = threading.Event()
+        done = object()
+
+        def produce():
+            try:
+                for chunk in self.llm.stream_complete(prompt, stop_event=stop):
+                    if stop.is_set():
+                        break
+                    if chunk.delta:
+                        loop.call_soon_threadsafe(queue.put_nowait, chunk.delta)
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, done)
+
+        producer = loop.run_in_executor(self._executor, produce)
+        try:
+            while True:
+                item = await queue.get()
+                if item is done:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            await producer
+
+    async def astream_answer(
+            self,
+            query: str,
+            retrieval_results: List[NodeWithScore]
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """流式生成，依次产出：
+        ("sources", 来源列表) -> ("token", 增量文本)... -> ("answer", 与 generate_answer 相同结构的结果)
+        """
+        start_time = time.time()
+
+        try:
+            context, sources = await self._apack_context(query, retrieval_results)
+        except Exception as e:
+            yield "sources", []
+            yield "answer", self._error_answer(query, e, start_time)
+            return
+        yield "sources", sources
+
+        if not context:
+            yield "answer", self._empty_answer(start_time)
+            return
+
+        prompt = self.prompt_template.format(
+            context_str=context,
+            query_str=query
+        )
+
+        try:
+            pieces = []
+            async for delta in self._astream_completion(prompt):
+                pieces.append(delta)
+                yield "token", delta
+            yield "answer", self._build_answer("".join(pieces), retrieval_results, context, sources, True, start_time)
 
         except Exception as e:
-            # 捕获异常返回默认信息
-            from utils.logger import logger
-            logger.log_error(e, {"query": query})
-
-            return {
-                "answer": "抱歉，生成答案时发生错误，请稍后再试。",
-                "sources": [],
-                "generation_time": time.time() - start_time,
-                "context_used": "",
-                "confidence": 0.0,
-                "error": str(e)
-            }
+            yield "answer", self._error_answer(query, e, start_time)
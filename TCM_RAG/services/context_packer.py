@@ -0,0 +1,205 @@
+# services/context_packer.py
+import re
+from dataclasses import dataclass
+from typing import List, Dict, Any, Tuple, Set
+
+import numpy as np
+from llama_index.core.schema import NodeWithScore
+from utils.logger import logger
+
+
+SENTENCE_SCORINGS = ("embedding", "lexical", "none")
+_SENTENCE_END = re.compile(r"(?<=[。！？；!?;\n])")
+_NORMALIZE = re.compile(r"[\s，。！？；：、,.!?;:“”\"'（）()\[\]【】…-]+")
+
+
+def split_sentences(text: str) -> List[str]:
+    return [s.strip() for s in _SENTENCE_END.split(text) if s.strip()]
+
+
+def _normalize(sentence: str) -> str:
+    return _NORMALIZE.sub("", sentence)
+
+
+def _bigrams(text: str) -> set:
+    return {text[i:i + 2] for i in range(len(text) - 1)} or {text}
+
+
+@dataclass
+class _Candidate:
+    chunk: int  # 所属检索结果的序号
+    position: int  # 在该结果中的句子序号
+    text: str
+    tokens: int = 0
+    relevance: float = 0.0
+
+
+class ContextPacker:
+    """按LLM token预算组装上下文
+
+    1. 各检索结果按句切分，去掉与排名更靠前的结果完全相同的句子，以及同一文档相邻切块
+       边缘因 chunk_overlap 截断的半句（开头是已保留句子的结尾，或结尾是已保留句子的开头）
+    2. 总长度在预算内时保留全部句子；否则按“句子与问题的相关度 + 所属结果的检索分数”贪心选句，
+       直到用完预算，不在句子中间截断。候选超过 max_embedded_sentences 句时先按字面相关度预选，
+       只对前 max_embedded_sentences 句计算向量，避免CPU上逐句嵌入拖慢每个请求
+    3. 选中的句子按原文顺序输出，不相邻处以“……”连接；没有句子入选的结果不出现在来源中
+    没有tokenizer时按字符数计算，预算为 max_chars。
+    """
+
+    def __init__(
+            self,
+            tokenizer=None,
+            max_tokens: int = 1024,
+            max_chars: int = 1800,
+            sentence_scoring: str = "embedding",
+            chunk_weight: float = 0.3,
+            embed_model=None,
+            max_embedded_sentences: int = 64
+    ):
+        if sentence_scoring not in SENTENCE_SCORINGS:
+            raise ValueError(f"Unknown sentence scoring: {sentence_scoring}, expected one of {SENTENCE_SCORINGS}")
+        self.tokenizer = tokenizer
+        self.budget = max_tokens if tokenizer is not None else max_chars
+        self.sentence_scoring = sentence_scoring if (sentence_scoring != "embedding" or embed_model) else "lexical"
+        self.chunk_weight = chunk_weight
+        self.embed_model = embed_model
+        self.max_embedded_sentences = max_embedded_sentences
+
+    def count_tokens(self, texts: List[str]) -> List[int]:
+        if not texts:
+            return []
+        if self.tokenizer is None:
+            return [len(text) for text in texts]
+        encoded = self.tokenizer(texts, add_special_tokens=False)["input_ids"]
+        return [len(ids) for ids in encoded]
+
+    @staticmethod
+    def _neighbours(node, other) -> bool:
+        """同一文档的两个切块字符区间相交（chunk_overlap 造成的重叠）；缺少位置信息时按同一文档处理"""
+        if node.ref_doc_id is None or node.ref_doc_id != other.ref_doc_id:
+            return False
+        spans = (node.start_char_idx, node.end_char_idx, other.start_char_idx, other.end_char_idx)
+        if any(idx is None for idx in spans):
+            return True
+        return node.start_char_idx < other.end_char_idx and other.start_char_idx < node.end_char_idx
+
+    def _candidates(self, results: List[NodeWithScore]) -> List[_Candidate]:
+        """切句并去除跨结果的重复句与相邻切块边缘的重叠半句（保留排名更靠前的一份）"""
+        seen: Set[str] = set()
+        kept: List[Tuple[Any, List[str]]] = []  # (节点, 已保留句子的规范化文本)
+        candidates = []
+        for chunk, result in enumerate(results):
+            sentences = split_sentences(result.node.text)
+            neighbour_keys = [key for node, keys in kept if self._neighbours(result.node, node) for key in keys]
+            chunk_keys = []
+            for position, sentence in enumerate(sentences):
+                key = _normalize(sentence)
+                if not key or key in seen:
+                    continue
+                if position == 0 and any(other.endswith(key) for other in neighbour_keys):
+                    continue
+                if position == len(sentences) - 1 and any(other.startswith(key) for other in neighbour_keys):
+                    continue
+                seen.add(key)
+                chunk_keys.append(key)
+                candidates.append(_Candidate(chunk, position, sentence))
+            kept.append((result.node, chunk_keys))
+        return candidates
+
+    @staticmethod
+    def _lexical_scores(query: str, candidates: List[_Candidate]):
+        """问题字二元组在句子中出现的比例"""
+        query_grams = _bigrams(_normalize(query))
+        for candidate in candidates:
+            candidate.relevance = len(query_grams & _bigrams(_normalize(candidate.text))) / len(query_grams)
+
+    def _score_sentences(self, query: str, candidates: List[_Candidate]):
+        if self.sentence_scoring == "embedding":
+            try:
+                scored = candidates
+                if len(candidates) > self.max_embedded_sentences:
+                    self._lexical_scores(query, candidates)
+                    scored = sorted(candidates, key=lambda c: c.relevance, reverse=True)[:self.max_embedded_sentences]
+                    for candidate in candidates:
+                        candidate.relevance -= 2.0  # 余弦相似度不低于 -1，未嵌入的句子排在所有嵌入句之后
+                query_vector = np.asarray(self.embed_model.get_query_embedding(query), dtype=np.float32)
+                matrix = np.asarray(
+                    self.embed_model.get_text_embedding_batch([c.text for c in scored]), dtype=np.float32
+                )
+                matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+                query_vector /= max(float(np.linalg.norm(query_vector)), 1e-12)
+                for candidate, score in zip(scored, matrix @ query_vector):
+                    candidate.relevance = float(score)
+                return
+            except Exception as e:
+                logger.log_error(e, {"operation": "context_sentence_scoring", "query": query})
+
+        if self.sentence_scoring != "none":
+            self._lexical_scores(query, candidates)
+
+    def _chunk_weights(self, results: List[NodeWithScore]) -> List[float]:
+        scores = np.asarray([r.score or 0.0 for r in results], dtype=np.float64)
+        span = scores.max() - scores.min() if len(scores) else 0.0
+        if span <= 0:
+            return [1.0] * len(results)
+        return list((scores - scores.min()) / span)
+
+    def pack(
+            self,
+            query: str,
+            results: List[NodeWithScore]
+    ) -> Tuple[str, List[Dict[str, Any]], Dict[str, int]]:
+        """返回 (上下文, 来源列表, 统计)"""
+        candidates = self._candidates(results)
+        for candidate, tokens in zip(candidates, self.count_tokens([c.text for c in candidates])):
+            candidate.tokens = tokens
+        header_tokens = self.count_tokens([f"[资料{len(results)}] "])[0] if results else 0
+
+        total = sum(c.tokens for c in candidates) + header_tokens * len({c.chunk for c in candidates})
+        if total <= self.budget:
+            selected = candidates
+        else:
+            self._score_sentences(query, candidates)
+            weights = self._chunk_weights(results)
+            ranked = sorted(
+                candidates,
+                key=lambda c: c.relevance + self.chunk_weight * weights[c.chunk],
+                reverse=True
+            )
+            selected, used, chunks = [], 0, set()
+            for candidate in ranked:
+                cost = candidate.tokens + (0 if candidate.chunk in chunks else header_tokens)
+                if used + cost > self.budget:
+                    continue
+                selected.append(candidate)
+                used += cost
+                chunks.add(candidate.chunk)
+
+        by_chunk: Dict[int, List[_Candidate]] = {}
+        for candidate in sorted(selected, key=lambda c: (c.chunk, c.position)):
+            by_chunk.setdefault(candidate.chunk, []).append(candidate)
+
+        parts, sources = [], []
+        for chunk, chosen in by_chunk.items():
+            text = chosen[0].text
+            for previous, current in zip(chosen, chosen[1:]):
+                text += ("" if current.position == previous.position + 1 else "……") + current.text
+
+            result = results[chunk]
+            index = len(sources) + 1
+            parts.append(f"[资料{index}] {text}")
+            sources.append({
+                "index": index,
+                "score": result.score,
+                "file_name": result.node.metadata.get("file_name", "未知来源"),
+                "preview": text.replace("\n", " ")[:80] + "..." if len(text) > 80 else text,
+                "metadata": result.node.metadata
+            })
+
+        stats = {
+            "candidate_sentences": len(candidates),
+            "selected_sentences": len(selected),
+            "context_tokens": sum(c.tokens for c in selected) + header_tokens * len(by_chunk),
+            "deduplicated_tokens": total
+        }
+        return "\n\n".join(parts), sources, stats
@@ -0,0 +1,63 @@
+# services/docstore.py
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Optional
+
+from llama_index.core.schema import BaseNode
+from utils.logger import logger
+
+
+class NodeDocstore:
+    """进程内节点存储，供查询结果缓存按 node_id 还原节点
+
+    - 原始文档（稀疏检索、证型查找、字段检索的结果）常驻
+    - 向量检索返回的分块节点在写缓存时登记，按LRU淘汰
+    - 本进程找不到的节点（其他工作进程写入的缓存、重启后）向向量库按ID批量取回
+    """
+
+    def __init__(self, documents: List[BaseNode], vector_store=None, max_nodes: int = 50000):
+        self._documents: Dict[str, BaseNode] = {doc.node_id: doc for doc in documents}
+        self._nodes: "OrderedDict[str, BaseNode]" = OrderedDict()
+        self.vector_store = vector_store
+        self.max_nodes = max_nodes
+        self._lock = threading.Lock()
+
+    def add(self, nodes: List[BaseNode]):
+        with self._lock:
+            for node in nodes:
+                if node.node_id in self._documents:
+                    continue
+                self._nodes[node.node_id] = node
+                self._nodes.move_to_end(node.node_id)
+            while len(self._nodes) > self.max_nodes:
+                self._nodes.popitem(last=False)
+
+    def _get_local(self, node_id: str) -> Optional[BaseNode]:
+        node = self._documents.get(node_id)
+        if node is None:
+            node = self._nodes.get(node_id)
+            if node is not None:
+                self._nodes.move_to_end(node_id)
+        return node
+
+    def get_many(self, node_ids: List[str]) -> Optional[List[BaseNode]]:
+        """按顺序返回节点；任一节点无法还原（例如已从语料中删除）时返回 None"""
+        with self._lock:
+            found = {node_id: self._get_local(node_id) for node_id in node_ids}
+        missing = [node_id for node_id, node in found.items() if node is None]
+
+        if missing and self.vector_store is not None:
+            try:
+                fetched = self.vector_store.get_nodes(node_ids=missing)
+            except Exception as e:
+                logger.log_error(e, {"operation": "docstore_fetch", "num_nodes": len(missing)})
+                return None
+            self.add(fetched)
+            found.update({node.node_id: node for node in fetched})
+
+        if any(found.get(node_id) is None for node_id in node_ids):
+            return None
+        return [found[node_id] for node_id in node_ids]
+
+    def __len__(self) -> int:
+        return len(self._documents) + len(self._nodes)
@@ -2,25 +2,104 @@
 import os
 import json
 import re
-from typing import List, Dict, Any, Optional
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import List, Dict, Any, Optional, Iterator, Tuple
 from pathlib import Path
 from llama_index.core import Document
 from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.schema import BaseNode
 from utils.logger import logger
+from utils.json_stream import iter_json_records, JSON_LINES_SUFFIXES
 import hashlib
 from datetime import datetime
 
 
+# 文件级簿记字段：每次修改文件都会变化，不参与向量化和LLM上下文，
+# 否则文件的任意改动都会让该文件的所有节点内容哈希失效
+BOOKKEEPING_METADATA_KEYS = ["file_path", "file_size", "created_time", "modified_time", "file_hash", "byte_offset"]
+
+# 结构化记录的逐字段文本，只保留在文档上（供字段索引使用），分块后的节点不再携带
+FIELDS_METADATA_KEY = "fields"
+EXCLUDED_METADATA_KEYS = BOOKKEEPING_METADATA_KEYS + [FIELDS_METADATA_KEY]
+
+JSON_STREAM_THRESHOLD = 64 * 1024 * 1024  # 超过该大小的JSON文件流式解析
+STREAM_CHUNK_BATCH = 1000  # 流式解析时每批分块的文档数
+PARALLEL_MIN_BYTES = 32 * 1024 * 1024  # 待分块文件总大小达到该值才启动解析进程池
+
+
+def make_doc_id(file_path: str, item_index: Optional[int] = None) -> str:
+    """根据文件路径和记录序号生成稳定的文档ID"""
+    key = file_path if item_index is None else f"{file_path}#{item_index}"
+    return hashlib.md5(key.encode("utf-8")).hexdigest()
+
+
+def make_node_id(chunk_index: int, document: Document) -> str:
+    """根据所属文档和分块序号生成稳定的节点ID（用于增量索引）"""
+    return hashlib.md5(f"{document.doc_id}:{chunk_index}".encode("utf-8")).hexdigest()
+
+
+@dataclass
+class ProcessedFile:
+    """单个文件的处理结果
+
+    流式解析的大文件按批产出多个部分，只有最后一部分 final=True；调用方在最后一部分
+    之后才能把该文件记为已索引。
+    """
+    file_path: str
+    file_hash: str
+    documents: List[Document]
+    nodes: Optional[List[BaseNode]] = None  # None 表示文件哈希未变化，跳过了分块
+    embeddings: Optional[Any] = None  # 快照模式：与 nodes 逐行对应的向量矩阵
+    error: Optional[str] = None  # 解析失败：调用方应保留该文件已有的索引，不记录新哈希
+    final: bool = True
+
+
+class StreamParseError(Exception):
+    """流式解析失败，带最后一条完整记录之后的续读位置"""
+
+    def __init__(self, message: str, resume_offset: int, resume_index: int):
+        super().__init__(message)
+        self.resume_offset = resume_offset
+        self.resume_index = resume_index
+
+
+# 进程池工作进程内的处理器实例（由 _init_worker 创建）
+_worker_processor: Optional["DocumentProcessor"] = None
+
+
+def _init_worker(chunk_size: int, chunk_overlap: int, json_stream_threshold: int):
+    global _worker_processor
+    _worker_processor = DocumentProcessor(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        json_stream_threshold=json_stream_threshold
+    )
+
+
+def _process_file_in_worker(filepath: str, known_hash: Optional[str]) -> ProcessedFile:
+    return _worker_processor.process_file(Path(filepath), known_hash)
+
+
 class DocumentProcessor:
-    def __init__(self, chunk_size: int = 512, chunk_overlap: int = 50):
+    def __init__(
+            self,
+            chunk_size: int = 512,
+            chunk_overlap: int = 50,
+            json_stream_threshold: int = JSON_STREAM_THRESHOLD
+    ):
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        self.json_stream_threshold = json_stream_threshold
         self.splitter = SentenceSplitter(
             chunk_size=chunk_size,
             chunk_overlap=chunk_overlap,
-            chunking_tokenizer_fn=self._sentence_tokenizer
+            chunking_tokenizer_fn=self._sentence_tokenizer,
+            id_func=make_node_id
         )
-        self.supported_formats = {'.txt', '.json', '.md', '.pdf'}
+        self.supported_formats = {'.txt', '.json', '.jsonl', '.ndjson', '.md', '.pdf'}
 
     def _sentence_tokenizer(self, text: str) -> List[str]:
         """改进的句子分词器"""
@@ -41,8 +120,8 @@ class DocumentProcessor:
                 seen.add(line)
         return "\n".join(cleaned)
 
-    def _extract_metadata(self, filepath: Path) -> Dict[str, Any]:
-        """提取文件元数据"""
+    def _extract_metadata(self, filepath: Path, file_hash: Optional[str] = None) -> Dict[str, Any]:
+        """提取文件元数据（已读取文件内容时传入哈希，避免重复读取）"""
         stat = filepath.stat()
         return {
             "file_name": filepath.name,
@@ -50,7 +129,7 @@ class DocumentProcessor:
             "file_size": stat.st_size,
             "created_time": datetime.fromtimestamp(stat.st_ctime).isoformat(),
             "modified_time": datetime.fromtimestamp(stat.st_mtime).isoformat(),
-            "file_hash": self._calculate_file_hash(filepath)
+            "file_hash": file_hash or self._calculate_file_hash(filepath)
         }
 
     def _calculate_file_hash(self, filepath: Path) -> str:
@@ -61,48 +140,127 @@ class DocumentProcessor:
                 hash_md5.update(chunk)
         return hash_md5.hexdigest()
 
-    def process_txt_file(self, filepath: Path) -> List[Document]:
-        """处理TXT文件"""
+    def _read_file(self, filepath: Path) -> Tuple[bytes, str]:
+        """一次读取文件内容并计算哈希"""
+        with open(filepath, "rb") as f:
+            raw = f.read()
+        return raw, hashlib.md5(raw).hexdigest()
+
+    def process_txt_file(self, filepath: Path, strict: bool = False) -> List[Document]:
+        """处理TXT文件；strict=False 时解析失败记录日志并返回空列表"""
         try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                content = f.read()
+            raw, file_hash = self._read_file(filepath)
+            content = raw.decode('utf-8')
 
             cleaned_content = self._clean_text(content)
-            metadata = self._extract_metadata(filepath)
+            metadata = self._extract_metadata(filepath, file_hash)
 
-            return [Document(text=cleaned_content, metadata=metadata)]
+            return [self._make_document(cleaned_content, metadata)]
 
         except Exception as e:
             logger.log_error(e, {"file_path": str(filepath)})
+            if strict:
+                raise
             return []
 
 
     # services/document_processor.py (续)
-    def process_json_file(self, filepath: Path) -> List[Document]:
-        """处理JSON文件"""
+    def process_json_file(self, filepath: Path, strict: bool = False) -> List[Document]:
+        """处理JSON文件；strict=False 时解析失败记录日志并返回空列表"""
         try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            raw, file_hash = self._read_file(filepath)
+            data = json.loads(raw.decode('utf-8'))
 
             documents = []
-            base_metadata = self._extract_metadata(filepath)
+            base_metadata = self._extract_metadata(filepath, file_hash)
 
             if isinstance(data, list):
                 for i, item in enumerate(data):
                     if isinstance(item, dict):
                         text = self._dict_to_text(item)
-                        metadata = {**base_metadata, "item_index": i}
-                        documents.append(Document(text=text, metadata=metadata))
+                        metadata = {**base_metadata, "item_index": i, FIELDS_METADATA_KEY: self._dict_to_fields(item)}
+                        documents.append(self._make_document(text, metadata, item_index=i))
             elif isinstance(data, dict):
                 text = self._dict_to_text(data)
-                documents.append(Document(text=text, metadata=base_metadata))
+                metadata = {**base_metadata, FIELDS_METADATA_KEY: self._dict_to_fields(data)}
+                documents.append(self._make_document(text, metadata))
 
             return documents
 
         except Exception as e:
             logger.log_error(e, {"file_path": str(filepath)})
+            if strict:
+                raise
             return []
 
+    def _should_stream(self, filepath: Path) -> bool:
+        """JSON Lines 文件和超过阈值的JSON文件走流式解析"""
+        if filepath.suffix in JSON_LINES_SUFFIXES:
+            return True
+        return filepath.suffix == '.json' and filepath.stat().st_size >= self.json_stream_threshold
+
+    def iter_json_documents(
+            self,
+            filepath: Path,
+            start_offset: int = 0,
+            start_index: int = 0,
+            file_hash: Optional[str] = None,
+            strict: bool = False
+    ) -> Iterator[Document]:
+        """流式解析大JSON/JSON Lines文件，逐条产出文档，峰值内存与文件大小无关
+
+        文件哈希需要单独顺序读取一遍（可通过 file_hash 传入）；每个文档记录 byte_offset。
+        解析失败时 strict=True 抛出带续读位置的 StreamParseError，否则记录日志后在失败处结束。
+        """
+        base_metadata = self._extract_metadata(filepath, file_hash)
+        record = None
+        try:
+            for record in iter_json_records(filepath, start_offset=start_offset, start_index=start_index):
+                if isinstance(record.value, dict):
+                    text = self._dict_to_text(record.value)
+                    metadata = {
+                        **base_metadata,
+                        "item_index": record.index,
+                        "byte_offset": record.start_offset,
+                        FIELDS_METADATA_KEY: self._dict_to_fields(record.value)
+                    }
+                    yield self._make_document(text, metadata, item_index=record.index)
+        except Exception as e:
+            resume_offset = record.end_offset if record else start_offset
+            resume_index = record.index + 1 if record else start_index
+            logger.log_error(e, {
+                "file_path": str(filepath),
+                "resume_offset": resume_offset,
+                "resume_index": resume_index
+            })
+            if strict:
+                raise StreamParseError(str(e), resume_offset, resume_index) from e
+
+    def _make_document(
+            self,
+            text: str,
+            metadata: Dict[str, Any],
+            item_index: Optional[int] = None
+    ) -> Document:
+        """创建带稳定ID的文档，簿记字段不进入向量和LLM文本"""
+        return Document(
+            id_=make_doc_id(metadata["file_path"], item_index),
+            text=text,
+            metadata=metadata,
+            excluded_embed_metadata_keys=list(EXCLUDED_METADATA_KEYS),
+            excluded_llm_metadata_keys=list(EXCLUDED_METADATA_KEYS)
+        )
+
+    def _dict_to_fields(self, data: Dict[str, Any]) -> Dict[str, str]:
+        """保留记录的逐字段文本（证型、症状、病机、治法等）"""
+        fields = {}
+        for key, value in data.items():
+            if isinstance(value, str):
+                fields[key] = value
+            elif isinstance(value, list):
+                fields[key] = ', '.join(map(str, value))
+        return fields
+
     def _dict_to_text(self, data: Dict[str, Any]) -> str:
         """将字典转换为文本"""
         text_parts = []
@@ -113,34 +271,190 @@ class DocumentProcessor:
                 text_parts.append(f"{key}：{', '.join(map(str, value))}")
         return "\n".join(text_parts)
 
-    def process_directory(self, data_dir: str) -> List[Document]:
-        """处理整个目录"""
-        documents = []
+    def iter_files(self, data_dir: str) -> Iterator[Path]:
+        """遍历目录中支持的文件"""
         data_path = Path(data_dir)
 
         if not data_path.exists():
             logger.logger.error(f"Data directory not found: {data_dir}")
-            return documents
+            return
 
         for filepath in data_path.rglob("*"):
             if filepath.is_file() and filepath.suffix in self.supported_formats:
-                logger.logger.info(f"Processing file: {filepath}")
+                yield filepath
+
+    def load_file(self, filepath: Path, strict: bool = False) -> List[Document]:
+        """按文件类型解析为文档"""
+        return list(self.iter_file_documents(filepath, strict=strict))
 
-                if filepath.suffix == '.txt':
-                    docs = self.process_txt_file(filepath)
-                elif filepath.suffix == '.json':
-                    docs = self.process_json_file(filepath)
-                # TODO: 添加PDF, MD等格式支持
+    def iter_file_documents(
+            self,
+            filepath: Path,
+            file_hash: Optional[str] = None,
+            strict: bool = False
+    ) -> Iterator[Document]:
+        """按文件类型解析为文档，大JSON文件逐条产出；strict=True 时解析失败抛出异常"""
+        logger.logger.info(f"Processing file: {filepath}")
 
-                documents.extend(docs)
+        if self._should_stream(filepath):
+            yield from self.iter_json_documents(filepath, file_hash=file_hash, strict=strict)
+        elif filepath.suffix == '.txt':
+            yield from self.process_txt_file(filepath, strict=strict)
+        elif filepath.suffix == '.json':
+            yield from self.process_json_file(filepath, strict=strict)
+        # TODO: 添加PDF, MD等格式支持
 
+    def iter_documents(self, data_dir: str) -> Iterator[Document]:
+        """流式产出目录中的文档"""
+        for filepath in self.iter_files(data_dir):
+            yield from self.iter_file_documents(filepath)
+
+    def process_directory(self, data_dir: str) -> List[Document]:
+        """处理整个目录"""
+        documents = list(self.iter_documents(data_dir))
         logger.logger.info(f"Processed {len(documents)} documents from {data_dir}")
         return documents
 
+    def process_file(self, filepath: Path, known_hash: Optional[str] = None) -> ProcessedFile:
+        """解析并分块单个文件；文件哈希等于 known_hash 时只解析不分块
+
+        解析失败时返回带 error 的结果（不含文档和节点），而不是当作空文件：
+        否则调用方会删除该文件已索引的节点并记录新哈希，文件修复前都不会再被处理。
+        """
+        try:
+            documents = self.load_file(filepath, strict=True)
+        except Exception as e:
+            return ProcessedFile(file_path=str(filepath), file_hash=known_hash or "", documents=[], error=str(e))
+
+        file_hash = documents[0].metadata["file_hash"] if documents else self._calculate_file_hash(filepath)
+
+        nodes = None
+        if file_hash != known_hash:
+            nodes = self.create_nodes(documents) if documents else []
+
+        return ProcessedFile(file_path=str(filepath), file_hash=file_hash, documents=documents, nodes=nodes)
+
+    def iter_file_parts(self, filepath: Path, known_hash: Optional[str] = None) -> Iterator[ProcessedFile]:
+        """产出单个文件的处理结果；流式解析的大文件按批产出多个部分"""
+        if self._should_stream(filepath):
+            yield from self._iter_streamed_parts(filepath, known_hash)
+        else:
+            yield self.process_file(filepath, known_hash)
+
+    def _iter_streamed_parts(self, filepath: Path, known_hash: Optional[str]) -> Iterator[ProcessedFile]:
+        """大JSON文件逐条解析，每 STREAM_CHUNK_BATCH 条文档分块后作为一部分产出，内存只与批大小有关
+
+        读取出错时从最后一条完整记录之后续读（应对网络存储等的瞬时读错误），同一位置再次出错时
+        产出带 error 的最后一部分，已产出的部分不能当作完整文件提交。
+        """
+        file_hash = self._calculate_file_hash(filepath)
+        chunk = file_hash != known_hash
+        batch: List[Document] = []
+
+        def make_part(final: bool) -> ProcessedFile:
+            return ProcessedFile(
+                file_path=str(filepath),
+                file_hash=file_hash,
+                documents=batch,
+                nodes=(self.create_nodes(batch) if batch else []) if chunk else None,
+                final=final
+            )
+
+        resume_offset, resume_index = 0, 0
+        failed_at = None
+        while True:
+            try:
+                for doc in self.iter_json_documents(
+                        filepath,
+                        start_offset=resume_offset,
+                        start_index=resume_index,
+                        file_hash=file_hash,
+                        strict=True
+                ):
+                    batch.append(doc)
+                    if len(batch) >= STREAM_CHUNK_BATCH:
+                        yield make_part(final=False)
+                        batch = []
+                break
+            except StreamParseError as e:
+                position = (e.resume_offset, e.resume_index)
+                if position == failed_at:
+                    yield ProcessedFile(file_path=str(filepath), file_hash=file_hash, documents=[], error=str(e))
+                    return
+                logger.logger.warning(f"Resuming {filepath} at offset {e.resume_offset} (record {e.resume_index})")
+                failed_at = position
+                resume_offset, resume_index = position
+
+        yield make_part(final=True)
+
+    def iter_processed_files(
+            self,
+            data_dir: str,
+            workers: int = 1,
+            max_pending: int = 64,
+            known_hashes: Optional[Dict[str, str]] = None,
+            parallel_min_bytes: int = PARALLEL_MIN_BYTES
+    ) -> Iterator[ProcessedFile]:
+        """流式摄取：需要分块的文件较多时多进程并行解析与分块，有界的在途任务数限制内存占用
+
+        调用方可以在后续文件仍在解析时开始编码。先按文件哈希找出新增/修改的文件，只有其中
+        可交给工作进程的文件不止一个、且总大小达到 parallel_min_bytes 时才创建进程池：
+        未变化的文件只解析不分块，在当前进程处理即可，常规重启不必付出启动工作进程
+        （每个都要重新导入 llama_index 等）的开销。
+        小文件在工作进程中整体处理；未变化的文件和流式解析的大文件在当前进程产出
+        （大文件逐批产出，各部分连续），此时工作进程继续处理已提交的文件。
+        workers=0 表示使用全部CPU核，workers=1 时在当前进程串行处理。
+        工作进程以 spawn 方式启动：服务启动时此前已加载模型并创建了线程池，
+        fork 会复制这些线程持有的锁，子进程可能死锁。
+        """
+        known_hashes = known_hashes or {}
+        workers = workers or os.cpu_count() or 1
+        files = list(self.iter_files(data_dir))
+
+        changed: Dict[Path, int] = {}
+        if workers > 1:
+            for filepath in files:
+                if self._should_stream(filepath):
+                    continue  # 逐批结果无法从工作进程流式传回
+                if self._calculate_file_hash(filepath) != known_hashes.get(str(filepath)):
+                    changed[filepath] = filepath.stat().st_size
+        workers = min(workers, len(changed))
+
+        if workers <= 1 or sum(changed.values()) < parallel_min_bytes:
+            for filepath in files:
+                yield from self.iter_file_parts(filepath, known_hashes.get(str(filepath)))
+            return
+
+        logger.logger.info(
+            f"Chunking {len(changed)} changed files ({sum(changed.values()) / 1024 / 1024:.1f} MB) "
+            f"in {workers} worker processes"
+        )
+        with ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.chunk_size, self.chunk_overlap, self.json_stream_threshold)
+        ) as executor:
+            pending = deque()
+            for filepath in files:
+                known_hash = known_hashes.get(str(filepath))
+                if filepath not in changed:
+                    yield from self.iter_file_parts(filepath, known_hash)
+                    continue
+                pending.append(executor.submit(_process_file_in_worker, str(filepath), known_hash))
+                if len(pending) >= max_pending:
+                    yield pending.popleft().result()
+
+            while pending:
+                yield pending.popleft().result()
+
     def create_nodes(self, documents: List[Document]):
         """创建节点"""
         try:
             nodes = self.splitter.get_nodes_from_documents(documents)
+            for node in nodes:
+                if FIELDS_METADATA_KEY in node.metadata:
+                    node.metadata = {k: v for k, v in node.metadata.items() if k != FIELDS_METADATA_KEY}
             logger.logger.info(f"Created {len(nodes)} nodes from {len(documents)} documents")
             return nodes
         except Exception as e:
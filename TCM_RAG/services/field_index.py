@@ -0,0 +1,153 @@
+# services/field_index.py
+import json
+from pathlib import Path
+from typing import List, Dict, Tuple, Optional, Any
+
+import numpy as np
+from services.document_processor import FIELDS_METADATA_KEY
+from services.sparse_index import BM25Index, ChineseTokenizer
+from utils.logger import logger
+
+
+PATTERN_FIELD = "pattern"
+PATTERN_SUFFIXES = ("证", "型")  # "风湿困表证" 也可以用 "风湿困表" 查到
+_QUERY_END_PUNCTUATION = "？?。！!；;，,"
+
+
+def normalize_pattern(name: str) -> str:
+    return "".join(name.split())
+
+
+class FieldIndex:
+    """TCM结构化记录的字段索引
+
+    - 证型（pattern）名称精确匹配：整个查询就是证型名时，查到的记录作为额外的检索候选
+    - 按字段加权的BM25：每个字段一份倒排，分数按 field_weights 加权求和
+    - 可选的按字段向量：对指定字段单独编码，供字段级语义检索
+    文档序号与构建时传入的 documents 列表下标一致。
+    """
+
+    def __init__(
+            self,
+            pattern_lookup: Dict[str, List[int]],
+            field_bm25: Dict[str, BM25Index],
+            field_weights: Dict[str, float]
+    ):
+        self.pattern_lookup = pattern_lookup
+        self.field_bm25 = field_bm25
+        self.field_weights = field_weights
+        self.field_embeddings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}  # field -> (doc_idx, 归一化矩阵)
+
+    @classmethod
+    def build(
+            cls,
+            documents: List[Any],
+            field_weights: Dict[str, float],
+            tokenizer: Optional[ChineseTokenizer] = None,
+            k1: float = 1.5,
+            b: float = 0.75
+    ) -> "FieldIndex":
+        pattern_lookup: Dict[str, List[int]] = {}
+        field_texts: Dict[str, List[str]] = {name: [""] * len(documents) for name in field_weights}
+
+        for doc_idx, doc in enumerate(documents):
+            fields = doc.metadata.get(FIELDS_METADATA_KEY)
+            if not fields:
+                continue
+            for name, texts in field_texts.items():
+                texts[doc_idx] = fields.get(name, "")
+
+            pattern = normalize_pattern(fields.get(PATTERN_FIELD, ""))
+            if pattern:
+                keys = {pattern}
+                if len(pattern) > 2 and pattern.endswith(PATTERN_SUFFIXES):
+                    keys.add(pattern[:-1])
+                for key in keys:
+                    pattern_lookup.setdefault(key, []).append(doc_idx)
+
+        field_bm25 = {
+            name: BM25Index.build(texts, tokenizer=tokenizer, k1=k1, b=b)
+            for name, texts in field_texts.items() if any(texts)
+        }
+        logger.logger.info(
+            f"Field index built: {len(pattern_lookup)} pattern names, fields={list(field_bm25)}"
+        )
+        return cls(pattern_lookup, field_bm25, field_weights)
+
+    def lookup_pattern(self, query: str) -> List[int]:
+        """整个查询（去掉空白和句末标点）恰为证型名时返回其记录；查询中只是包含证型名不算命中
+
+        “肾阴虚的症状” 这类问题由常规检索回答，避免把整条证型记录当作任何相关问题的答案。
+        """
+        return self.pattern_lookup.get(normalize_pattern(query).rstrip(_QUERY_END_PUNCTUATION), [])
+
+    def search(self, query: str, top_k: int) -> List[Tuple[int, float]]:
+        """字段加权BM25"""
+        doc_parts, score_parts = [], []
+        for name, bm25 in self.field_bm25.items():
+            weight = self.field_weights.get(name, 0.0)
+            if weight <= 0:
+                continue
+            hits = bm25.search(query, top_k * 2)
+            if hits:
+                doc_parts.append(np.array([idx for idx, _ in hits], dtype=np.int64))
+                score_parts.append(np.array([score for _, score in hits], dtype=np.float64) * weight)
+
+        if not doc_parts:
+            return []
+        docs, inverse = np.unique(np.concatenate(doc_parts), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(score_parts))
+        k = min(top_k, len(docs))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(docs[i]), float(scores[i])) for i in top]
+
+    def build_field_embeddings(self, documents: List[Any], embed_model, fields: List[str]):
+        """对指定字段单独编码（只编码有该字段的文档）"""
+        for name in fields:
+            doc_ids, texts = [], []
+            for doc_idx, doc in enumerate(documents):
+                text = (doc.metadata.get(FIELDS_METADATA_KEY) or {}).get(name)
+                if text:
+                    doc_ids.append(doc_idx)
+                    texts.append(text)
+            if not texts:
+                continue
+            matrix = np.asarray(embed_model.get_text_embedding_batch(texts), dtype=np.float32)
+            matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+            self.field_embeddings[name] = (np.asarray(doc_ids, dtype=np.int64), matrix)
+            logger.logger.info(f"Field embeddings built for '{name}': {len(texts)} records")
+
+    def dense_search(self, query_embedding: List[float], top_k: int) -> List[Tuple[int, float]]:
+        """按字段向量检索，同一文档取各字段的最高分"""
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query /= max(float(np.linalg.norm(query)), 1e-12)
+        best: Dict[int, float] = {}
+        for doc_ids, matrix in self.field_embeddings.values():
+            scores = matrix @ query
+            k = min(top_k, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k]
+            for i in top:
+                doc_idx = int(doc_ids[i])
+                best[doc_idx] = max(best.get(doc_idx, -1.0), float(scores[i]))
+        return sorted(best.items(), key=lambda x: x[1], reverse=True)[:top_k]
+
+    def save(self, path: str):
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        for name, bm25 in self.field_bm25.items():
+            bm25.save(path / name)
+        with open(path / "fields.json", "w", encoding="utf-8") as f:
+            json.dump({
+                "pattern_lookup": self.pattern_lookup,
+                "field_weights": self.field_weights,
+                "fields": list(self.field_bm25)
+            }, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path: str, field_weights: Optional[Dict[str, float]] = None) -> "FieldIndex":
+        path = Path(path)
+        with open(path / "fields.json", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        field_bm25 = {name: BM25Index.load(path / name) for name in meta["fields"]}
+        return cls(meta["pattern_lookup"], field_bm25, field_weights or meta["field_weights"])
@@ -0,0 +1,167 @@
+# services/index_manifest.py
+import os
+import json
+import hashlib
+from dataclasses import asdict
+from datetime import datetime
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Set, Tuple
+
+from llama_index.core.schema import BaseNode, MetadataMode
+from utils.logger import logger
+
+
+def embed_backend_id(settings) -> str:
+    """推理后端会带来细微的数值差异（尤其int8量化），不同后端的向量不混用"""
+    if settings.model.embed_backend == "onnx":
+        return "onnx-int8" if settings.model.onnx_quantize else "onnx"
+    return settings.model.embed_backend
+
+
+def _short_hash(data: Any) -> str:
+    return hashlib.md5(json.dumps(data, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()[:12]
+
+
+def build_cache_namespaces(settings, corpus_version: Optional[str] = None) -> Dict[str, str]:
+    """各缓存命名空间的版本号
+
+    - embeddings：嵌入模型身份（路径、推理后端、截断长度、缓存精度）
+    - expansions：查询改写所用的LLM
+    - queries：语料版本 + 嵌入模型 + 重排模型 + 检索配置，重建索引或更换模型后自动换新
+    版本不变时（常规重新部署）沿用原有缓存。
+    """
+    embeddings = _short_hash({
+        "embed_model_path": settings.model.embed_model_path,
+        "embed_backend": embed_backend_id(settings),
+        "max_length": settings.model.max_length,
+        "dtype": settings.app.embedding_cache_dtype
+    })
+    namespaces = {
+        "embeddings": embeddings,
+        "expansions": _short_hash({"llm_model_path": settings.model.llm_model_path})
+    }
+    if corpus_version:
+        namespaces["queries"] = _short_hash({
+            "corpus_version": corpus_version,
+            "embeddings": embeddings,
+            "rerank_model_path": settings.model.rerank_model_path,
+            "retrieval": asdict(settings.retrieval)
+        })
+    return namespaces
+
+
+def build_index_signature(settings, embed_dim: int) -> Dict[str, Any]:
+    """索引签名：任一项变化都需要全量重建"""
+    return {
+        "embed_model_path": settings.model.embed_model_path,
+        "max_length": settings.model.max_length,
+        "embed_backend": embed_backend_id(settings),
+        "collection_name": settings.vector_store.collection_name,
+        "backend": settings.vector_store.backend,
+        "metric_type": settings.vector_store.metric_type,
+        "dim": embed_dim,
+        "chunk_size": settings.retrieval.chunk_size,
+        "chunk_overlap": settings.retrieval.chunk_overlap
+    }
+
+
+def node_content_hash(node: BaseNode) -> str:
+    """计算节点向量化文本的哈希（与VectorStoreIndex嵌入时使用的文本一致）"""
+    content = node.get_content(metadata_mode=MetadataMode.EMBED)
+    return hashlib.md5(content.encode("utf-8")).hexdigest()
+
+
+class IndexManifest:
+    """向量索引清单：记录每个文件的哈希及其节点的内容哈希，用于增量构建"""
+
+    FORMAT_VERSION = 1
+
+    def __init__(self, path: str, signature: Dict[str, Any]):
+        self.path = Path(path)
+        self.signature = signature
+        # file_path -> {"file_hash": str, "nodes": {node_id: content_hash}}
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.updated_at: Optional[str] = None
+
+    @classmethod
+    def load(cls, path: str, signature: Dict[str, Any]) -> "IndexManifest":
+        """加载清单；不存在、损坏或索引签名不一致时返回空清单"""
+        manifest = cls(path, signature)
+        if not manifest.path.exists():
+            return manifest
+
+        try:
+            with open(manifest.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            logger.log_error(e, {"operation": "load_index_manifest", "path": str(path)})
+            return manifest
+
+        if data.get("format_version") != cls.FORMAT_VERSION or data.get("signature") != signature:
+            logger.logger.info("Index manifest signature changed, a full rebuild is required")
+            return manifest
+
+        manifest.files = data.get("files", {})
+        manifest.updated_at = data.get("updated_at")
+        return manifest
+
+    @property
+    def is_empty(self) -> bool:
+        return not self.files
+
+    @property
+    def num_nodes(self) -> int:
+        return sum(len(entry["nodes"]) for entry in self.files.values())
+
+    def fingerprint(self) -> str:
+        """语料版本：索引签名与所有文件哈希共同决定"""
+        return _short_hash({"signature": self.signature, "files": self.file_hashes()})
+
+    def file_hashes(self) -> Dict[str, str]:
+        """已索引文件的哈希，供摄取阶段跳过未变化文件的分块"""
+        return {path: entry["file_hash"] for path, entry in self.files.items()}
+
+    def diff_nodes(self, file_path: str, nodes: List[BaseNode]) -> Tuple[List[BaseNode], Dict[str, str]]:
+        """比较已修改文件的（部分）节点：返回 (内容变化需要嵌入并写入的节点, 这些节点的内容哈希)"""
+        old_nodes = self.files.get(file_path, {}).get("nodes", {})
+        node_hashes = {node.node_id: node_content_hash(node) for node in nodes}
+        upsert_nodes = [node for node in nodes if old_nodes.get(node.node_id) != node_hashes[node.node_id]]
+        return upsert_nodes, node_hashes
+
+    def stale_node_ids(self, file_path: str, node_ids: Set[str]) -> List[str]:
+        """文件已不再包含、需要删除的节点"""
+        return [node_id for node_id in self.files.get(file_path, {}).get("nodes", {}) if node_id not in node_ids]
+
+    def removed_files(self, seen_files: Set[str]) -> List[str]:
+        return [path for path in self.files if path not in seen_files]
+
+    def file_node_ids(self, file_path: str) -> List[str]:
+        return list(self.files.get(file_path, {}).get("nodes", {}))
+
+    def update_file(self, file_path: str, file_hash: str, node_hashes: Dict[str, str]):
+        """记录文件的最新哈希和全部节点的内容哈希（不落盘）"""
+        self.files[file_path] = {"file_hash": file_hash, "nodes": dict(node_hashes)}
+
+    def merge_nodes(self, file_path: str, node_hashes: Dict[str, str]):
+        """文件未完整处理时记下已写入的节点，保留原哈希（新文件记为空），下次构建会重新处理该文件"""
+        entry = self.files.setdefault(file_path, {"file_hash": "", "nodes": {}})
+        entry["nodes"].update(node_hashes)
+
+    def remove_file(self, file_path: str):
+        self.files.pop(file_path, None)
+
+    def save(self):
+        """原子写入清单文件"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.updated_at = datetime.now().isoformat()
+        data = {
+            "format_version": self.FORMAT_VERSION,
+            "signature": self.signature,
+            "updated_at": self.updated_at,
+            "files": self.files
+        }
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        logger.logger.info(f"Index manifest saved: {len(self.files)} files, {self.num_nodes} nodes")
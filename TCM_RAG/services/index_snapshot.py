@@ -0,0 +1,184 @@
+# services/index_snapshot.py
+import os
+import json
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import List, Dict, Any, Iterator, Optional
+
+import numpy as np
+from llama_index.core import Document
+from llama_index.core.schema import BaseNode, TextNode
+from services.document_processor import ProcessedFile
+from services.sparse_index import BM25Index
+from services.field_index import FieldIndex
+from utils.logger import logger
+
+
+SNAPSHOT_FORMAT_VERSION = 1
+LATEST_POINTER = "LATEST"
+
+MANIFEST_FILE = "manifest.json"
+NODES_FILE = "nodes.jsonl"
+DOCUMENTS_FILE = "documents.jsonl"
+EMBEDDINGS_FILE = "embeddings.npy"
+BM25_DIR = "bm25"
+FIELD_INDEX_DIR = "fields"
+
+
+@dataclass
+class IndexSnapshot:
+    """离线构建的索引快照：节点、向量、BM25统计与清单"""
+    path: Path
+    manifest: Dict[str, Any]
+    nodes: List[BaseNode]
+    documents: List[Document]
+    embeddings: np.ndarray
+    bm25: BM25Index
+    field_index: Optional[FieldIndex] = None
+
+    @property
+    def version(self) -> str:
+        return self.manifest["version"]
+
+    def iter_processed_files(self, known_hashes: Dict[str, str]) -> Iterator[ProcessedFile]:
+        """按文件产出快照内容及其向量行，哈希未变化的文件不产出节点
+
+        向量保持为（内存映射的）矩阵，只在写入向量库时按文件取出对应行。
+        """
+        documents_by_file: Dict[str, List[Document]] = {}
+        for doc in self.documents:
+            documents_by_file.setdefault(doc.metadata["file_path"], []).append(doc)
+        rows_by_file: Dict[str, List[int]] = {}
+        for row, node in enumerate(self.nodes):
+            rows_by_file.setdefault(node.metadata["file_path"], []).append(row)
+
+        for file_path, file_hash in self.manifest["files"].items():
+            documents = documents_by_file.get(file_path, [])
+            if known_hashes.get(file_path) == file_hash:
+                yield ProcessedFile(file_path=file_path, file_hash=file_hash, documents=documents)
+                continue
+            rows = rows_by_file.get(file_path, [])
+            yield ProcessedFile(
+                file_path=file_path,
+                file_hash=file_hash,
+                documents=documents,
+                nodes=[self.nodes[row] for row in rows],
+                embeddings=self.embeddings[rows]
+            )
+
+
+def _write_jsonl(path: Path, items: List[BaseNode]):
+    with open(path, "w", encoding="utf-8") as f:
+        for item in items:
+            f.write(json.dumps(item.to_dict(), ensure_ascii=False) + "\n")
+
+
+def _read_jsonl(path: Path, cls) -> List[BaseNode]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [cls.from_dict(json.loads(line)) for line in f if line.strip()]
+
+
+def write_snapshot(
+        output_dir: str,
+        version: str,
+        nodes: List[BaseNode],
+        embeddings: List[List[float]],
+        documents: List[Document],
+        bm25: BM25Index,
+        signature: Dict[str, Any],
+        field_index: Optional[FieldIndex] = None,
+        update_latest: bool = True
+) -> Path:
+    """写入版本化快照目录，完成后更新 LATEST 指针"""
+    snapshot_path = Path(output_dir) / version
+    if snapshot_path.exists():
+        raise FileExistsError(f"Snapshot already exists: {snapshot_path}")
+
+    tmp_path = Path(output_dir) / f".{version}.tmp"
+    tmp_path.mkdir(parents=True, exist_ok=False)
+
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    if matrix.shape[0] != len(nodes):
+        raise ValueError(f"Embeddings ({matrix.shape[0]}) do not match nodes ({len(nodes)})")
+
+    np.save(tmp_path / EMBEDDINGS_FILE, matrix)
+    _write_jsonl(tmp_path / NODES_FILE, nodes)
+    _write_jsonl(tmp_path / DOCUMENTS_FILE, documents)
+    bm25.save(tmp_path / BM25_DIR)
+    if field_index is not None:
+        field_index.save(tmp_path / FIELD_INDEX_DIR)
+
+    files = {doc.metadata["file_path"]: doc.metadata["file_hash"] for doc in documents}
+    manifest = {
+        "format_version": SNAPSHOT_FORMAT_VERSION,
+        "version": version,
+        "created_at": datetime.now().isoformat(),
+        "signature": signature,
+        "num_nodes": len(nodes),
+        "num_documents": len(documents),
+        "embed_dim": int(matrix.shape[1]) if matrix.ndim == 2 else 0,
+        "files": files
+    }
+    with open(tmp_path / MANIFEST_FILE, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    os.replace(tmp_path, snapshot_path)
+
+    if update_latest:
+        pointer = Path(output_dir) / LATEST_POINTER
+        tmp_pointer = pointer.with_suffix(".tmp")
+        tmp_pointer.write_text(version, encoding="utf-8")
+        os.replace(tmp_pointer, pointer)
+
+    logger.logger.info(f"Snapshot {version} written to {snapshot_path}: {len(nodes)} nodes, {len(documents)} documents")
+    return snapshot_path
+
+
+def resolve_snapshot_path(path: str) -> Path:
+    """支持传入具体快照目录，或包含 LATEST 指针的快照根目录"""
+    snapshot_path = Path(path)
+    pointer = snapshot_path / LATEST_POINTER
+    if not (snapshot_path / MANIFEST_FILE).exists() and pointer.exists():
+        snapshot_path = snapshot_path / pointer.read_text(encoding="utf-8").strip()
+
+    if not (snapshot_path / MANIFEST_FILE).exists():
+        raise FileNotFoundError(f"No index snapshot found at {path}")
+    return snapshot_path
+
+
+def load_snapshot(path: str, mmap: bool = True) -> IndexSnapshot:
+    """加载快照；向量以内存映射方式打开，写入向量库时按行读取，避免重新编码"""
+    snapshot_path = resolve_snapshot_path(path)
+
+    with open(snapshot_path / MANIFEST_FILE, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+        raise ValueError(f"Unsupported snapshot format: {manifest.get('format_version')}")
+
+    embeddings = np.load(snapshot_path / EMBEDDINGS_FILE, mmap_mode="r" if mmap else None)
+    nodes = _read_jsonl(snapshot_path / NODES_FILE, TextNode)
+    documents = _read_jsonl(snapshot_path / DOCUMENTS_FILE, Document)
+    bm25 = BM25Index.load(snapshot_path / BM25_DIR)
+    field_index = None
+    if (snapshot_path / FIELD_INDEX_DIR).exists():
+        field_index = FieldIndex.load(snapshot_path / FIELD_INDEX_DIR)
+
+    if embeddings.shape[0] != len(nodes):
+        raise ValueError(f"Snapshot embeddings ({embeddings.shape[0]}) do not match nodes ({len(nodes)})")
+
+    logger.logger.info(f"Snapshot {manifest['version']} loaded from {snapshot_path}: {len(nodes)} nodes")
+    return IndexSnapshot(
+        path=snapshot_path,
+        manifest=manifest,
+        nodes=nodes,
+        documents=documents,
+        embeddings=embeddings,
+        bm25=bm25,
+        field_index=field_index
+    )
+
+
+def default_snapshot_version() -> str:
+    return datetime.now().strftime("%Y%m%d%H%M%S")
+
@@ -0,0 +1,604 @@
+# services/local_vector_store.py
+import os
+import json
+import asyncio
+import shutil
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Sequence
+
+import numpy as np
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    FilterOperator,
+    MetadataFilters,
+    VectorStoreQuery,
+    VectorStoreQueryResult,
+)
+from llama_index.core.vector_stores.utils import metadata_dict_to_node, node_to_metadata_dict
+from utils.logger import logger
+
+try:
+    import hnswlib
+except ImportError:  # HNSW为可选依赖，缺失时回退到精确检索
+    hnswlib = None
+
+
+META_FILE = "meta.json"
+VECTORS_FILE = "vectors.bin"
+LOG_FILE = "nodes.jsonl"
+HNSW_FILE = "hnsw.bin"
+
+SCAN_BLOCK_ROWS = 65536  # 精确检索时按块扫描，避免float16矩阵整体转换为float32
+COMPACTING_SUFFIX = ".compacting"
+COMPACTED_OLD_SUFFIX = ".old"
+
+
+class _ReadWriteLock:
+    """读写锁：检索持有共享的读锁可并发执行，写入、删除与压缩独占；有写者等待时不再放入新的读者"""
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+def _recover_compaction(path: Path):
+    """处理压缩中断留下的目录：新目录已完整写好但尚未换入时换入，否则丢弃"""
+    compacting = path.with_name(path.name + COMPACTING_SUFFIX)
+    old = path.with_name(path.name + COMPACTED_OLD_SUFFIX)
+    if not path.exists() and compacting.exists():
+        os.replace(compacting, path)
+    shutil.rmtree(compacting, ignore_errors=True)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+class LocalVectorStore(BasePydanticVectorStore):
+    """进程内向量库：向量以内存映射矩阵保存在磁盘，支持精确Top-K和HNSW两种检索方式
+
+    目录结构：
+        meta.json    维度、数据类型、度量方式
+        vectors.bin  只追加的向量矩阵（float32/float16）
+        nodes.jsonl  只追加的节点日志（add/delete），启动时回放
+        hnsw.bin     HNSW图（可选）
+
+    删除与覆盖只追加日志，失效行占比超过 compact_ratio 时（加载或 persist 时检查）压缩：
+    只保留有效行写入新目录后整体换入。检索持有读锁并发执行，写入独占写锁。
+    """
+
+    stores_text: bool = True
+    persist_dir: str
+    dim: int
+    metric_type: str = "COSINE"
+    index_type: str = "HNSW"
+    dtype: str = "float32"
+    hnsw_m: int = 16
+    hnsw_ef_construction: int = 200
+    hnsw_ef_search: int = 64
+    compact_ratio: float = 0.3  # 失效行占比超过该值时压缩，0 表示不自动压缩
+
+    _lock: Any = PrivateAttr()
+    _vectors: Any = PrivateAttr(default=None)
+    _num_rows: int = PrivateAttr(default=0)
+    _row_ids: List[Optional[str]] = PrivateAttr(default_factory=list)
+    _alive: Any = PrivateAttr(default=None)
+    _id_to_row: Dict[str, int] = PrivateAttr(default_factory=dict)
+    _nodes: Dict[str, Dict[str, Any]] = PrivateAttr(default_factory=dict)
+    _ref_doc_to_ids: Dict[str, set] = PrivateAttr(default_factory=dict)
+    _hnsw: Any = PrivateAttr(default=None)
+
+    def __init__(
+            self,
+            persist_dir: str,
+            dim: int,
+            metric_type: str = "COSINE",
+            index_type: str = "HNSW",
+            dtype: str = "float32",
+            overwrite: bool = False,
+            **kwargs: Any
+    ):
+        metric_type = metric_type.upper()
+        index_type = index_type.upper()
+        if metric_type not in ("COSINE", "IP", "L2"):
+            raise ValueError(f"Unsupported metric_type: {metric_type}")
+        if dtype not in ("float32", "float16"):
+            raise ValueError(f"Unsupported dtype: {dtype}")
+        if index_type == "HNSW" and hnswlib is None:
+            logger.logger.warning("hnswlib is not installed, LocalVectorStore falls back to FLAT search")
+            index_type = "FLAT"
+
+        super().__init__(
+            persist_dir=persist_dir,
+            dim=dim,
+            metric_type=metric_type,
+            index_type=index_type,
+            dtype=dtype,
+            **kwargs
+        )
+        self._lock = _ReadWriteLock()
+
+        path = Path(persist_dir)
+        _recover_compaction(path)
+        if overwrite and path.exists():
+            shutil.rmtree(path)
+        path.mkdir(parents=True, exist_ok=True)
+
+        self._load()
+        if self._needs_compaction():
+            self._compact()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "LocalVectorStore"
+
+    @property
+    def client(self) -> Any:
+        return None
+
+    # ===== 持久化 =====
+
+    def _path(self, name: str) -> Path:
+        return Path(self.persist_dir) / name
+
+    def _load(self):
+        meta_path = self._path(META_FILE)
+        if meta_path.exists():
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if (meta["dim"], meta["dtype"], meta["metric_type"]) != (self.dim, self.dtype, self.metric_type):
+                raise ValueError(
+                    f"Local vector store at {self.persist_dir} was created with {meta}, "
+                    f"use overwrite=True to rebuild it"
+                )
+        else:
+            with open(meta_path, "w", encoding="utf-8") as f:
+                json.dump({"dim": self.dim, "dtype": self.dtype, "metric_type": self.metric_type}, f)
+
+        vectors_path = self._path(VECTORS_FILE)
+        if not vectors_path.exists():
+            vectors_path.touch()
+        row_bytes = self.dim * np.dtype(self.dtype).itemsize
+        self._num_rows = os.path.getsize(vectors_path) // row_bytes
+        self._remap()
+
+        # 回放节点日志
+        self._row_ids = [None] * self._num_rows
+        self._alive = np.zeros(self._num_rows, dtype=bool)
+        log_path = self._path(LOG_FILE)
+        if log_path.exists():
+            with open(log_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    entry = json.loads(line)
+                    if entry["op"] == "add" and entry["row"] < self._num_rows:
+                        self._register(entry["id"], entry["row"], entry["node"])
+                    elif entry["op"] == "delete":
+                        self._unregister(entry["id"])
+
+        if self.index_type == "HNSW":
+            self._load_hnsw()
+
+        logger.logger.info(
+            f"LocalVectorStore loaded from {self.persist_dir}: {len(self._id_to_row)} vectors "
+            f"({self.index_type}, {self.metric_type}, {self.dtype})"
+        )
+
+    def _remap(self):
+        """重新映射向量文件（追加写入后调用）"""
+        if self._num_rows == 0:
+            self._vectors = np.zeros((0, self.dim), dtype=self.dtype)
+        else:
+            self._vectors = np.memmap(
+                self._path(VECTORS_FILE), dtype=self.dtype, mode="r", shape=(self._num_rows, self.dim)
+            )
+
+    def _load_hnsw(self):
+        space = {"COSINE": "ip", "IP": "ip", "L2": "l2"}[self.metric_type]  # COSINE向量写入前已归一化
+        self._hnsw = hnswlib.Index(space=space, dim=self.dim)
+
+        hnsw_path = self._path(HNSW_FILE)
+        if hnsw_path.exists():
+            try:
+                self._hnsw.load_index(str(hnsw_path), max_elements=max(self._num_rows, 1))
+                if self._hnsw.get_current_count() == self._num_rows:
+                    self._mark_hnsw_deleted()
+                    self._hnsw.set_ef(self.hnsw_ef_search)
+                    return
+                logger.logger.info("HNSW graph is stale, rebuilding from vectors")
+            except Exception as e:
+                logger.log_error(e, {"operation": "load_hnsw", "path": str(hnsw_path)})
+            self._hnsw = hnswlib.Index(space=space, dim=self.dim)
+
+        self._hnsw.init_index(
+            max_elements=max(self._num_rows, 1024),
+            M=self.hnsw_m,
+            ef_construction=self.hnsw_ef_construction
+        )
+        for start in range(0, self._num_rows, SCAN_BLOCK_ROWS):
+            block = np.asarray(self._vectors[start:start + SCAN_BLOCK_ROWS], dtype=np.float32)
+            self._hnsw.add_items(block, np.arange(start, start + len(block)))
+        self._mark_hnsw_deleted()
+        self._hnsw.set_ef(self.hnsw_ef_search)
+
+    def _mark_hnsw_deleted(self):
+        for row in np.flatnonzero(~self._alive):
+            try:
+                self._hnsw.mark_deleted(int(row))
+            except RuntimeError:
+                pass  # 保存的图中已标记删除
+
+    def persist(self, persist_path: Optional[str] = None, fs: Any = None) -> None:
+        """保存HNSW图（向量和节点日志在写入时已落盘）；失效行过多时先压缩"""
+        with self._lock.write():
+            if self._needs_compaction():
+                self._compact()
+            if self._hnsw is not None:
+                self._hnsw.save_index(str(self._path(HNSW_FILE)))
+
+    # ===== 压缩 =====
+
+    @property
+    def num_dead_rows(self) -> int:
+        return self._num_rows - len(self._id_to_row)
+
+    def _needs_compaction(self) -> bool:
+        return self.compact_ratio > 0 and self.num_dead_rows > 0 and \
+            self.num_dead_rows >= self.compact_ratio * self._num_rows
+
+    def compact(self) -> None:
+        """去掉已删除/被覆盖的行，重写向量文件与节点日志"""
+        with self._lock.write():
+            self._compact()
+
+    def _reset(self):
+        self._row_ids, self._id_to_row, self._nodes, self._ref_doc_to_ids = [], {}, {}, {}
+        self._alive = None
+        self._hnsw = None
+
+    def _compact(self):
+        """有效行按原顺序写入相邻的新目录，完整写好后与原目录互换（中断时由 _recover_compaction 收尾）"""
+        path = Path(self.persist_dir)
+        compacting = path.with_name(path.name + COMPACTING_SUFFIX)
+        old = path.with_name(path.name + COMPACTED_OLD_SUFFIX)
+        shutil.rmtree(compacting, ignore_errors=True)
+        compacting.mkdir(parents=True)
+        dead_rows = self.num_dead_rows
+
+        shutil.copy(self._path(META_FILE), compacting / META_FILE)
+        live_rows = np.flatnonzero(self._alive)
+        with open(compacting / VECTORS_FILE, "wb") as f:
+            for start in range(0, len(live_rows), SCAN_BLOCK_ROWS):
+                block = self._vectors[live_rows[start:start + SCAN_BLOCK_ROWS]]
+                f.write(np.asarray(block, dtype=self.dtype).tobytes())
+        with open(compacting / LOG_FILE, "w", encoding="utf-8") as f:
+            for new_row, row in enumerate(live_rows):
+                node_id = self._row_ids[row]
+                entry = {"op": "add", "row": new_row, "id": node_id, "node": self._nodes[node_id]}
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+        os.replace(path, old)
+        os.replace(compacting, path)
+        shutil.rmtree(old, ignore_errors=True)
+
+        self._reset()
+        self._load()
+        if self._hnsw is not None:
+            self._hnsw.save_index(str(self._path(HNSW_FILE)))
+        logger.logger.info(f"LocalVectorStore compacted {self.persist_dir}: dropped {dead_rows} dead rows")
+
+    def _register(self, node_id: str, row: int, node_dict: Dict[str, Any]):
+        self._unregister(node_id)
+        self._row_ids[row] = node_id
+        self._alive[row] = True
+        self._id_to_row[node_id] = row
+        self._nodes[node_id] = node_dict
+        ref_doc_id = node_dict.get("ref_doc_id")
+        if ref_doc_id:
+            self._ref_doc_to_ids.setdefault(ref_doc_id, set()).add(node_id)
+
+    def _unregister(self, node_id: str) -> bool:
+        row = self._id_to_row.pop(node_id, None)
+        if row is None:
+            return False
+        self._row_ids[row] = None
+        self._alive[row] = False
+        node_dict = self._nodes.pop(node_id, {})
+        ids = self._ref_doc_to_ids.get(node_dict.get("ref_doc_id"))
+        if ids is not None:
+            ids.discard(node_id)
+            if not ids:
+                del self._ref_doc_to_ids[node_dict["ref_doc_id"]]
+        if self._hnsw is not None:
+            self._hnsw.mark_deleted(row)
+        return True
+
+    # ===== 写入 =====
+
+    def _prepare(self, embeddings: np.ndarray) -> np.ndarray:
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if self.metric_type == "COSINE":
+            norms = np.linalg.norm(embeddings, axis=-1, keepdims=True)
+            embeddings = embeddings / np.maximum(norms, 1e-12)
+        return embeddings
+
+    def add(
+            self,
+            nodes: Sequence[BaseNode],
+            embeddings: Optional[np.ndarray] = None,
+            **add_kwargs: Any
+    ) -> List[str]:
+        """写入节点；embeddings 为与 nodes 逐行对应的向量矩阵时直接使用，不读取 node.embedding"""
+        if not nodes:
+            return []
+
+        if embeddings is None:
+            embeddings = [node.get_embedding() for node in nodes]
+        matrix = self._prepare(embeddings)
+        if matrix.shape[1] != self.dim:
+            raise ValueError(f"Embedding dim {matrix.shape[1]} does not match store dim {self.dim}")
+
+        with self._lock.write():
+            start_row = self._num_rows
+            with open(self._path(VECTORS_FILE), "ab") as f:
+                f.write(matrix.astype(self.dtype).tobytes())
+
+            entries = []
+            self._row_ids.extend([None] * len(nodes))
+            self._alive = np.concatenate([self._alive, np.zeros(len(nodes), dtype=bool)])
+            for offset, node in enumerate(nodes):
+                node_dict = node_to_metadata_dict(node, remove_text=False, flat_metadata=False)
+                node_dict["ref_doc_id"] = node.ref_doc_id
+                self._register(node.node_id, start_row + offset, node_dict)
+                entries.append({"op": "add", "row": start_row + offset, "id": node.node_id, "node": node_dict})
+
+            with open(self._path(LOG_FILE), "a", encoding="utf-8") as f:
+                for entry in entries:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+            self._num_rows += len(nodes)
+            self._remap()
+
+            if self._hnsw is not None:
+                if self._num_rows > self._hnsw.get_max_elements():
+                    self._hnsw.resize_index(max(self._num_rows, self._hnsw.get_max_elements() * 2))
+                self._hnsw.add_items(matrix, np.arange(start_row, self._num_rows))
+
+        return [node.node_id for node in nodes]
+
+    def _log_deletes(self, node_ids: List[str]):
+        deleted = [node_id for node_id in node_ids if self._unregister(node_id)]
+        if deleted:
+            with open(self._path(LOG_FILE), "a", encoding="utf-8") as f:
+                for node_id in deleted:
+                    f.write(json.dumps({"op": "delete", "id": node_id}) + "\n")
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        with self._lock.write():
+            self._log_deletes(list(self._ref_doc_to_ids.get(ref_doc_id, ())))
+
+    def delete_nodes(
+            self,
+            node_ids: Optional[List[str]] = None,
+            filters: Optional[MetadataFilters] = None,
+            **delete_kwargs: Any
+    ) -> None:
+        with self._lock.write():
+            ids = list(node_ids or [])
+            if filters is not None:
+                ids.extend(node_id for node_id in self._nodes if self._match_filters(node_id, filters))
+            self._log_deletes(ids)
+
+    def clear(self) -> None:
+        with self._lock.write():
+            shutil.rmtree(self.persist_dir, ignore_errors=True)
+            Path(self.persist_dir).mkdir(parents=True, exist_ok=True)
+            self._reset()
+            self._load()
+
+    def get_nodes(
+            self,
+            node_ids: Optional[List[str]] = None,
+            filters: Optional[MetadataFilters] = None
+    ) -> List[BaseNode]:
+        with self._lock.read():
+            ids = node_ids if node_ids is not None else list(self._nodes)
+            return [
+                metadata_dict_to_node(self._nodes[node_id]) for node_id in ids
+                if node_id in self._nodes and (filters is None or self._match_filters(node_id, filters))
+            ]
+
+    # ===== 检索 =====
+
+    def _match_filters(self, node_id: str, filters: MetadataFilters) -> bool:
+        node = metadata_dict_to_node(self._nodes[node_id])
+        results = []
+        for f in filters.filters:
+            value = node.metadata.get(f.key)
+            if f.operator == FilterOperator.EQ:
+                results.append(value == f.value)
+            elif f.operator == FilterOperator.NE:
+                results.append(value != f.value)
+            elif f.operator == FilterOperator.IN:
+                results.append(value in f.value)
+            else:
+                raise ValueError(f"LocalVectorStore does not support filter operator {f.operator}")
+        return all(results) if filters.condition in (None, "and") else any(results)
+
+    def _candidate_rows(self, query: VectorStoreQuery) -> Optional[np.ndarray]:
+        """根据 node_ids/doc_ids/filters 限定候选行，None 表示不限"""
+        if not (query.node_ids or query.doc_ids or query.filters):
+            return None
+        ids = set(query.node_ids or self._nodes.keys())
+        if query.doc_ids:
+            doc_ids = set()
+            for ref_doc_id in query.doc_ids:
+                doc_ids |= self._ref_doc_to_ids.get(ref_doc_id, set())
+            ids &= doc_ids
+        if query.filters:
+            ids = {node_id for node_id in ids if node_id in self._nodes and self._match_filters(node_id, query.filters)}
+        return np.array(sorted(self._id_to_row[i] for i in ids if i in self._id_to_row), dtype=np.int64)
+
+    def _score_block(self, block: np.ndarray, query_vector: np.ndarray) -> np.ndarray:
+        block = np.asarray(block, dtype=np.float32)
+        if self.metric_type == "L2":
+            return -np.sum((block - query_vector) ** 2, axis=1)
+        return block @ query_vector
+
+    def _flat_search(self, query_vector: np.ndarray, top_k: int, rows: Optional[np.ndarray]):
+        """精确Top-K：分块打分 + argpartition部分选择"""
+        vectors = self._vectors
+        if rows is None:
+            scores = np.empty(self._num_rows, dtype=np.float32)
+            for start in range(0, self._num_rows, SCAN_BLOCK_ROWS):
+                scores[start:start + SCAN_BLOCK_ROWS] = self._score_block(
+                    vectors[start:start + SCAN_BLOCK_ROWS], query_vector
+                )
+            scores[~self._alive] = -np.inf
+            candidate_rows = np.arange(self._num_rows)
+        else:
+            scores = self._score_block(vectors[rows], query_vector) if len(rows) else np.empty(0, dtype=np.float32)
+            candidate_rows = rows
+
+        k = min(top_k, int(np.isfinite(scores).sum()))
+        if k <= 0:
+            return [], []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return candidate_rows[top].tolist(), scores[top].tolist()
+
+    def _flat_search_many(self, query_matrix: np.ndarray, top_k: int):
+        """多个查询向量一次扫描：每块与所有查询做一次矩阵乘法"""
+        vectors = self._vectors
+        scores = np.empty((self._num_rows, len(query_matrix)), dtype=np.float32)
+        for start in range(0, self._num_rows, SCAN_BLOCK_ROWS):
+            block = np.asarray(vectors[start:start + SCAN_BLOCK_ROWS], dtype=np.float32)
+            block_scores = block @ query_matrix.T
+            if self.metric_type == "L2":
+                block_scores = (2 * block_scores
+                                - np.sum(block ** 2, axis=1)[:, None]
+                                - np.sum(query_matrix ** 2, axis=1)[None, :])
+            scores[start:start + SCAN_BLOCK_ROWS] = block_scores
+        scores[~self._alive] = -np.inf
+
+        k = min(top_k, int(self._alive.sum()))
+        results = []
+        for column in scores.T:
+            if k <= 0:
+                results.append(([], []))
+                continue
+            top = np.argpartition(-column, k - 1)[:k]
+            top = top[np.argsort(-column[top])]
+            results.append((top.tolist(), column[top].tolist()))
+        return results
+
+    def _hnsw_search_many(self, query_matrix: np.ndarray, top_k: int):
+        k = min(top_k, len(self._id_to_row))
+        if k <= 0:
+            return [([], []) for _ in range(len(query_matrix))]
+        labels, distances = self._hnsw.knn_query(query_matrix, k=k)
+        scores = -distances if self.metric_type == "L2" else 1.0 - distances
+        return [(row_labels.tolist(), row_scores.tolist()) for row_labels, row_scores in zip(labels, scores)]
+
+    def _hnsw_search(self, query_vector: np.ndarray, top_k: int):
+        k = min(top_k, len(self._id_to_row))
+        if k <= 0:
+            return [], []
+        labels, distances = self._hnsw.knn_query(query_vector, k=k)
+        if self.metric_type == "L2":
+            scores = (-distances[0]).tolist()
+        else:
+            scores = (1.0 - distances[0]).tolist()  # hnswlib ip距离 = 1 - 内积
+        return labels[0].tolist(), scores
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        if query.query_embedding is None:
+            raise ValueError("LocalVectorStore requires a query embedding")
+
+        query_vector = self._prepare([query.query_embedding])[0]
+        top_k = query.similarity_top_k
+
+        with self._lock.read():
+            rows = self._candidate_rows(query)
+            if self._hnsw is not None and rows is None:
+                top_rows, scores = self._hnsw_search(query_vector, top_k)
+            else:
+                top_rows, scores = self._flat_search(query_vector, top_k, rows)
+
+            nodes, ids = [], []
+            for row in top_rows:
+                node_id = self._row_ids[row]
+                nodes.append(metadata_dict_to_node(self._nodes[node_id]))
+                ids.append(node_id)
+
+        return VectorStoreQueryResult(nodes=nodes, similarities=scores, ids=ids)
+
+    async def aquery(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        """本地检索是CPU计算，放到线程中执行以免阻塞事件循环（读锁共享，多个检索可并行）"""
+        return await asyncio.to_thread(self.query, query, **kwargs)
+
+    def query_many(self, queries: List[VectorStoreQuery], **kwargs: Any) -> List[VectorStoreQueryResult]:
+        """多向量检索：无过滤条件的查询合并为一次矩阵检索（HNSW为一次批量 knn_query）"""
+        results: List[Optional[VectorStoreQueryResult]] = [None] * len(queries)
+        batched = []
+        for i, q in enumerate(queries):
+            if q.node_ids or q.doc_ids or q.filters:
+                results[i] = self.query(q, **kwargs)
+            else:
+                batched.append(i)
+        if not batched:
+            return results
+
+        if any(queries[i].query_embedding is None for i in batched):
+            raise ValueError("LocalVectorStore requires a query embedding")
+        query_matrix = self._prepare([queries[i].query_embedding for i in batched])
+        top_k = max(queries[i].similarity_top_k for i in batched)
+
+        with self._lock.read():
+            if self._hnsw is not None:
+                hits = self._hnsw_search_many(query_matrix, top_k)
+            else:
+                hits = self._flat_search_many(query_matrix, top_k)
+
+            for i, (top_rows, scores) in zip(batched, hits):
+                k = queries[i].similarity_top_k
+                ids = [self._row_ids[row] for row in top_rows[:k]]
+                results[i] = VectorStoreQueryResult(
+                    nodes=[metadata_dict_to_node(self._nodes[node_id]) for node_id in ids],
+                    similarities=scores[:k],
+                    ids=ids
+                )
+        return results
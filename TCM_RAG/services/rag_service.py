@@ -1,21 +1,35 @@
 # services/rag_service.py
+import os
+import re
+import json
 import time
-from typing import Dict, Any, Optional
+import hashlib
+import unicodedata
+from typing import Dict, Any, Optional, List, Callable, Iterable, AsyncIterator
 from datetime import datetime
 
 from config.settings import Settings
 from models.embeddings import EnterpriseEmbedding
-from services.document_processor import DocumentProcessor
-from services.retriever import EnterpriseRetriever
+from models.hf_llm import HFGenerationLLM
+from models.llm import create_llm
+from services.document_processor import DocumentProcessor, ProcessedFile
+from services.retriever import EnterpriseRetriever, RetrievalResult
+from services.semantic_cache import SemanticAnswerCache
 from services.answer_generator import AnswerGenerator
+from services.index_manifest import IndexManifest, build_index_signature, build_cache_namespaces
+from services.index_snapshot import IndexSnapshot, load_snapshot
+from services.local_vector_store import LocalVectorStore
 from utils.logger import logger
 from utils.metrics import metrics_collector, QueryMetrics
-from utils.cache import cache_manager
+from utils.cache import cache_manager, NAMESPACES
+from utils.singleflight import SingleFlight
 
 from llama_index.core import Settings as LlamaSettings, VectorStoreIndex
+from llama_index.core.llms import LLM
 from llama_index.vector_stores.milvus import MilvusVectorStore
-from llama_index.core import StorageContext
-from llama_index.llms.huggingface import HuggingFaceLLM
+
+
+SNAPSHOT_VERSION_PROPERTY = "tcm_rag.snapshot_version"  # Milvus集合属性：已完整写入的快照版本
 
 
 class EnterpriseRAGService:
@@ -30,51 +44,71 @@ class EnterpriseRAGService:
         self.answer_generator = None
         self.vector_store = None
         self.index = None
+        self.snapshot_version = None
+        self.corpus_version = None
+        self.semantic_cache = None
+        self.single_flight = None
 
         logger.logger.info("EnterpriseRAGService initialized")
 
-    def initialize(self):
-        """初始化所有组件"""
+    def initialize(self, force_rebuild: bool = False, snapshot_path: Optional[str] = None):
+        """初始化所有组件；指定快照（或配置 INDEX_SNAPSHOT_PATH）时从快照加载索引"""
         try:
             logger.logger.info("Starting RAG service initialization...")
 
             # 1. 初始化嵌入模型
+            cache_manager.configure(self.settings.app)
+            cache_manager.set_namespace_versions(build_cache_namespaces(self.settings))
             self.embed_model = EnterpriseEmbedding(
                 model_path=self.settings.model.embed_model_path,
                 device=self.settings.model.device,
                 max_length=self.settings.model.max_length,
-                batch_size=self.settings.model.batch_size
+                batch_size=self.settings.model.batch_size,
+                batching=self.settings.model.embed_batching,
+                max_batch_tokens=self.settings.model.embed_max_batch_tokens,
+                backend=self.settings.model.embed_backend,
+                onnx_quantize=self.settings.model.onnx_quantize,
+                onnx_intra_op_threads=self.settings.model.onnx_intra_op_threads,
+                onnx_cache_dir=self.settings.model.onnx_cache_dir
             )
             LlamaSettings.embed_model = self.embed_model
 
-            # 2. 初始化LLM
-            self.llm = HuggingFaceLLM(
-                model_name=self.settings.model.llm_model_path,
-                tokenizer_name=self.settings.model.llm_model_path,
-                device_map="auto",
-                model_kwargs={"trust_remote_code": True, "torch_dtype": "auto"},
-                tokenizer_kwargs={"trust_remote_code": True}
-            )
-            LlamaSettings.llm = self.llm
-
-            # 3. 处理文档
-            doc_processor = DocumentProcessor(
-                chunk_size=self.settings.retrieval.chunk_size,
-                chunk_overlap=self.settings.retrieval.chunk_overlap
-            )
-            documents = doc_processor.process_directory(self.settings.app.data_dir)
-            nodes = doc_processor.create_nodes(documents)
-
-            # 4. 初始化向量存储
-            self.vector_store = MilvusVectorStore(
-                uri=self.settings.vector_store.uri,
-                collection_name=self.settings.vector_store.collection_name,
-                dim=self.embed_model.embed_dim,
-                overwrite=True
-            )
-
-            storage_context = StorageContext.from_defaults(vector_store=self.vector_store)
-            self.index = VectorStoreIndex(nodes, storage_context=storage_context)
+            # 2. 初始化LLM（进程内模型或外部OpenAI兼容服务，答案生成与查询改写共用）
+            self.llm = create_llm(self.settings.model)
+            base_llm = self.llm.llm if isinstance(self.llm, HFGenerationLLM) else self.llm
+            if isinstance(base_llm, LLM):
+                LlamaSettings.llm = base_llm
+
+            # 3. 处理文档（快照模式下跳过解析、分块与文档编码）
+            snapshot_path = snapshot_path or self.settings.app.snapshot_path
+            snapshot = None
+            bm25 = None
+            field_index = None
+            if snapshot_path:
+                snapshot = load_snapshot(snapshot_path)
+                self._check_snapshot(snapshot.manifest)
+                self.snapshot_version = snapshot.version
+                bm25 = snapshot.bm25
+                field_index = snapshot.field_index
+                make_stream = snapshot.iter_processed_files
+            else:
+                doc_processor = DocumentProcessor(
+                    chunk_size=self.settings.retrieval.chunk_size,
+                    chunk_overlap=self.settings.retrieval.chunk_overlap,
+                    json_stream_threshold=self.settings.app.json_stream_threshold_mb * 1024 * 1024
+                )
+                make_stream = lambda known_hashes: doc_processor.iter_processed_files(
+                    self.settings.app.data_dir,
+                    workers=self.settings.app.ingest_workers,
+                    max_pending=self.settings.app.ingest_max_pending,
+                    known_hashes=known_hashes,
+                    parallel_min_bytes=self.settings.app.ingest_parallel_min_mb * 1024 * 1024
+                )
+
+            # 4. 初始化向量存储（增量构建，边解析边编码）
+            documents = self._build_index(make_stream, force_rebuild=force_rebuild, snapshot=snapshot)
+            # 查询结果缓存按语料版本分区：语料或模型不变时重新部署沿用原有缓存
+            cache_manager.set_namespace_versions(build_cache_namespaces(self.settings, self.corpus_version))
             vector_retriever = self.index.as_retriever(
                 similarity_top_k=self.settings.retrieval.similarity_top_k
             )
@@ -84,15 +118,57 @@ class EnterpriseRAGService:
                 vector_retriever=vector_retriever,
                 documents=documents,
                 rerank_model_path=self.settings.model.rerank_model_path,
-                config=self.settings.retrieval
+                config=self.settings.retrieval,
+                bm25=bm25,
+                field_index=field_index,
+                embed_model=self.embed_model,
+                vector_store=self.vector_store,
+                docstore_max_nodes=self.settings.app.docstore_max_nodes
             )
 
+            if self.settings.model.micro_batching:
+                self.embed_model.enable_query_batching(
+                    self.settings.model.query_embed_max_batch,
+                    self.settings.model.micro_batch_max_wait_ms
+                )
+                self.retriever.enable_rerank_batching(
+                    self.settings.model.rerank_max_batch_pairs,
+                    self.settings.model.micro_batch_max_wait_ms
+                )
+
             # 6. 初始化答案生成器
             self.answer_generator = AnswerGenerator(
                 llm=self.llm,
-                config=self.settings.retrieval
+                config=self.settings.retrieval,
+                max_workers=self.settings.app.generation_workers,
+                embed_model=self.embed_model
             )
 
+            # 7. 语义答案缓存（关键术语签名与检索共用术语词典）
+            if self.settings.app.semantic_cache_enabled:
+                self.semantic_cache = SemanticAnswerCache(
+                    dim=self.embed_model.embed_dim,
+                    threshold=self.settings.app.semantic_cache_threshold,
+                    max_entries=self.settings.app.semantic_cache_max_entries,
+                    ttl=self.settings.app.semantic_cache_ttl,
+                    audit_size=self.settings.app.semantic_cache_audit_size,
+                    suspect_overlap=self.settings.app.semantic_cache_suspect_overlap,
+                    term_fn=self.retriever.term_dictionary.key_terms
+                )
+
+            # 8. 并发相同查询合并（出错的响应不跨进程共享；单进程部署不使用Redis锁）
+            if self.settings.app.single_flight_enabled:
+                distributed = self.settings.app.single_flight_distributed
+                self.single_flight = SingleFlight(
+                    redis_client=cache_manager.redis_client if distributed else None,
+                    async_redis_client=cache_manager.async_redis_client if distributed else None,
+                    lock_ttl=self.settings.app.single_flight_lock_ttl,
+                    wait_timeout=self.settings.app.single_flight_wait_timeout,
+                    result_ttl=self.settings.app.single_flight_result_ttl,
+                    poll_ms=self.settings.app.single_flight_poll_ms,
+                    shareable=lambda response: "error" not in response
+                )
+
             self.is_initialized = True
             logger.logger.info("RAG service initialization completed successfully")
 
@@ -100,6 +176,203 @@ class EnterpriseRAGService:
             logger.log_error(e, {"stage": "initialization"})
             raise
 
+    def _index_signature(self) -> Dict[str, Any]:
+        return build_index_signature(self.settings, self.embed_model.embed_dim)
+
+    def _check_snapshot(self, manifest: Dict[str, Any]):
+        """校验快照与当前查询编码模型兼容"""
+        if manifest["embed_dim"] != self.embed_model.embed_dim:
+            raise ValueError(
+                f"Snapshot embedding dim {manifest['embed_dim']} does not match "
+                f"embed model dim {self.embed_model.embed_dim}"
+            )
+        if manifest["signature"] != self._index_signature():
+            raise ValueError(
+                f"Snapshot {manifest['version']} was built with a different index signature: "
+                f"{manifest['signature']}, expected {self._index_signature()}"
+            )
+
+    def _collection_name(self, snapshot: Optional[IndexSnapshot] = None) -> str:
+        """快照模式下每个快照版本使用独立集合，实例固定在所加载版本的集合上"""
+        name = self.settings.vector_store.collection_name
+        if snapshot is None:
+            return name
+        return f"{name}_{re.sub(r'[^0-9A-Za-z_]', '_', snapshot.version)}"
+
+    def _manifest_path(self, collection_name: str) -> str:
+        return os.path.join(self.settings.app.cache_dir, f"index_manifest_{collection_name}.json")
+
+    def _loaded_snapshot_version(self) -> Optional[str]:
+        """共享集合中已完整写入的快照版本（记录在Milvus集合属性中），本地向量库不共享，返回None"""
+        if not isinstance(self.vector_store, MilvusVectorStore):
+            return None
+        try:
+            description = self.vector_store.client.describe_collection(self.vector_store.collection_name)
+        except Exception as e:
+            logger.log_error(e, {"operation": "describe_collection", "collection": self.vector_store.collection_name})
+            return None
+        return description.get("properties", {}).get(SNAPSHOT_VERSION_PROPERTY)
+
+    def _mark_snapshot_loaded(self, version: str):
+        """快照全部写入后在集合上记录版本，之后启动的实例直接挂载，不再写入"""
+        if not isinstance(self.vector_store, MilvusVectorStore):
+            return
+        client = self.vector_store.client
+        client.flush(self.vector_store.collection_name)
+        client.alter_collection_properties(
+            self.vector_store.collection_name,
+            properties={SNAPSHOT_VERSION_PROPERTY: version}
+        )
+
+    def _build_index(
+            self,
+            make_stream: Callable[[Dict[str, str]], Iterable[ProcessedFile]],
+            force_rebuild: bool = False,
+            snapshot: Optional[IndexSnapshot] = None
+    ) -> List:
+        """根据索引清单只嵌入新增/修改的节点，并删除已消失的节点，返回全部文档
+
+        make_stream 接收已索引文件的哈希，返回逐文件的处理结果；未变化的文件不分块，
+        快照中的节点直接使用快照向量，不会重新编码。
+
+        只有显式重建（force_rebuild 或关闭增量）才清空向量库。本地清单为空（新实例）时
+        挂载已有集合，按ID先删后写补齐内容。
+
+        快照模式从不清空，也不改动其他实例正在读取的数据：每个快照版本写入独立集合
+        （upsert，并发加载同一版本也不会出现空窗或重复），写完后在集合上记录版本；
+        集合已记录该版本时直接挂载，启动耗时与语料规模无关。旧版本集合由运维在下线后清理。
+        """
+        collection_name = self._collection_name(snapshot)
+        manifest = IndexManifest.load(self._manifest_path(collection_name), self._index_signature())
+        rebuild = force_rebuild or not self.settings.vector_store.incremental
+        if snapshot is not None and rebuild:
+            logger.logger.warning("Loading from a snapshot never overwrites the vector store, ignoring rebuild")
+            rebuild = False
+
+        if rebuild:
+            manifest = IndexManifest(self._manifest_path(collection_name), self._index_signature())
+
+        self.vector_store = self._create_vector_store(
+            overwrite=rebuild,
+            collection_name=collection_name,
+            upsert=snapshot is not None
+        )
+        self.index = VectorStoreIndex.from_vector_store(self.vector_store)
+
+        if snapshot is not None and self._loaded_snapshot_version() == snapshot.version:
+            # 其他实例已完整写入该版本：按快照文件哈希视为全部未变化，只取文档
+            logger.logger.info(f"Snapshot {snapshot.version} is already loaded in {collection_name}, mounting it")
+            manifest = IndexManifest(self._manifest_path(collection_name), self._index_signature())
+            for file_path, file_hash in snapshot.manifest["files"].items():
+                manifest.update_file(file_path, file_hash, {})
+
+        documents = []
+        seen_files = set()
+        stats = {"unchanged": 0, "changed": 0, "failed": 0, "removed": 0, "upserted": 0, "deleted": 0}
+
+        # 大文件分多个部分产出：累计已写入节点的内容哈希，最后一部分之后再删除过期节点并更新清单
+        file_nodes: Dict[str, str] = {}
+        for processed in make_stream(manifest.file_hashes()):
+            seen_files.add(processed.file_path)
+            if processed.error is not None:
+                # 保留该文件原有哈希（修复后下次构建重新处理），已写入的部分节点记入清单以便之后清理
+                logger.logger.warning(f"Skipping unparsable file, keeping its indexed nodes: {processed.file_path}")
+                manifest.merge_nodes(processed.file_path, file_nodes)
+                file_nodes = {}
+                stats["failed"] += 1
+                continue
+            documents.extend(processed.documents)
+            if processed.nodes is None:
+                if processed.final:
+                    stats["unchanged"] += 1
+                continue
+
+            upsert_nodes, node_hashes = manifest.diff_nodes(processed.file_path, processed.nodes)
+            # 先按ID删除再写入：Milvus按主键插入不会覆盖旧记录，中断后重跑也不会产生重复
+            # （快照集合以upsert写入，无需删除）
+            if upsert_nodes and not rebuild and snapshot is None:
+                self.vector_store.delete_nodes(node_ids=[node.node_id for node in upsert_nodes])
+            if upsert_nodes:
+                self._insert_nodes(processed, upsert_nodes)
+            file_nodes.update(node_hashes)
+            stats["upserted"] += len(upsert_nodes)
+            if not processed.final:
+                continue
+
+            stale_ids = manifest.stale_node_ids(processed.file_path, set(file_nodes))
+            if stale_ids:
+                self.vector_store.delete_nodes(node_ids=stale_ids)
+            manifest.update_file(processed.file_path, processed.file_hash, file_nodes)
+            file_nodes = {}
+            stats["changed"] += 1
+            stats["deleted"] += len(stale_ids)
+
+        for file_path in manifest.removed_files(seen_files):
+            stale_ids = manifest.file_node_ids(file_path)
+            if stale_ids:
+                self.vector_store.delete_nodes(node_ids=stale_ids)
+            manifest.remove_file(file_path)
+            stats["removed"] += 1
+            stats["deleted"] += len(stale_ids)
+
+        logger.logger.info(
+            f"Index build: rebuild={rebuild}, unchanged files={stats['unchanged']}, "
+            f"changed files={stats['changed']}, failed files={stats['failed']}, removed files={stats['removed']}, "
+            f"upserted nodes={stats['upserted']}, deleted nodes={stats['deleted']}"
+        )
+
+        if stats["changed"] or stats["failed"] or stats["removed"] or rebuild:
+            if isinstance(self.vector_store, LocalVectorStore):
+                self.vector_store.persist()
+            manifest.save()
+        if snapshot is not None and stats["changed"] and not stats["failed"]:
+            self._mark_snapshot_loaded(snapshot.version)
+
+        self.corpus_version = manifest.fingerprint()
+        return documents
+
+    def _insert_nodes(self, processed: ProcessedFile, nodes: List):
+        """写入节点；快照节点的向量按行从快照矩阵取出，整批交给向量库"""
+        if processed.embeddings is None:
+            self.index.insert_nodes(nodes)
+            return
+
+        rows = {node.node_id: row for row, node in enumerate(processed.nodes)}
+        embeddings = processed.embeddings[[rows[node.node_id] for node in nodes]]
+        if isinstance(self.vector_store, LocalVectorStore):
+            self.vector_store.add(nodes, embeddings=embeddings)
+            return
+        # 其他向量库从节点读取向量，只为本批节点转换
+        for node, embedding in zip(nodes, embeddings):
+            node.embedding = embedding.tolist()
+        self.vector_store.add(nodes)
+
+    def _create_vector_store(self, overwrite: bool, collection_name: str, upsert: bool = False):
+        """根据 VectorStoreConfig.backend 创建向量库；本地向量库写入同ID节点时总是覆盖"""
+        config = self.settings.vector_store
+        if config.backend == "local":
+            return LocalVectorStore(
+                persist_dir=os.path.join(config.local_path, collection_name),
+                dim=self.embed_model.embed_dim,
+                metric_type=config.metric_type,
+                index_type=config.index_type,
+                dtype=config.local_dtype,
+                hnsw_m=config.hnsw_m,
+                hnsw_ef_construction=config.hnsw_ef_construction,
+                hnsw_ef_search=config.hnsw_ef_search,
+                compact_ratio=config.local_compact_ratio,
+                overwrite=overwrite
+            )
+        if config.backend == "milvus":
+            return MilvusVectorStore(
+                uri=config.uri,
+                collection_name=collection_name,
+                dim=self.embed_model.embed_dim,
+                overwrite=overwrite,
+                upsert_mode=upsert
+            )
+        raise ValueError(f"Unknown vector store backend: {config.backend}")
+
     def _validate_query(self, query: str) -> bool:
         """验证查询"""
         if not query or not query.strip():
@@ -110,16 +383,8 @@ class EnterpriseRAGService:
 
         return True
 
-    def query(
-            self,
-            question: str,
-            user_id: Optional[str] = None,
-            use_cache: bool = True,
-            include_debug: bool = False
-    ) -> Dict[str, Any]:
-        """处理查询"""
-        start_time = time.time()
-
+    def _check_query(self, question: str) -> Optional[Dict[str, Any]]:
+        """查询前置检查，不通过时返回错误响应"""
         if not self.is_initialized:
             return {
                 "error": "Service not initialized",
@@ -132,10 +397,189 @@ class EnterpriseRAGService:
                 "error": "Invalid query",
                 "answer": "查询无效，请检查输入。"
             }
+        return None
+
+    def _build_response(
+            self,
+            question: str,
+            user_id: Optional[str],
+            include_debug: bool,
+            retrieval_result,
+            answer_result: Dict[str, Any],
+            start_time: float
+    ) -> Dict[str, Any]:
+        total_time = time.time() - start_time
+
+        # 记录指标
+        metrics = QueryMetrics(
+            timestamp=datetime.now(),
+            query=question,
+            retrieval_time=retrieval_result.retrieval_time,
+            generation_time=answer_result["generation_time"],
+            total_time=total_time,
+            num_results=len(retrieval_result.nodes),
+            confidence=answer_result["confidence"],
+            cache_hit=retrieval_result.cache_hit,
+            method_used=retrieval_result.method_used,
+            user_id=user_id
+        )
+        metrics_collector.record_query(metrics)
+
+        # 构建响应
+        response = {
+            "answer": answer_result["answer"],
+            "confidence": answer_result["confidence"],
+            "sources": answer_result["sources"],
+            "total_time": total_time,
+            "retrieval_time": retrieval_result.retrieval_time,
+            "generation_time": answer_result["generation_time"],
+            "cache_hit": retrieval_result.cache_hit,
+            "method_used": retrieval_result.method_used,
+            "num_sources": len(answer_result["sources"])
+        }
+
+        if include_debug:
+            response["debug"] = {
+                "total_candidates": retrieval_result.total_candidates,
+                "context_used": answer_result["context_used"],
+                "retrieval_scores": [r.score for r in retrieval_result.nodes]
+            }
+
+        return response
+
+    def _error_response(self, e: Exception, question: str, user_id: Optional[str], start_time: float) -> Dict[str, Any]:
+        logger.log_error(e, {"query": question, "user_id": user_id})
+        metrics_collector.record_error(type(e).__name__)
+
+        return {
+            "error": str(e),
+            "answer": "处理您的问题时发生错误，请稍后重试。",
+            "total_time": time.time() - start_time
+        }
+
+    def _semantic_cache_hit(
+            self,
+            question: str,
+            query_embedding: Optional[List[float]],
+            start_time: float
+    ) -> Optional[tuple]:
+        """语义缓存命中时返回 (检索结果, 答案结果)，不再检索与生成"""
+        if self.semantic_cache is None or query_embedding is None:
+            return None
+        cached = self.semantic_cache.lookup(question, query_embedding)
+        if cached is None:
+            return None
+
+        retrieval_result = RetrievalResult(
+            nodes=[],
+            retrieval_time=time.time() - start_time,
+            cache_hit=True,
+            method_used="semantic_cache",
+            total_candidates=0
+        )
+        answer_result = dict(cached, generation_time=0.0)
+        return retrieval_result, answer_result
+
+    def _remember_answer(self, question: str, query_embedding: Optional[List[float]], answer_result: Dict[str, Any]):
+        """只缓存基于检索资料正常生成的答案"""
+        if self.semantic_cache is None or query_embedding is None:
+            return
+        if answer_result.get("error") or not answer_result.get("sources"):
+            return
+        self.semantic_cache.store(question, query_embedding, {
+            "answer": answer_result["answer"],
+            "sources": answer_result["sources"],
+            "confidence": answer_result["confidence"],
+            "context_used": answer_result["context_used"]
+        })
+
+    def _semantic_hit_response(
+            self,
+            question: str,
+            user_id: Optional[str],
+            include_debug: bool,
+            hit: tuple,
+            start_time: float
+    ) -> Dict[str, Any]:
+        retrieval_result, answer_result = hit
+        response = self._build_response(question, user_id, include_debug, retrieval_result, answer_result, start_time)
+        if include_debug:
+            response["debug"]["matched_question"] = answer_result["matched_question"]
+            response["debug"]["similarity"] = answer_result["similarity"]
+        return response
+
+    def _flight_key(self, question: str, include_debug: bool) -> str:
+        """合并键：规范化后的问题 + 影响响应内容的选项 + 当前语料版本"""
+        normalized = " ".join(unicodedata.normalize("NFKC", question).split()).lower()
+        key_data = json.dumps([normalized, include_debug, cache_manager.namespace_versions["queries"]], ensure_ascii=False)
+        return hashlib.md5(key_data.encode("utf-8")).hexdigest()
+
+    def _coalesced_response(
+            self,
+            question: str,
+            user_id: Optional[str],
+            response: Dict[str, Any],
+            start_time: float
+    ) -> Dict[str, Any]:
+        """复用他人结果的请求同样计入查询指标（耗时为等待时间，记为缓存命中）"""
+        total_time = time.time() - start_time
+        if "error" not in response:
+            metrics_collector.record_query(QueryMetrics(
+                timestamp=datetime.now(),
+                query=question,
+                retrieval_time=0.0,
+                generation_time=0.0,
+                total_time=total_time,
+                num_results=response.get("num_sources", 0),
+                confidence=response.get("confidence", 0.0),
+                cache_hit=True,
+                method_used="coalesced",
+                user_id=user_id
+            ))
+        return dict(response, coalesced=True, total_time=total_time)
+
+    def query(
+            self,
+            question: str,
+            user_id: Optional[str] = None,
+            use_cache: bool = True,
+            include_debug: bool = False
+    ) -> Dict[str, Any]:
+        """处理查询；并发的相同查询只执行一次，其余请求复用其结果（带 coalesced 标记）"""
+        # 显式绕过缓存的请求需要新鲜结果，不参与合并
+        if self.single_flight is None or not use_cache:
+            return self._query(question, user_id, use_cache, include_debug)
+        start_time = time.time()
+        response, shared = self.single_flight.do(
+            self._flight_key(question, include_debug),
+            lambda: self._query(question, user_id, use_cache, include_debug)
+        )
+        return self._coalesced_response(question, user_id, response, start_time) if shared else response
+
+    def _query(
+            self,
+            question: str,
+            user_id: Optional[str] = None,
+            use_cache: bool = True,
+            include_debug: bool = False
+    ) -> Dict[str, Any]:
+        start_time = time.time()
+
+        error_response = self._check_query(question)
+        if error_response:
+            return error_response
 
         logger.log_query(question, user_id)
 
         try:
+            # 语义答案缓存
+            query_embedding = None
+            if use_cache and self.semantic_cache is not None:
+                query_embedding = self.embed_model.get_query_embedding(question)
+                hit = self._semantic_cache_hit(question, query_embedding, start_time)
+                if hit:
+                    return self._semantic_hit_response(question, user_id, include_debug, hit, start_time)
+
             # 检索
             retrieval_result = self.retriever.hybrid_retrieve(
                 query=question,
@@ -149,55 +593,155 @@ class EnterpriseRAGService:
                 query=question,
                 retrieval_results=retrieval_result.nodes
             )
+            self._remember_answer(question, query_embedding, answer_result)
 
-            total_time = time.time() - start_time
+            return self._build_response(question, user_id, include_debug, retrieval_result, answer_result, start_time)
 
-            # 记录指标
-            metrics = QueryMetrics(
-                timestamp=datetime.now(),
+        except Exception as e:
+            return self._error_response(e, question, user_id, start_time)
+
+    async def aquery(
+            self,
+            question: str,
+            user_id: Optional[str] = None,
+            use_cache: bool = True,
+            include_debug: bool = False
+    ) -> Dict[str, Any]:
+        """处理查询（异步），不阻塞事件循环，单进程可同时处理多个请求；相同查询合并方式同 query"""
+        if self.single_flight is None or not use_cache:
+            return await self._aquery(question, user_id, use_cache, include_debug)
+        start_time = time.time()
+        response, shared = await self.single_flight.ado(
+            self._flight_key(question, include_debug),
+            lambda: self._aquery(question, user_id, use_cache, include_debug)
+        )
+        return self._coalesced_response(question, user_id, response, start_time) if shared else response
+
+    async def _aquery(
+            self,
+            question: str,
+            user_id: Optional[str] = None,
+            use_cache: bool = True,
+            include_debug: bool = False
+    ) -> Dict[str, Any]:
+        start_time = time.time()
+
+        error_response = self._check_query(question)
+        if error_response:
+            return error_response
+
+        logger.log_query(question, user_id)
+
+        try:
+            query_embedding = None
+            if use_cache and self.semantic_cache is not None:
+                query_embedding = await self.retriever.aembed_query(question)
+                hit = self._semantic_cache_hit(question, query_embedding, start_time)
+                if hit:
+                    return self._semantic_hit_response(question, user_id, include_debug, hit, start_time)
+
+            retrieval_result = await self.retriever.ahybrid_retrieve(
                 query=question,
-                retrieval_time=retrieval_result.retrieval_time,
-                generation_time=answer_result["generation_time"],
-                total_time=total_time,
-                num_results=len(retrieval_result.nodes),
-                confidence=answer_result["confidence"],
-                cache_hit=retrieval_result.cache_hit,
-                method_used=retrieval_result.method_used,
-                user_id=user_id
+                llm=self.llm,
+                use_cache=use_cache,
+                debug=include_debug
             )
-            metrics_collector.record_query(metrics)
-
-            # 构建响应
-            response = {
-                "answer": answer_result["answer"],
-                "confidence": answer_result["confidence"],
-                "sources": answer_result["sources"],
-                "total_time": total_time,
-                "retrieval_time": retrieval_result.retrieval_time,
-                "generation_time": answer_result["generation_time"],
-                "cache_hit": retrieval_result.cache_hit,
-                "method_used": retrieval_result.method_used,
-                "num_sources": len(answer_result["sources"])
-            }
 
-            if include_debug:
-                response["debug"] = {
-                    "total_candidates": retrieval_result.total_candidates,
-                    "context_used": answer_result["context_used"],
-                    "retrieval_scores": [r.score for r in retrieval_result.nodes]
-                }
+            answer_result = await self.answer_generator.agenerate_answer(
+                query=question,
+                retrieval_results=retrieval_result.nodes
+            )
+            self._remember_answer(question, query_embedding, answer_result)
 
-            return response
+            return self._build_response(question, user_id, include_debug, retrieval_result, answer_result, start_time)
 
         except Exception as e:
-            logger.log_error(e, {"query": question, "user_id": user_id})
-            metrics_collector.record_error(type(e).__name__)
+            return self._error_response(e, question, user_id, start_time)
 
-            return {
-                "error": str(e),
-                "answer": "处理您的问题时发生错误，请稍后重试。",
-                "total_time": time.time() - start_time
-            }
+    async def astream_query(
+            self,
+            question: str,
+            user_id: Optional[str] = None,
+            use_cache: bool = True,
+            include_debug: bool = False
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """流式查询，依次产出事件：
+        - sources：检索完成后立即发送来源与检索耗时
+        - token：LLM增量文本
+        - final：完整答案、各阶段耗时（含首token延迟）与置信度
+        - error：任一阶段失败
+        """
+        start_time = time.time()
+
+        error_response = self._check_query(question)
+        if error_response:
+            yield {"event": "error", "data": error_response}
+            return
+
+        logger.log_query(question, user_id)
+
+        try:
+            query_embedding = None
+            if use_cache and self.semantic_cache is not None:
+                query_embedding = await self.retriever.aembed_query(question)
+                hit = self._semantic_cache_hit(question, query_embedding, start_time)
+                if hit:
+                    retrieval_result, answer_result = hit
+                    yield {"event": "sources", "data": {
+                        "sources": answer_result["sources"],
+                        "retrieval_time": retrieval_result.retrieval_time,
+                        "cache_hit": True,
+                        "method_used": retrieval_result.method_used
+                    }}
+                    yield {"event": "token", "data": {"delta": answer_result["answer"]}}
+                    response = self._semantic_hit_response(question, user_id, include_debug, hit, start_time)
+                    response.pop("sources")
+                    response["time_to_first_token"] = response["total_time"]
+                    yield {"event": "final", "data": response}
+                    return
+
+            retrieval_result = await self.retriever.ahybrid_retrieve(
+                query=question,
+                llm=self.llm,
+                use_cache=use_cache,
+                debug=include_debug
+            )
+
+            first_token_time = None
+            async for kind, payload in self.answer_generator.astream_answer(question, retrieval_result.nodes):
+                if kind == "sources":
+                    yield {"event": "sources", "data": {
+                        "sources": payload,
+                        "retrieval_time": retrieval_result.retrieval_time,
+                        "cache_hit": retrieval_result.cache_hit,
+                        "method_used": retrieval_result.method_used
+                    }}
+                elif kind == "token":
+                    if first_token_time is None:
+                        first_token_time = time.time() - start_time
+                    yield {"event": "token", "data": {"delta": payload}}
+                else:
+                    self._remember_answer(question, query_embedding, payload)
+                    response = self._build_response(
+                        question, user_id, include_debug, retrieval_result, payload, start_time
+                    )
+                    response.pop("sources")
+                    response["time_to_first_token"] = first_token_time
+                    if payload.get("error"):
+                        response["error"] = payload["error"]
+                    yield {"event": "final", "data": response}
+
+        except Exception as e:
+            yield {"event": "error", "data": self._error_response(e, question, user_id, start_time)}
+
+    def _batching_stats(self) -> Dict[str, Any]:
+        """微批调度器的队列深度与批大小分布"""
+        stats = {}
+        if self.embed_model is not None and self.embed_model.query_batcher is not None:
+            stats["query_embedding"] = self.embed_model.query_batcher.get_stats()
+        if self.retriever is not None and self.retriever.rerank_batcher is not None:
+            stats["rerank"] = self.retriever.rerank_batcher.get_stats()
+        return stats
 
     def get_system_status(self) -> Dict[str, Any]:
         """获取系统状态"""
@@ -214,6 +758,11 @@ class EnterpriseRAGService:
                     "queries_per_minute": metrics.queries_per_minute,
                     "error_rate": metrics.error_rate
                 },
+                "cache": cache_manager.get_stats(),
+                "batching": self._batching_stats(),
+                "semantic_cache": self.semantic_cache.get_stats() if self.semantic_cache else None,
+                "single_flight": self.single_flight.get_stats() if self.single_flight else None,
+                "llm": self.llm.get_stats() if hasattr(self.llm, "get_stats") else None,
                 "components": {
                     "embed_model": self.embed_model is not None,
                     "llm": self.llm is not None,
@@ -225,17 +774,48 @@ class EnterpriseRAGService:
             logger.log_error(e, {"operation": "get_system_status"})
             return {"status": "error", "error": str(e)}
 
-    def clear_cache(self):
-        """清空缓存"""
+    def clear_cache(self, namespaces: Optional[List[str]] = None):
+        """按命名空间清除缓存（queries / embeddings / expansions / answers），默认全部
+
+        只删除本系统的缓存键，不再 flushdb；answers 为进程内的语义答案缓存。
+        """
+        namespaces = list(namespaces or NAMESPACES + ("answers",))
         try:
-            cache_manager.redis_client.flushdb()
-            logger.logger.info("Cache cleared successfully")
-            return {"success": True}
+            unknown = set(namespaces) - set(NAMESPACES + ("answers",))
+            if unknown:
+                return {"success": False, "error": f"Unknown cache namespaces: {sorted(unknown)}"}
+
+            deleted = cache_manager.invalidate_namespaces([ns for ns in namespaces if ns != "answers"])
+            if "answers" in namespaces and self.semantic_cache is not None:
+                self.semantic_cache.clear()
+            logger.logger.info(f"Cache cleared successfully: {namespaces}")
+            return {"success": True, "namespaces": namespaces, "deleted": deleted}
         except Exception as e:
-            logger.log_error(e, {"operation": "clear_cache"})
+            logger.log_error(e, {"operation": "clear_cache", "namespaces": namespaces})
 # services/rag_service.py (续)
             return {"success": False, "error": str(e)}
 
+    def get_semantic_cache_audit(self) -> Dict[str, Any]:
+        """语义缓存命中率与最近的命中记录（含可疑标记），供人工审计误命中"""
+        if self.semantic_cache is None:
+            return {"enabled": False}
+        return {
+            "enabled": True,
+            "stats": self.semantic_cache.get_stats(),
+            "recent_hits": self.semantic_cache.get_audit_log()
+        }
+
+    def report_semantic_false_hit(self, question: str) -> Dict[str, Any]:
+        """上报误命中，剔除该问题会命中的缓存条目"""
+        if self.semantic_cache is None:
+            return {"success": False, "error": "Semantic cache is disabled"}
+        try:
+            removed = self.semantic_cache.report_false_hit(question, self.embed_model.get_query_embedding(question))
+            return {"success": True, "removed": removed}
+        except Exception as e:
+            logger.log_error(e, {"operation": "report_semantic_false_hit", "query": question})
+            return {"success": False, "error": str(e)}
+
     def export_metrics_to_file(self, filepath: str = "rag_metrics.json"):
         """导出当前指标到文件"""
         metrics_collector.export_metrics(filepath)
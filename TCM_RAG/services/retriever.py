@@ -1,15 +1,22 @@
 # services/retriever.py
 import time
-from typing import List, Dict, Any, Optional
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
 from dataclasses import dataclass
-from llama_index.core.schema import NodeWithScore
-from rank_bm25 import BM25Okapi
+from llama_index.core.schema import NodeWithScore, QueryBundle
+from llama_index.core.vector_stores.types import VectorStoreQuery
 from sentence_transformers import CrossEncoder
+from services.sparse_index import BM25Index, ChineseTokenizer
+from services.field_index import FieldIndex
+from services.docstore import NodeDocstore
+from services.term_dictionary import build_term_dictionary
+from utils.batching import MicroBatcher
 from utils.cache import cache_manager
 from utils.logger import logger
 from config.settings import RetrievalConfig
 import torch
-import json
 
 @dataclass
 class RetrievalResult:
@@ -20,40 +27,140 @@ class RetrievalResult:
     total_candidates: int
 
 
+def build_bm25_index(documents: List, config: RetrievalConfig) -> BM25Index:
+    """按检索配置构建中文BM25倒排索引"""
+    return BM25Index.build(
+        [doc.text for doc in documents],
+        tokenizer=ChineseTokenizer(config.sparse_tokenizer),
+        k1=config.bm25_k1,
+        b=config.bm25_b
+    )
+
+
+def build_field_index(documents: List, config: RetrievalConfig) -> FieldIndex:
+    """构建证型查找表与按字段加权的BM25"""
+    return FieldIndex.build(
+        documents,
+        field_weights=config.field_weights,
+        tokenizer=ChineseTokenizer(config.sparse_tokenizer),
+        k1=config.bm25_k1,
+        b=config.bm25_b
+    )
+
+
+FUSION_MODES = ("union", "rrf", "weighted")
+RERANK_POLICIES = ("always", "adaptive", "never")
+
+
+def _doc_key(result: NodeWithScore) -> str:
+    """文档级标识：密集检索返回分块（ref_doc_id 指向原文档），稀疏检索直接返回原文档"""
+    return result.node.ref_doc_id or result.node.node_id
+
+
 class EnterpriseRetriever:
     def __init__(
             self,
             vector_retriever,
             documents: List,
             rerank_model_path: str,
-            config: RetrievalConfig
+            config: RetrievalConfig,
+            bm25: Optional[BM25Index] = None,
+            field_index: Optional[FieldIndex] = None,
+            embed_model=None,
+            vector_store=None,
+            docstore_max_nodes: int = 50000,
+            reranker=None
     ):
         self.vector_retriever = vector_retriever
+        self.vector_store = vector_store
         self.documents = documents
+        # 缓存只保存 (node_id, score)，命中时从这里还原节点
+        self.docstore = NodeDocstore(documents, vector_store, max_nodes=docstore_max_nodes)
         self.config = config
+        self.embed_model = embed_model
+
+        if config.fusion_mode not in FUSION_MODES:
+            raise ValueError(f"Unknown fusion mode: {config.fusion_mode}, expected one of {FUSION_MODES}")
+        if config.rerank_policy not in RERANK_POLICIES:
+            raise ValueError(f"Unknown rerank policy: {config.rerank_policy}, expected one of {RERANK_POLICIES}")
+
+        # 密集与稀疏检索并行执行（模型推理与numpy计算期间会释放GIL）
+        self._executor = ThreadPoolExecutor(max_workers=config.retrieval_workers, thread_name_prefix="retrieval")
+        # 异步路径中重排（未开启微批时）与查询扩展的专用线程池，限制同时占用重排模型的请求数
+        self._rerank_executor = ThreadPoolExecutor(max_workers=config.rerank_workers, thread_name_prefix="rerank")
+
+        # 初始化BM25（快照模式下直接使用预构建的统计信息）
+        self.bm25 = bm25 or build_bm25_index(documents, config)
+
+        # 初始化字段索引（证型查找、字段加权BM25、可选的字段向量）
+        self.field_index = field_index or build_field_index(documents, config)
+        self.field_index.field_weights = config.field_weights
+        if config.field_embedding_fields and embed_model is not None:
+            self.field_index.build_field_embeddings(documents, embed_model, config.field_embedding_fields)
+
+        # 术语同义词词典（查询扩展的首选来源）
+        self.term_dictionary = build_term_dictionary(documents, config.term_dictionary_path)
+
+        # 初始化重排序模型（也可传入已加载的模型，需提供 predict(pairs, batch_size=...)）
+        if reranker is not None:
+            self.reranker = reranker
+        else:
+            try:
+                self.reranker = CrossEncoder(
+                    rerank_model_path,
+                    device="cuda" if torch.cuda.is_available() else "cpu"
+                )
+                logger.logger.info("Reranker model loaded successfully")
+            except Exception as e:
+                logger.log_error(e, {"model_path": rerank_model_path})
+                raise
+
+        self.rerank_batcher: Optional[MicroBatcher] = None
+
+    def enable_rerank_batching(self, max_batch_pairs: int = 256, max_wait_ms: float = 5.0):
+        """开启跨请求微批：并发请求的重排候选对合并为一次 CrossEncoder.predict"""
+        self.rerank_batcher = MicroBatcher(
+            "rerank",
+            self._predict_pair_groups,
+            max_batch_size=max_batch_pairs,
+            max_wait_ms=max_wait_ms,
+            item_size=len
+        )
 
-        # 初始化BM25
-        self.bm25 = BM25Okapi([doc.text.split() for doc in documents])
-
-        # 初始化重排序模型
-        try:
-            self.reranker = CrossEncoder(
-                rerank_model_path,
-                device="cuda" if torch.cuda.is_available() else "cpu"
-            )
-            logger.logger.info("Reranker model loaded successfully")
-        except Exception as e:
-            logger.log_error(e, {"model_path": rerank_model_path})
-            raise
+    def _predict_pair_groups(self, pair_groups: List[List[tuple]]) -> List[List[float]]:
+        """多个请求的候选对拼成一批打分，再按请求切分"""
+        pairs = [pair for group in pair_groups for pair in group]
+        # 合并后的候选对一次前向计算，batch_size 不小于微批上限，否则 predict 内部会再拆成小批
+        batch_size = max(self.config.batch_size, self.rerank_batcher.max_batch_size if self.rerank_batcher else 0)
+        scores = self.reranker.predict(pairs, batch_size=batch_size)
+        results, start = [], 0
+        for group in pair_groups:
+            results.append([float(score) for score in scores[start:start + len(group)]])
+            start += len(group)
+        return results
+
+    def _predict_pairs(self, pairs: List[tuple]) -> List[float]:
+        if self.rerank_batcher is not None:
+            return self.rerank_batcher(pairs)
+        return self.reranker.predict(pairs, batch_size=self.config.batch_size)
+
+    async def _apredict_pairs(self, pairs: List[tuple]) -> List[float]:
+        """异步打分：开启微批时在事件循环中直接提交并等待，不占用线程池线程，
+        并发请求的候选对都能进入同一批；否则在重排线程池中执行"""
+        if self.rerank_batcher is not None:
+            return await asyncio.wrap_future(self.rerank_batcher.submit(pairs))
+        return await self._arun(self._rerank_executor, self._predict_pairs, pairs)
 
     def _expand_query(self, query: str, llm, max_variants: int = 2) -> List[str]:
-        """查询扩展"""
-        cache_key = f"query_expansion:{query}"
+        """查询扩展：先查术语词典（微秒级），词典没有命中时才调用LLM改写"""
+        expansions = self.term_dictionary.expand(query, max_variants)
+        if len(expansions) > 1 or llm is None or not self.config.llm_expansion_fallback:
+            return expansions
 
         # 检查缓存
-        cached_expansions = cache_manager.redis_client.get(cache_key)
+        cached_expansions = cache_manager.get_query_expansions(query)
         if cached_expansions:
-            return json.loads(cached_expansions)
+            return cached_expansions
 
         prompt = f"""请将以下问题改写为{max_variants}个意思相近但表达不同的中文问法。
         要求：
@@ -72,7 +179,7 @@ class EnterpriseRetriever:
             expansions = [query] + variants[:max_variants]
 
             # 缓存结果
-            cache_manager.redis_client.setex(cache_key, 3600, json.dumps(expansions))
+            cache_manager.cache_query_expansions(query, expansions)
 
             return expansions
 
@@ -80,32 +187,75 @@ class EnterpriseRetriever:
             logger.log_error(e, {"query": query})
             return [query]
 
-    def _dense_retrieve(self, query: str) -> List[NodeWithScore]:
+    def _embed_query(self, query: str) -> Optional[List[float]]:
+        """查询向量只计算一次，供密集检索与字段向量检索共用"""
+        if self.embed_model is None:
+            return None
+        try:
+            return self.embed_model.get_query_embedding(query)
+        except Exception as e:
+            logger.log_error(e, {"query": query, "method": "embed_query"})
+            return None
+
+    def _dense_retrieve(self, query: str, query_embedding: Optional[List[float]] = None) -> List[NodeWithScore]:
         """密集检索"""
         try:
+            if query_embedding is not None:
+                return self.vector_retriever.retrieve(QueryBundle(query_str=query, embedding=query_embedding))
             return self.vector_retriever.retrieve(query)
         except Exception as e:
             logger.log_error(e, {"query": query, "method": "dense_retrieve"})
             return []
 
+    def _dense_retrieve_many(self, queries: List[str]) -> List[List[NodeWithScore]]:
+        """多个查询的密集检索：一次批量编码，向量库支持 query_many 时一次多向量检索，否则并发检索"""
+        if not queries:
+            return []
+        if self.embed_model is None:
+            return list(self._executor.map(self._dense_retrieve, queries))
+
+        try:
+            embeddings = self.embed_model.get_query_embeddings(queries)
+        except Exception as e:
+            logger.log_error(e, {"queries": queries, "method": "embed_queries"})
+            return [[] for _ in queries]
+
+        if self.vector_store is not None and hasattr(self.vector_store, "query_many"):
+            try:
+                results = self.vector_store.query_many([
+                    VectorStoreQuery(query_embedding=embedding, similarity_top_k=self.config.similarity_top_k)
+                    for embedding in embeddings
+                ])
+                return [
+                    [NodeWithScore(node=node, score=score) for node, score in zip(r.nodes, r.similarities)]
+                    for r in results
+                ]
+            except Exception as e:
+                logger.log_error(e, {"queries": queries, "method": "dense_retrieve_many"})
+                return [[] for _ in queries]
+
+        return list(self._executor.map(self._dense_retrieve, queries, embeddings))
+
     def _sparse_retrieve(self, query: str, top_k: int) -> List[NodeWithScore]:
         """稀疏检索（BM25）"""
         try:
-            bm25_scores = self.bm25.get_scores(query.split())
-            top_indices = sorted(
-                range(len(bm25_scores)),
-                key=lambda i: bm25_scores[i],
-                reverse=True
-            )[:top_k * 2]
+            hits = self.bm25.search(query, top_k * 2)
+
+            # 叠加按字段加权的BM25分数
+            if self.config.use_field_sparse:
+                scores = dict(hits)
+                for idx, score in self.field_index.search(query, top_k * 2):
+                    scores[idx] = scores.get(idx, 0.0) + score
+                hits = sorted(scores.items(), key=lambda x: x[1], reverse=True)[:top_k * 2]
 
             results = []
-            for idx in top_indices:
+            for idx, score in hits:
                 if idx < len(self.documents):
                     doc = self.documents[idx]
                     # 创建NodeWithScore对象
                     node_with_score = NodeWithScore(
                         node=doc,
-                        score=float(bm25_scores[idx])
+                        score=score
                     )
                     results.append(node_with_score)
 
@@ -115,25 +265,398 @@ class EnterpriseRetriever:
             logger.log_error(e, {"query": query, "method": "sparse_retrieve"})
             return []
 
-    def _rerank_results(self, query: str, results: List[NodeWithScore]) -> List[NodeWithScore]:
-        """重排序结果"""
+    def _pattern_retrieve(self, query: str) -> List[NodeWithScore]:
+        """整个查询恰为证型名时，按名称查到的记录作为额外候选（参与融合与重排）"""
+        if not self.config.enable_pattern_lookup:
+            return []
+        return [
+            NodeWithScore(node=self.documents[idx], score=1.0)
+            for idx in self.field_index.lookup_pattern(query)[:self.config.similarity_top_k]
+            if idx < len(self.documents)
+        ]
+
+    def _field_dense_retrieve(
+            self,
+            query: str,
+            top_k: int,
+            query_embedding: Optional[List[float]] = None
+    ) -> List[NodeWithScore]:
+        """按字段向量检索"""
+        if not self.field_index.field_embeddings or self.embed_model is None:
+            return []
+        try:
+            if query_embedding is None:
+                query_embedding = self.embed_model.get_query_embedding(query)
+            return [
+                NodeWithScore(node=self.documents[idx], score=score)
+                for idx, score in self.field_index.dense_search(query_embedding, top_k)
+            ]
+        except Exception as e:
+            logger.log_error(e, {"query": query, "method": "field_dense_retrieve"})
+            return []
+
+    def _fuse_results(
+            self,
+            dense_results: List[NodeWithScore],
+            sparse_results: List[NodeWithScore],
+            pattern_results: Optional[List[NodeWithScore]] = None
+    ) -> List[NodeWithScore]:
+        """按 fusion_mode 合并候选并按融合分数降序返回
+
+        融合在文档级进行：同一文档的分块与原文档视为同一候选，保留先出现的（密集检索的分块）。
+        证型名查找的结果作为第三路，与稀疏检索同权。
+        """
+        if self.config.fusion_mode == "rrf":
+            weighted_lists = [(dense_results, 1.0), (sparse_results, 1.0), (pattern_results, 1.0)]
+        else:
+            weighted_lists = [
+                (dense_results, self.config.fusion_dense_weight),
+                (sparse_results, self.config.fusion_sparse_weight),
+                (pattern_results, self.config.fusion_sparse_weight)
+            ]
+
+        fused_scores: Dict[str, float] = {}
+        representatives: Dict[str, NodeWithScore] = {}
+        for results, weight in weighted_lists:
+            if not results:
+                continue
+            if self.config.fusion_mode == "rrf":
+                contributions = [weight / (self.config.rrf_k + rank + 1) for rank in range(len(results))]
+            else:
+                # 两路分数量纲不同（余弦 vs BM25），先各自 min-max 归一化
+                scores = [r.score or 0.0 for r in results]
+                low, high = min(scores), max(scores)
+                span = high - low
+                contributions = [weight * ((s - low) / span if span > 0 else 1.0) for s in scores]
+
+            seen = set()
+            for result, contribution in zip(results, contributions):
+                key = _doc_key(result)
+                if key in seen:  # 同一文档的多个分块只计最高排名
+                    continue
+                seen.add(key)
+                fused_scores[key] = fused_scores.get(key, 0.0) + contribution
+                representatives.setdefault(key, result)
+
+        fused = []
+        for key, result in representatives.items():
+            result.score = fused_scores[key]
+            fused.append(result)
+        return sorted(fused, key=lambda x: x.score, reverse=True)
+
+    def _rankings_agree(self, dense_results: List[NodeWithScore], sparse_results: List[NodeWithScore]) -> bool:
+        """密集与稀疏检索前N个文档的重合比例是否达到阈值"""
+        top_n = self.config.rerank_agreement_top_n
+        dense_top = {_doc_key(r) for r in dense_results[:top_n]}
+        sparse_top = {_doc_key(r) for r in sparse_results[:top_n]}
+        if not dense_top or not sparse_top:
+            return False
+        overlap = len(dense_top & sparse_top) / min(top_n, len(dense_top), len(sparse_top))
+        return overlap >= self.config.rerank_agreement_threshold
+
+    @staticmethod
+    def _dense_scores(dense_results: List[NodeWithScore]) -> Dict[str, float]:
+        """文档级的最高密集检索相似度"""
+        scores: Dict[str, float] = {}
+        for result in dense_results:
+            key = _doc_key(result)
+            scores[key] = max(scores.get(key, float("-inf")), result.score or 0.0)
+        return scores
+
+    def _without_rerank(
+            self,
+            fused_results: List[NodeWithScore],
+            dense_scores: Dict[str, float]
+    ) -> List[NodeWithScore]:
+        """不重排时的结果：保持融合顺序，分数改用密集检索相似度
+
+        RRF分数（约 1/60）与归一化加权分数都不能与重排分数比较，直接返回会被下游当作低置信度
+        或全部通过阈值。密集检索的余弦相似度与重排分数同在 0~1 区间，按同一 score_threshold 过滤；
+        只被稀疏检索召回的文档没有可比分数，不参与返回。
+        """
+        results = []
+        for result in fused_results:
+            score = dense_scores.get(_doc_key(result))
+            if score is None or score < self.config.score_threshold:
+                continue
+            result.score = score
+            results.append(result)
+        return results[:self.config.rerank_top_k]
+
+    def _cap_rerank_candidates(
+            self,
+            results: List[NodeWithScore],
+            score_table: Dict[str, float]
+    ) -> List[NodeWithScore]:
+        """按 max_rerank_pairs 截断：已打分的候选保留，新候选按当前顺序填满剩余额度"""
+        budget = self.config.max_rerank_pairs
+        if budget <= 0:
+            return results
+        remaining = budget - len(score_table)
+        capped = []
+        for result in results:
+            if result.node.node_id in score_table:
+                capped.append(result)
+            elif remaining > 0:
+                capped.append(result)
+                remaining -= 1
+        return capped
+
+    def _pending_pairs(
+            self,
+            query: str,
+            results: List[NodeWithScore],
+            score_table: Dict[str, float]
+    ) -> Tuple[List[NodeWithScore], List[tuple]]:
+        """尚未打分的候选及其（查询, 文本）对"""
+        pending = [result for result in results if result.node.node_id not in score_table]
+        return pending, [(query, result.node.text) for result in pending]
+
+    @staticmethod
+    def _apply_rerank_scores(
+            results: List[NodeWithScore],
+            pending: List[NodeWithScore],
+            scores: List[float],
+            score_table: Dict[str, float]
+    ) -> List[NodeWithScore]:
+        """新分数写回分数表，更新所有候选的分数并排序"""
+        for result, score in zip(pending, scores):
+            score_table[result.node.node_id] = float(score)
+        for result in results:
+            result.score = score_table[result.node.node_id]
+        return sorted(results, key=lambda x: x.score, reverse=True)
+
+    def _rerank_results(
+            self,
+            query: str,
+            results: List[NodeWithScore],
+            score_table: Optional[Dict[str, float]] = None
+    ) -> List[NodeWithScore]:
+        """重排序结果
+
+        score_table 为本次请求内的 node_id -> 重排分数表：已打过分的候选直接复用，
+        只有新候选会送入 CrossEncoder，新分数写回表中。
+        """
         if not results:
             return results
 
+        if score_table is None:
+            score_table = {}
+
         try:
-            pairs = [(query, result.node.text) for result in results]
-            scores = self.reranker.predict(pairs, batch_size=self.config.batch_size)
+            pending, pairs = self._pending_pairs(query, results, score_table)
+            scores = self._predict_pairs(pairs) if pairs else []
+            return self._apply_rerank_scores(results, pending, scores, score_table)
 
-            # 更新分数并排序
-            for result, score in zip(results, scores):
-                result.score = float(score)
+        except Exception as e:
+            logger.log_error(e, {"query": query, "num_results": len(results)})
+            return results
+
+    async def _arerank_results(
+            self,
+            query: str,
+            results: List[NodeWithScore],
+            score_table: Dict[str, float]
+    ) -> List[NodeWithScore]:
+        """_rerank_results 的异步版本"""
+        if not results:
+            return results
 
-            return sorted(results, key=lambda x: x.score, reverse=True)
+        try:
+            pending, pairs = self._pending_pairs(query, results, score_table)
+            scores = await self._apredict_pairs(pairs) if pairs else []
+            return self._apply_rerank_scores(results, pending, scores, score_table)
 
         except Exception as e:
             logger.log_error(e, {"query": query, "num_results": len(results)})
             return results
 
+    def _merge_candidates(
+            self,
+            dense_results: List[NodeWithScore],
+            sparse_results: List[NodeWithScore],
+            debug: bool,
+            pattern_results: List[NodeWithScore]
+    ) -> Tuple[List[NodeWithScore], Dict[str, NodeWithScore], str, Optional[List[NodeWithScore]]]:
+        """合并候选并判断是否跳过重排
+
+        返回 (初始候选, node_id -> 候选, method_used, 跳过重排时的最终结果或 None)
+        """
+        # 融合会改写结果分数，先记下各文档的密集检索相似度，供跳过重排时使用
+        dense_scores = self._dense_scores(dense_results)
+        # 合并候选结果
+        fusion_mode = self.config.fusion_mode
+        if fusion_mode == "union":
+            merged_results = {}
+            for result in pattern_results + dense_results + sparse_results:
+                if result.node.node_id not in merged_results:
+                    merged_results[result.node.node_id] = result
+            initial_results = list(merged_results.values())
+            method_used = "hybrid"
+        else:
+            initial_results = self._fuse_results(dense_results, sparse_results, pattern_results)
+            merged_results = {result.node.node_id: result for result in initial_results}
+            method_used = f"hybrid_{fusion_mode}"
+        if pattern_results:
+            method_used += "_pattern"
+
+        # 重排策略：融合模式下两路排名高度一致时直接采用融合排序（有证型名查找结果时仍需重排）
+        skip_rerank = self.config.rerank_policy == "never" or (
+            self.config.rerank_policy == "adaptive"
+            and fusion_mode != "union"
+            and not pattern_results
+            and self._rankings_agree(dense_results, sparse_results)
+        )
+
+        if skip_rerank:
+            skipped_results = self._without_rerank(initial_results, dense_scores)
+            # adaptive 策略下高分结果不足时仍走重排（及查询扩展）
+            if self.config.rerank_policy == "never" or len(skipped_results) >= self.config.min_good_results:
+                if debug:
+                    logger.logger.info(f"Rerank skipped ({self.config.rerank_policy}), using {fusion_mode} order")
+                return initial_results, merged_results, method_used + "_no_rerank", skipped_results
+
+        return initial_results, merged_results, method_used, None
+
+    def _needs_expansion(self, reranked_results: List[NodeWithScore], debug: bool) -> bool:
+        """初步重排后高分结果不足 min_good_results 时需要查询扩展"""
+        top_scores = [r.score for r in reranked_results[:self.config.rerank_top_k]]
+        good_results_count = sum(1 for score in top_scores if score >= self.config.score_threshold)
+
+        if debug:
+            logger.logger.info(
+                f"Initial rerank: top score = {max(top_scores) if top_scores else 0:.4f}, good results = {good_results_count}")
+        return good_results_count < self.config.min_good_results
+
+    def _expand_candidates(self, query: str, llm, merged_results: Dict[str, NodeWithScore], debug: bool) -> bool:
+        """查询扩展，改写问法的检索结果并入候选；返回是否产生了改写问法"""
+        expanded_queries = self._expand_query(query, llm)
+        if debug:
+            logger.logger.info(f"Triggering query expansion: {expanded_queries[1:]}")
+
+        # 跳过原查询；各改写问法一次批量编码、一次多向量检索
+        for expanded_dense in self._dense_retrieve_many(expanded_queries[1:]):
+            for result in expanded_dense:
+                if result.node.node_id not in merged_results:
+                    merged_results[result.node.node_id] = result
+        return len(expanded_queries) > 1
+
+    def _final_candidates(
+            self,
+            merged_results: Dict[str, NodeWithScore],
+            rerank_scores: Dict[str, float]
+    ) -> List[NodeWithScore]:
+        """最终重排的候选：已打分的在前，超出 max_rerank_pairs 的新候选不参与"""
+        return self._cap_rerank_candidates(
+            [r for r in merged_results.values() if r.node.node_id in rerank_scores]
+            + [r for r in merged_results.values() if r.node.node_id not in rerank_scores],
+            rerank_scores
+        )
+
+    def _filter_reranked(self, final_reranked: List[NodeWithScore]) -> List[NodeWithScore]:
+        """过滤低分结果"""
+        return [r for r in final_reranked if r.score >= self.config.score_threshold][:self.config.rerank_top_k]
+
+    def _rank_candidates(
+            self,
+            query: str,
+            dense_results: List[NodeWithScore],
+            sparse_results: List[NodeWithScore],
+            llm=None,
+            debug: bool = False,
+            pattern_results: Optional[List[NodeWithScore]] = None
+    ) -> Tuple[List[NodeWithScore], int, str]:
+        """融合、重排与查询扩展，返回 (最终结果, 候选总数, method_used)"""
+        initial_results, merged_results, method_used, skipped_results = self._merge_candidates(
+            dense_results, sparse_results, debug, pattern_results or []
+        )
+        if skipped_results is not None:
+            return skipped_results, len(initial_results), method_used
+
+        # 3. 初步重排序检查
+        rerank_scores: Dict[str, float] = {}  # 本次请求的重排分数表，避免扩展后重复打分
+        reranked_results = self._rerank_results(
+            query, self._cap_rerank_candidates(initial_results, rerank_scores), rerank_scores
+        )
+
+        # 4. 查询扩展（如果需要）
+        if self._needs_expansion(reranked_results, debug):
+            if self._expand_candidates(query, llm, merged_results, debug):
+                method_used += "_expanded"
+
+        # 5. 最终重排序（只对查询扩展新增的候选打分）
+        final_results = self._final_candidates(merged_results, rerank_scores)
+        num_scored = len(rerank_scores)
+        final_reranked = self._rerank_results(query, final_results, rerank_scores)
+        if debug:
+            logger.logger.info(
+                f"Final rerank: {len(final_results)} candidates, "
+                f"{len(rerank_scores) - num_scored} newly scored")
+
+        return self._filter_reranked(final_reranked), len(final_results), method_used
+
+    async def _arank_candidates(
+            self,
+            query: str,
+            dense_results: List[NodeWithScore],
+            sparse_results: List[NodeWithScore],
+            llm=None,
+            debug: bool = False,
+            pattern_results: Optional[List[NodeWithScore]] = None
+    ) -> Tuple[List[NodeWithScore], int, str]:
+        """_rank_candidates 的异步版本：重排在事件循环中等待（开启微批时直接提交到调度器），
+        查询扩展（LLM改写与检索）在重排线程池中执行
+        """
+        initial_results, merged_results, method_used, skipped_results = self._merge_candidates(
+            dense_results, sparse_results, debug, pattern_results or []
+        )
+        if skipped_results is not None:
+            return skipped_results, len(initial_results), method_used
+
+        rerank_scores: Dict[str, float] = {}
+        reranked_results = await self._arerank_results(
+            query, self._cap_rerank_candidates(initial_results, rerank_scores), rerank_scores
+        )
+
+        if self._needs_expansion(reranked_results, debug):
+            if await self._arun(self._rerank_executor, self._expand_candidates, query, llm, merged_results, debug):
+                method_used += "_expanded"
+
+        final_results = self._final_candidates(merged_results, rerank_scores)
+        num_scored = len(rerank_scores)
+        final_reranked = await self._arerank_results(query, final_results, rerank_scores)
+        if debug:
+            logger.logger.info(
+                f"Final rerank: {len(final_results)} candidates, "
+                f"{len(rerank_scores) - num_scored} newly scored")
+
+        return self._filter_reranked(final_reranked), len(final_results), method_used
+
+    def _to_cache_refs(self, results: List[NodeWithScore]) -> List[Tuple[str, float]]:
+        self.docstore.add([result.node for result in results])
+        return [(result.node.node_id, result.score) for result in results]
+
+    def _rehydrate(self, refs: Optional[List[Tuple[str, float]]]) -> Optional[List[NodeWithScore]]:
+        """由缓存的 (node_id, score) 还原检索结果，节点无法还原时视为未命中"""
+        if not refs:
+            return None
+        nodes = self.docstore.get_many([node_id for node_id, _ in refs])
+        if nodes is None:
+            return None
+        return [NodeWithScore(node=node, score=score) for node, (_, score) in zip(nodes, refs)]
+
+    def _cached_retrieval_result(self, query: str, cached_result: List[NodeWithScore], start_time: float) -> RetrievalResult:
+        retrieval_time = time.time() - start_time
+        logger.log_retrieval(query, len(cached_result), retrieval_time)
+
+        return RetrievalResult(
+            nodes=cached_result,
+            retrieval_time=retrieval_time,
+            cache_hit=True,
+            method_used="cache",
+            total_candidates=len(cached_result)
+        )
+
     def hybrid_retrieve(
             self,
             query: str,
@@ -143,92 +666,129 @@ class EnterpriseRetriever:
     ) -> RetrievalResult:
         """混合检索"""
         start_time = time.time()
-        cache_hit = False
 
         # 检查缓存
         if use_cache:
-            cached_result = cache_manager.get_query_results(query)
+            cached_result = self._rehydrate(cache_manager.get_query_results(query))
             if cached_result:
-                cache_hit = True
-                retrieval_time = time.time() - start_time
-                logger.log_retrieval(query, len(cached_result), retrieval_time)
-
-                return RetrievalResult(
-                    nodes=cached_result,
-                    retrieval_time=retrieval_time,
-                    cache_hit=True,
-                    method_used="cache",
-                    total_candidates=len(cached_result)
-                )
+                return self._cached_retrieval_result(query, cached_result, start_time)
 
-        # 合并候选结果
-        merged_results = {}
+        # 2. 稀疏检索在后台线程执行，与密集检索并行
+        sparse_future = self._executor.submit(self._sparse_retrieve, query, self.config.similarity_top_k)
 
         # 1. 密集检索
-        dense_results = self._dense_retrieve(query)
+        query_embedding = self._embed_query(query)
+        dense_results = self._dense_retrieve(query, query_embedding)
         if debug:
             logger.logger.info(f"Dense retrieval: {len(dense_results)} results")
 
-        for result in dense_results:
-            merged_results[result.node.node_id] = result
+        # 字段向量检索（配置了 field_embedding_fields 时），与密集检索结果一起参与融合
+        dense_results = dense_results + self._field_dense_retrieve(
+            query, self.config.similarity_top_k, query_embedding
+        )
 
-        # 2. 稀疏检索
-        sparse_results = self._sparse_retrieve(query, self.config.similarity_top_k)
+        sparse_results = sparse_future.result()
+        pattern_results = self._pattern_retrieve(query)
         if debug:
-            logger.logger.info(f"Sparse retrieval: {len(sparse_results)} results")
+            logger.logger.info(f"Sparse retrieval: {len(sparse_results)} results, pattern lookup: {len(pattern_results)}")
 
-        for result in sparse_results:
-            if result.node.node_id not in merged_results:
-                merged_results[result.node.node_id] = result
+        filtered_results, total_candidates, method_used = self._rank_candidates(
+            query, dense_results, sparse_results, llm, debug, pattern_results
+        )
 
-        # 3. 初步重排序检查
-        initial_results = list(merged_results.values())
-        reranked_results = self._rerank_results(query, initial_results)
+        retrieval_time = time.time() - start_time
 
-        top_scores = [r.score for r in reranked_results[:self.config.rerank_top_k]]
-        good_results_count = sum(1 for score in top_scores if score >= self.config.score_threshold)
+        # 缓存结果
+        if use_cache and filtered_results:
+            cache_manager.cache_query_results(query, self._to_cache_refs(filtered_results))
 
+        logger.log_retrieval(query, len(filtered_results), retrieval_time)
+
+        return RetrievalResult(
+            nodes=filtered_results,
+            retrieval_time=retrieval_time,
+            cache_hit=False,
+            method_used=method_used,
+            total_candidates=total_candidates
+        )
+
+    # ===== 异步检索 =====
+
+    async def _arun(self, executor: ThreadPoolExecutor, func, *args):
+        """在指定的有界线程池中执行阻塞调用，不占用事件循环"""
+        return await asyncio.get_running_loop().run_in_executor(executor, functools.partial(func, *args))
+
+    async def aembed_query(self, query: str) -> Optional[List[float]]:
+        """计算查询向量：开启微批时在事件循环中提交到调度器，否则在检索线程池中执行"""
+        if getattr(self.embed_model, "query_batcher", None) is None:
+            return await self._arun(self._executor, self._embed_query, query)
+        try:
+            return await self.embed_model.aget_query_embedding(query)
+        except Exception as e:
+            logger.log_error(e, {"query": query, "method": "aembed_query"})
+            return None
+
+    async def _adense_retrieve(self, query: str, query_embedding: Optional[List[float]]) -> List[NodeWithScore]:
+        """异步密集检索：已有查询向量时直接走向量库的异步查询接口"""
+        if query_embedding is None:
+            return await self._arun(self._executor, self._dense_retrieve, query)
+        try:
+            return await self.vector_retriever.aretrieve(QueryBundle(query_str=query, embedding=query_embedding))
+        except Exception as e:
+            logger.log_error(e, {"query": query, "method": "adense_retrieve"})
+            return []
+
+    async def ahybrid_retrieve(
+            self,
+            query: str,
+            llm=None,
+            use_cache: bool = True,
+            debug: bool = False
+    ) -> RetrievalResult:
+        """混合检索的异步版本：Redis与向量库使用异步I/O，模型计算在有界线程池中执行"""
+        start_time = time.time()
+
+        if use_cache:
+            cached_refs = await cache_manager.aget_query_results(query)
+            # 本进程未登记的节点需向向量库取回，放到线程池中执行
+            cached_result = await self._arun(self._executor, self._rehydrate, cached_refs) if cached_refs else None
+            if cached_result:
+                return self._cached_retrieval_result(query, cached_result, start_time)
+
+        sparse_task = asyncio.ensure_future(
+            self._arun(self._executor, self._sparse_retrieve, query, self.config.similarity_top_k)
+        )
+
+        query_embedding = await self.aembed_query(query)
+        dense_results = await self._adense_retrieve(query, query_embedding)
+        if self.field_index.field_embeddings:
+            dense_results = dense_results + await self._arun(
+                self._executor, self._field_dense_retrieve, query, self.config.similarity_top_k, query_embedding
+            )
         if debug:
-            logger.logger.info(
-                f"Initial rerank: top score = {max(top_scores) if top_scores else 0:.4f}, good results = {good_results_count}")
+            logger.logger.info(f"Dense retrieval: {len(dense_results)} results")
 
-        # 4. 查询扩展（如果需要）
-        method_used = "hybrid"
-        if good_results_count < self.config.min_good_results and llm:
-            if debug:
-                logger.logger.info("Triggering query expansion...")
-
-            method_used = "hybrid_expanded"
-            expanded_queries = self._expand_query(query, llm)
-
-            for expanded_query in expanded_queries[1:]:  # 跳过原查询
-                expanded_dense = self._dense_retrieve(expanded_query)
-                for result in expanded_dense:
-                    if result.node.node_id not in merged_results:
-                        merged_results[result.node.node_id] = result
-
-        # 5. 最终重排序
-        final_results = list(merged_results.values())
-        final_reranked = self._rerank_results(query, final_results)
-
-        # 过滤低分结果
-        filtered_results = [
-                               r for r in final_reranked
-                               if r.score >= self.config.score_threshold
-                           ][:self.config.rerank_top_k]
+        sparse_results = await sparse_task
+        pattern_results = self._pattern_retrieve(query)
+        if debug:
+            logger.logger.info(f"Sparse retrieval: {len(sparse_results)} results, pattern lookup: {len(pattern_results)}")
+
+        # 重排在事件循环中等待，查询扩展在独立的重排线程池中执行（其内部可再使用检索线程池，不会互相等待）
+        filtered_results, total_candidates, method_used = await self._arank_candidates(
+            query, dense_results, sparse_results, llm, debug, pattern_results
+        )
 
         retrieval_time = time.time() - start_time
 
-        # 缓存结果
         if use_cache and filtered_results:
-            cache_manager.cache_query_results(query, filtered_results)
+            await cache_manager.acache_query_results(query, self._to_cache_refs(filtered_results))
 
         logger.log_retrieval(query, len(filtered_results), retrieval_time)
 
         return RetrievalResult(
             nodes=filtered_results,
             retrieval_time=retrieval_time,
-            cache_hit=cache_hit,
+            cache_hit=False,
             method_used=method_used,
-            total_candidates=len(final_results)
+            total_candidates=total_candidates
         )
@@ -0,0 +1,185 @@
+# services/semantic_cache.py
+import time
+import threading
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple, Callable
+
+import numpy as np
+from utils.logger import logger
+
+
+@dataclass
+class CachedAnswer:
+    question: str
+    answer: Dict[str, Any]  # answer / sources / confidence / context_used
+    expires_at: float
+    terms: Tuple[str, ...] = ()  # 关键术语签名
+
+
+def _bigrams(text: str) -> set:
+    text = "".join(text.split())
+    return {text[i:i + 2] for i in range(len(text) - 1)} or {text}
+
+
+def lexical_overlap(a: str, b: str) -> float:
+    """字二元组Jaccard相似度，用于标记语义命中中字面差异过大的可疑样本"""
+    x, y = _bigrams(a), _bigrams(b)
+    return len(x & y) / len(x | y) if x | y else 1.0
+
+
+class SemanticAnswerCache:
+    """语义答案缓存
+
+    保存最近回答过的问题向量（归一化后按行存放在环形矩阵中），新问题与之做内积，
+    相似度不低于阈值、且关键术语签名（term_fn，如证型、药名的规范名和否定/方向词）完全一致时
+    直接复用已生成的答案和来源，不再调用LLM。句向量对“肾阴虚/肾阳虚”“能吃/不能吃”这类
+    一字之差不敏感，签名不同的相近问题不命中，并作为可疑记录写入审计队列；命中记录同样写入，
+    字面重合度过低的标记为可疑。人工确认的误命中可通过 report_false_hit 上报并剔除对应条目。
+    """
+
+    def __init__(
+            self,
+            dim: int,
+            threshold: float = 0.95,
+            max_entries: int = 5000,
+            ttl: int = 3600,
+            audit_size: int = 200,
+            suspect_overlap: float = 0.3,
+            term_fn: Optional[Callable[[str], Tuple[str, ...]]] = None
+    ):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.suspect_overlap = suspect_overlap
+        self.term_fn = term_fn or (lambda question: ())
+
+        self._matrix = np.zeros((max_entries, dim), dtype=np.float32)
+        self._expires_at = np.full(max_entries, -np.inf)  # 空位与过期条目在检索时被屏蔽
+        self._entries: List[Optional[CachedAnswer]] = [None] * max_entries
+        self._next = 0
+        self._lock = threading.Lock()
+
+        self.audit_log = deque(maxlen=audit_size)
+        self._stats = {
+            "lookups": 0, "hits": 0, "suspect_hits": 0, "term_mismatches": 0, "false_hit_reports": 0, "stores": 0
+        }
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def _best_match(self, vector: np.ndarray) -> Tuple[int, float]:
+        scores = self._matrix @ vector
+        scores[self._expires_at < time.time()] = -np.inf
+        slot = int(np.argmax(scores))
+        return slot, float(scores[slot])
+
+    def _match(self, vector: np.ndarray, terms: Tuple[str, ...]) -> Tuple[Optional[int], float, Optional[int]]:
+        """返回 (命中位置, 相似度, 相似度最高但术语签名不同的位置)：按相似度降序取第一个签名一致的条目"""
+        scores = self._matrix @ vector
+        scores[self._expires_at < time.time()] = -np.inf
+        slots = np.flatnonzero(scores >= self.threshold)
+        mismatch = None
+        for slot in slots[np.argsort(-scores[slots])]:
+            slot = int(slot)
+            if self._entries[slot].terms == terms:
+                return slot, float(scores[slot]), mismatch
+            if mismatch is None:
+                mismatch = slot
+        return None, float(scores[mismatch]) if mismatch is not None else 0.0, mismatch
+
+    def lookup(self, question: str, embedding: List[float]) -> Optional[Dict[str, Any]]:
+        """命中时返回缓存的答案（附带 matched_question 与 similarity），否则返回 None"""
+        vector = self._normalize(embedding)
+        terms = self.term_fn(question)
+        with self._lock:
+            self._stats["lookups"] += 1
+            slot, similarity, mismatch = self._match(vector, terms)
+            if slot is None and mismatch is None:
+                return None
+
+            entry = self._entries[mismatch if slot is None else slot]
+            overlap = lexical_overlap(question, entry.question)
+            differing_terms = sorted(set(terms) ^ set(entry.terms)) if slot is None else []
+            suspect = slot is None or overlap < self.suspect_overlap
+            if slot is None:
+                self._stats["term_mismatches"] += 1
+            else:
+                self._stats["hits"] += 1
+                self._stats["suspect_hits"] += int(suspect)
+            self.audit_log.append({
+                "timestamp": datetime.now().isoformat(),
+                "question": question,
+                "matched_question": entry.question,
+                "similarity": similarity,
+                "lexical_overlap": overlap,
+                "differing_terms": differing_terms,
+                "served": slot is not None,
+                "suspect": suspect
+            })
+
+        if slot is None:
+            logger.logger.warning(
+                f"Semantic cache candidate rejected, key terms differ: '{question}' vs '{entry.question}' "
+                f"(similarity={similarity:.4f}, differing={differing_terms})"
+            )
+            return None
+        if suspect:
+            logger.logger.warning(
+                f"Suspect semantic cache hit: '{question}' -> '{entry.question}' "
+                f"(similarity={similarity:.4f}, overlap={overlap:.2f})"
+            )
+        return dict(entry.answer, matched_question=entry.question, similarity=similarity)
+
+    def store(self, question: str, embedding: List[float], answer: Dict[str, Any]):
+        vector = self._normalize(embedding)
+        terms = self.term_fn(question)
+        with self._lock:
+            # 相同问题覆盖原条目，否则写入环形缓冲区的下一个位置
+            slot, similarity = self._best_match(vector)
+            if not (similarity >= 0.9999 and self._entries[slot].question == question):
+                slot = self._next
+                self._next = (self._next + 1) % self.max_entries
+            self._matrix[slot] = vector
+            self._entries[slot] = CachedAnswer(question, answer, time.time() + self.ttl, terms)
+            self._expires_at[slot] = self._entries[slot].expires_at
+            self._stats["stores"] += 1
+
+    def report_false_hit(self, question: str, embedding: List[float]) -> bool:
+        """上报误命中：剔除该问题当前会命中的条目"""
+        vector = self._normalize(embedding)
+        terms = self.term_fn(question)
+        with self._lock:
+            slot, _, _ = self._match(vector, terms)
+            if slot is None:
+                return False
+            logger.logger.info(
+                f"Semantic cache false hit reported: '{question}' -> '{self._entries[slot].question}'"
+            )
+            self._entries[slot] = None
+            self._matrix[slot] = 0.0
+            self._expires_at[slot] = -np.inf
+            self._stats["false_hit_reports"] += 1
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._entries = [None] * self.max_entries
+            self._matrix[:] = 0.0
+            self._expires_at[:] = -np.inf
+            self._next = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = int(np.sum(self._expires_at >= time.time()))
+        stats["hit_rate"] = stats["hits"] / stats["lookups"] if stats["lookups"] else 0.0
+        stats["threshold"] = self.threshold
+        return stats
+
+    def get_audit_log(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self.audit_log)
@@ -0,0 +1,195 @@
+# services/sparse_index.py
+import re
+import json
+from collections import Counter
+from pathlib import Path
+from typing import List, Tuple, Dict, Optional
+
+import numpy as np
+from utils.logger import logger
+
+try:
+    import jieba
+except ImportError:  # jieba为可选依赖，缺失时仅使用字二元组
+    jieba = None
+
+
+_TOKEN_PATTERN = re.compile(r"[一-鿿]+|[a-zA-Z0-9]+")
+_CJK_PATTERN = re.compile(r"[一-鿿]+")
+
+
+class ChineseTokenizer:
+    """中文分词器，支持三种模式：
+    - bigram：汉字二元组（无需词典，对专业术语召回稳定）
+    - jieba：jieba搜索引擎模式分词
+    - jieba+bigram：两者并集
+    非中文部分按字母数字串切分并转为小写。
+    """
+
+    MODES = ("bigram", "jieba", "jieba+bigram")
+
+    def __init__(self, mode: str = "bigram"):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown tokenizer mode: {mode}, expected one of {self.MODES}")
+        if "jieba" in mode and jieba is None:
+            logger.logger.warning("jieba is not installed, sparse tokenizer falls back to bigram")
+            mode = "bigram"
+        self.mode = mode
+
+    @staticmethod
+    def _bigrams(run: str) -> List[str]:
+        if len(run) == 1:
+            return [run]
+        return [run[i:i + 2] for i in range(len(run) - 1)]
+
+    def __call__(self, text: str) -> List[str]:
+        tokens = []
+        for match in _TOKEN_PATTERN.finditer(text.lower()):
+            piece = match.group()
+            if not _CJK_PATTERN.fullmatch(piece):
+                tokens.append(piece)
+                continue
+            if "jieba" in self.mode:
+                tokens.extend(w for w in jieba.lcut_for_search(piece) if len(w) > 1 or len(piece) == 1)
+            if "bigram" in self.mode:
+                tokens.extend(self._bigrams(piece))
+        return tokens
+
+
+class BM25Index:
+    """基于倒排表的BM25引擎
+
+    倒排表以CSR格式存储：词项 term_id 的倒排为 doc_ids[indptr[t]:indptr[t+1]]，
+    impacts 为预先计算好的 tf*(k1+1)/(tf+k1*(1-b+b*dl/avgdl))，查询时只需乘以idf，
+    只访问包含查询词的文档，Top-K用 argpartition 部分选择。
+    """
+
+    FORMAT_VERSION = 1
+
+    def __init__(
+            self,
+            vocab: Dict[str, int],
+            indptr: np.ndarray,
+            doc_ids: np.ndarray,
+            impacts: np.ndarray,
+            idf: np.ndarray,
+            num_docs: int,
+            tokenizer: ChineseTokenizer,
+            k1: float = 1.5,
+            b: float = 0.75
+    ):
+        self.vocab = vocab
+        self.indptr = indptr
+        self.doc_ids = doc_ids
+        self.impacts = impacts
+        self.idf = idf
+        self.num_docs = num_docs
+        self.tokenizer = tokenizer
+        self.k1 = k1
+        self.b = b
+
+    @classmethod
+    def build(
+            cls,
+            texts: List[str],
+            tokenizer: Optional[ChineseTokenizer] = None,
+            k1: float = 1.5,
+            b: float = 0.75
+    ) -> "BM25Index":
+        """从文本列表构建倒排索引，文档序号即列表下标"""
+        tokenizer = tokenizer or ChineseTokenizer()
+        vocab: Dict[str, int] = {}
+        postings: List[List[Tuple[int, int]]] = []
+        doc_len = np.zeros(len(texts), dtype=np.float32)
+
+        for doc_idx, text in enumerate(texts):
+            counts = Counter(tokenizer(text))
+            doc_len[doc_idx] = sum(counts.values())
+            for term, tf in counts.items():
+                term_id = vocab.get(term)
+                if term_id is None:
+                    term_id = vocab[term] = len(postings)
+                    postings.append([])
+                postings[term_id].append((doc_idx, tf))
+
+        num_docs = len(texts)
+        avgdl = float(doc_len.mean()) if num_docs else 0.0
+        norm = k1 * (1 - b + b * doc_len / avgdl) if avgdl > 0 else np.full(num_docs, k1, dtype=np.float32)
+
+        indptr = np.zeros(len(postings) + 1, dtype=np.int64)
+        for term_id, plist in enumerate(postings):
+            indptr[term_id + 1] = indptr[term_id] + len(plist)
+
+        doc_ids = np.empty(indptr[-1], dtype=np.int32)
+        tfs = np.empty(indptr[-1], dtype=np.float32)
+        for term_id, plist in enumerate(postings):
+            start = indptr[term_id]
+            for offset, (doc_idx, tf) in enumerate(plist):
+                doc_ids[start + offset] = doc_idx
+                tfs[start + offset] = tf
+
+        impacts = (tfs * (k1 + 1) / (tfs + norm[doc_ids])).astype(np.float32)
+        df = np.diff(indptr).astype(np.float64)
+        idf = np.log(1.0 + (num_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+
+        logger.logger.info(f"BM25 index built: {num_docs} docs, {len(vocab)} terms, {len(doc_ids)} postings")
+        return cls(vocab, indptr, doc_ids, impacts, idf, num_docs, tokenizer, k1, b)
+
+    def search(self, query: str, top_k: int) -> List[Tuple[int, float]]:
+        """返回 [(文档序号, 分数)]，按分数降序"""
+        term_counts = Counter(t for t in self.tokenizer(query) if t in self.vocab)
+        if not term_counts or top_k <= 0:
+            return []
+
+        doc_parts, score_parts = [], []
+        for term, qtf in term_counts.items():
+            term_id = self.vocab[term]
+            start, end = self.indptr[term_id], self.indptr[term_id + 1]
+            doc_parts.append(self.doc_ids[start:end])
+            score_parts.append(self.impacts[start:end] * (self.idf[term_id] * qtf))
+
+        if len(doc_parts) == 1:
+            docs, scores = doc_parts[0], score_parts[0]
+        else:
+            docs, inverse = np.unique(np.concatenate(doc_parts), return_inverse=True)
+            scores = np.bincount(inverse, weights=np.concatenate(score_parts))
+
+        k = min(top_k, len(docs))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(docs[i]), float(scores[i])) for i in top]
+
+    def save(self, path: str):
+        """保存为 npz（倒排数组）+ json（词表与参数）"""
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        np.savez(path / "postings.npz", indptr=self.indptr, doc_ids=self.doc_ids, impacts=self.impacts, idf=self.idf)
+        with open(path / "vocab.json", "w", encoding="utf-8") as f:
+            json.dump({
+                "format_version": self.FORMAT_VERSION,
+                "num_docs": self.num_docs,
+                "k1": self.k1,
+                "b": self.b,
+                "tokenizer": self.tokenizer.mode,
+                "vocab": self.vocab
+            }, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        path = Path(path)
+        with open(path / "vocab.json", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("format_version") != cls.FORMAT_VERSION:
+            raise ValueError(f"Unsupported BM25 index format: {meta.get('format_version')}")
+        arrays = np.load(path / "postings.npz")
+        return cls(
+            vocab=meta["vocab"],
+            indptr=arrays["indptr"],
+            doc_ids=arrays["doc_ids"],
+            impacts=arrays["impacts"],
+            idf=arrays["idf"],
+            num_docs=meta["num_docs"],
+            tokenizer=ChineseTokenizer(meta["tokenizer"]),
+            k1=meta["k1"],
+            b=meta["b"]
+        )
@@ -0,0 +1,239 @@
+# services/term_dictionary.py
+import os
+import re
+import json
+import argparse
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Tuple
+
+from services.document_processor import FIELDS_METADATA_KEY
+from services.field_index import PATTERN_FIELD, PATTERN_SUFFIXES, normalize_pattern
+from utils.logger import logger
+
+
+MIN_TERM_LENGTH = 2  # 单字术语（如“咳”）误匹配太多，不参与查找
+# 否定与变化方向词：只差这些词的两个问题答案往往相反（“能吃”/“不能吃”，“加重”/“减轻”）
+POLARITY_TOKENS = (
+    "加重", "减轻", "缓解", "好转", "恶化", "增多", "减少", "升高", "降低",
+    "不", "没", "无", "未", "非", "别", "勿", "忌", "禁"
+)
+_TERM_RE = re.compile(r"^[一-鿿]{2,12}$")
+
+
+def _pattern_stem(term: str) -> str:
+    """去掉证型后缀：“风湿困表证” / “风湿困表型” -> “风湿困表”"""
+    return term[:-1] if len(term) > 2 and term.endswith(PATTERN_SUFFIXES) else term
+
+
+class TermDictionary:
+    """TCM术语同义词与规范化词典，用于离线查询扩展
+
+    每组同义词的第一个为规范名（症状、证型、药名、方名）。扩展时在查询中做最长匹配
+    （不重叠），把命中的术语依次替换为同组的其他说法生成改写问法，纯字典查找，无需调用LLM。
+    词典来源：随代码提供的种子词典 + 从语料证型字段挖掘的名称变体，可用本模块的命令行
+    离线调用LLM补充同义词。
+    """
+
+    def __init__(self, groups: Optional[List[Dict[str, Any]]] = None):
+        self.groups: List[Dict[str, Any]] = []
+        self._lookup: Dict[str, int] = {}
+        self._lengths: List[int] = []  # 术语长度，降序
+        for group in groups or []:
+            self.add_group(group["terms"], group.get("type", "term"))
+
+    def add_group(self, terms: List[str], term_type: str = "term") -> int:
+        """加入一组同义词；与已有组有交集时合并到已有组，返回组序号"""
+        terms = [normalize_pattern(term) for term in terms]
+        terms = [term for term in dict.fromkeys(terms) if len(term) >= MIN_TERM_LENGTH]
+        if not terms:
+            return -1
+
+        existing = [self._lookup[term] for term in terms if term in self._lookup]
+        if existing:
+            group_idx = existing[0]
+            group_terms = self.groups[group_idx]["terms"]
+            group_terms.extend(term for term in terms if term not in group_terms)
+        else:
+            group_idx = len(self.groups)
+            self.groups.append({"type": term_type, "terms": terms})
+
+        for term in self.groups[group_idx]["terms"]:
+            self._lookup.setdefault(term, group_idx)
+            if len(term) not in self._lengths:
+                self._lengths = sorted(self._lengths + [len(term)], reverse=True)
+        return group_idx
+
+    def mine_documents(self, documents: List[Any]) -> int:
+        """从语料的证型字段挖掘名称变体：“风湿困表证” / “风湿困表” / “风湿困表型”
+
+        这些变体只用于术语识别与规范化，扩展时不会作为改写问法（见 expand）。
+        """
+        before = len(self._lookup)
+        for doc in documents:
+            pattern = normalize_pattern((doc.metadata.get(FIELDS_METADATA_KEY) or {}).get(PATTERN_FIELD, ""))
+            if not pattern:
+                continue
+            stem = _pattern_stem(pattern)
+            self.add_group([stem] + [stem + suffix for suffix in PATTERN_SUFFIXES], "pattern")
+        return len(self._lookup) - before
+
+    def match(self, query: str) -> List[Tuple[int, int, int]]:
+        """查询中出现的术语：[(起始位置, 结束位置, 组序号)]，最长匹配优先，不重叠"""
+        text = normalize_pattern(query)
+        covered = [False] * len(text)
+        matches = []
+        for length in self._lengths:
+            for start in range(len(text) - length + 1):
+                if any(covered[start:start + length]):
+                    continue
+                group_idx = self._lookup.get(text[start:start + length])
+                if group_idx is not None:
+                    matches.append((start, start + length, group_idx))
+                    covered[start:start + length] = [True] * length
+        return sorted(matches)
+
+    def normalize(self, query: str) -> str:
+        """术语替换为规范名"""
+        text = normalize_pattern(query)
+        return self._rewrite(text, [(start, end, self.groups[g]["terms"][0]) for start, end, g in self.match(text)])
+
+    def key_terms(self, query: str) -> Tuple[str, ...]:
+        """问题的关键术语签名：命中术语的规范名 + 术语以外的否定/方向词，排序后返回
+
+        “肾阴虚怎么调理” 与 “肾阴不足怎么调理” 签名相同；与 “肾阳虚怎么调理”、
+        “孕妇能吃当归吗” 与 “孕妇不能吃当归吗” 的签名不同。术语内部的字（如“不寐”的“不”）不计入。
+        """
+        text = normalize_pattern(query)
+        matches = self.match(text)
+        terms = [self.groups[group_idx]["terms"][0] for _, _, group_idx in matches]
+        rest = self._rewrite(text, [(start, end, "|") for start, end, _ in matches])
+        for token in POLARITY_TOKENS:  # 双字词在前，先取出，避免其中的字再被单独计数
+            terms.extend([token] * rest.count(token))
+            rest = rest.replace(token, "|")
+        return tuple(sorted(terms))
+
+    @staticmethod
+    def _rewrite(text: str, replacements: List[Tuple[int, int, str]]) -> str:
+        parts, last = [], 0
+        for start, end, term in replacements:
+            parts.append(text[last:start])
+            parts.append(term)
+            last = end
+        parts.append(text[last:])
+        return "".join(parts)
+
+    def expand(self, query: str, max_variants: int = 2) -> List[str]:
+        """返回 [原查询, 改写1, 改写2, ...]；没有可替换的术语时只返回原查询
+
+        只差证型后缀的说法（“肾虚” / “肾虚证” / “肾虚型”）检索结果几乎相同，不作为改写；
+        命中的术语都只有这类变体时视为未命中，由调用方决定是否改用LLM改写。
+        """
+        text = normalize_pattern(query)
+        matches = self.match(text)
+        alternatives = []
+        for start, end, group_idx in matches:
+            stem = _pattern_stem(text[start:end])
+            others = [term for term in self.groups[group_idx]["terms"] if _pattern_stem(term) != stem]
+            if others:
+                alternatives.append((start, end, others))
+        if not alternatives:
+            return [query]
+
+        # 第 i 个改写把每个命中术语替换为同组的第 i 个其他说法（不足时循环使用）
+        variants = []
+        for i in range(max(len(others) for _, _, others in alternatives)):
+            variant = self._rewrite(text, [(start, end, others[i % len(others)]) for start, end, others in alternatives])
+            if variant != text and variant not in variants:
+                variants.append(variant)
+            if len(variants) >= max_variants:
+                break
+        return [query] + variants
+
+    def __len__(self) -> int:
+        return len(self._lookup)
+
+    def save(self, path: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "groups": self.groups}, f, ensure_ascii=False, indent=2)
+
+    @classmethod
+    def load(cls, path: str) -> "TermDictionary":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f)["groups"])
+
+
+def build_term_dictionary(documents: List[Any], path: Optional[str]) -> TermDictionary:
+    """加载词典文件（不存在时为空）并合并从语料挖掘的证型名称变体"""
+    if path and os.path.exists(path):
+        dictionary = TermDictionary.load(path)
+    else:
+        if path:
+            logger.logger.warning(f"Term dictionary not found: {path}, using corpus-mined terms only")
+        dictionary = TermDictionary()
+    mined = dictionary.mine_documents(documents)
+    logger.logger.info(f"Term dictionary loaded: {len(dictionary.groups)} groups, {len(dictionary)} terms ({mined} mined)")
+    return dictionary
+
+
+def _llm_synonyms(llm, term: str, max_synonyms: int) -> List[str]:
+    prompt = f"""请列出与中医术语“{term}”含义相同的其他术语或常用说法，最多{max_synonyms}个。
+    要求：
+    1. 每行一个
+    2. 只输出术语本身，不要编号和解释
+
+    同义说法："""
+    response = llm.complete(prompt)
+    synonyms = []
+    for line in response.text.split("\n"):
+        line = line.strip().lstrip("-•·0123456789.、 ").strip()
+        if _TERM_RE.match(line) and line != term:
+            synonyms.append(line)
+    return synonyms[:max_synonyms]
+
+
+def main():
+    """离线构建术语词典：种子词典 + 语料挖掘，可选用LLM为每组补充同义说法
+
+    python -m services.term_dictionary --data-dir data --output config/tcm_terms.json --extend-with-llm
+    """
+    from config.settings import Settings
+    from services.document_processor import DocumentProcessor
+
+    settings = Settings()
+    parser = argparse.ArgumentParser(description="构建TCM术语同义词词典")
+    parser.add_argument("--data-dir", default=settings.app.data_dir)
+    parser.add_argument("--input", default=settings.retrieval.term_dictionary_path, help="种子词典")
+    parser.add_argument("--output", default=settings.retrieval.term_dictionary_path)
+    parser.add_argument("--extend-with-llm", action="store_true", help="调用LLM为同义词不足的组补充说法")
+    parser.add_argument("--min-terms", type=int, default=3, help="少于该数量的组才请求LLM补充")
+    args = parser.parse_args()
+
+    os.makedirs("logs", exist_ok=True)
+    documents = DocumentProcessor(
+        chunk_size=settings.retrieval.chunk_size,
+        chunk_overlap=settings.retrieval.chunk_overlap
+    ).process_directory(args.data_dir)
+    dictionary = build_term_dictionary(documents, args.input)
+
+    if args.extend_with_llm:
+        from models.llm import create_llm
+
+        llm = create_llm(settings.model)
+        for group in list(dictionary.groups):
+            if len(group["terms"]) >= args.min_terms:
+                continue
+            canonical = group["terms"][0]
+            try:
+                synonyms = _llm_synonyms(llm, canonical, args.min_terms)
+            except Exception as e:
+                logger.log_error(e, {"term": canonical})
+                continue
+            dictionary.add_group([canonical] + synonyms, group["type"])
+
+    dictionary.save(args.output)
+    print(f"Term dictionary saved: {args.output} ({len(dictionary.groups)} groups, {len(dictionary)} terms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -102,38 +102,62 @@ if prompt := st.chat_input("请输入你的问题..."):
         full_response = ""
 
         try:
-            # 调用FastAPI后端
+            # 调用FastAPI后端的流式接口：先收到来源，再逐段收到答案
             api_response = requests.post(
-                f"{FASTAPI_URL}/query",
+                f"{FASTAPI_URL}/query/stream",
                 json={"query": prompt, "user_id": "streamlit_user", "include_debug": True},
+                stream=True,
                 timeout=60 # 增加查询超时时间，因为LLM推理可能比较慢
             )
             api_response.raise_for_status()  # Raises HTTPError for bad responses (4xx or 5xx)
 
-            rag_result = api_response.json() # 现在这里应该能成功解析了
-
-            answer = rag_result.get("answer", "未能获取答案。")
-            sources = rag_result.get("sources", [])
-            total_time = rag_result.get("total_time", 0)
-            confidence = rag_result.get("confidence", 0)
-            cache_hit = rag_result.get("cache_hit", False)
-            method_used = rag_result.get("method_used", "hybrid")
-
-            full_response += f"💡 **答案:**\n{answer}\n\n"
-            full_response += f"📊 **置信度:** {confidence:.2%}\n"
-            full_response += f"⚡ **缓存命中:** {'是' if cache_hit else '否'} (召回方式: {method_used})\n"
-            full_response += f"⏱ **总耗时:** {total_time:.2f} 秒\n\n"
-
-            if sources:
-                full_response += "**📚 参考资料来源:**\n"
-                for i, src in enumerate(sources, 1):
-                  file_name = src.get('file_name', '未知文件')
-                  score = src.get('score', 0)
-                  preview = src.get('preview', '无预览')
-                  full_response += f" {i}. 文件: `{file_name}` | 分数: {score:.4f} | 预览: {preview}\n"
-            else:
-                full_response += "**📚 参考资料来源:** 无\n"
-
+            sources: List[Dict[str, Any]] = []
+            answer = ""
+            final: Dict[str, Any] = {}
+
+            def render(streaming: bool) -> str:
+                text = f"💡 **答案:**\n{answer}{'▌' if streaming else ''}\n\n"
+                if final:
+                    text += f"📊 **置信度:** {final.get('confidence', 0):.2%}\n"
+                    text += f"⚡ **缓存命中:** {'是' if final.get('cache_hit') else '否'} (召回方式: {final.get('method_used', 'hybrid')})\n"
+                    text += f"⏱ **总耗时:** {final.get('total_time', 0):.2f} 秒"
+                    if final.get("time_to_first_token") is not None:
+                        text += f"（首字 {final['time_to_first_token']:.2f} 秒）"
+                    text += "\n\n"
+
+                if sources:
+                    text += "**📚 参考资料来源:**\n"
+                    for i, src in enumerate(sources, 1):
+                      file_name = src.get('file_name', '未知文件')
+                      score = src.get('score', 0)
+                      preview = src.get('preview', '无预览')
+                      text += f" {i}. 文件: `{file_name}` | 分数: {score:.4f} | 预览: {preview}\n"
+                else:
+                    text += "**📚 参考资料来源:** 无\n"
+                return text
+
+            # 解析SSE：以 "event:" / "data:" 行组成事件，空行分隔
+            event_name = None
+            for line in api_response.iter_lines(decode_unicode=True):
+                if line.startswith("event:"):
+                    event_name = line[len("event:"):].strip()
+                    continue
+                if not line.startswith("data:"):
+                    continue
+                data = json.loads(line[len("data:"):].strip())
+
+                if event_name == "sources":
+                    sources = data.get("sources", [])
+                elif event_name == "token":
+                    answer += data.get("delta", "")
+                elif event_name == "final":
+                    final = data
+                    answer = data.get("answer", answer)
+                elif event_name == "error":
+                    raise RuntimeError(data.get("error", "未知错误"))
+                message_placeholder.markdown(render(streaming=not final))
+
+            full_response = render(streaming=False)
             message_placeholder.markdown(full_response)
 
         except requests.exceptions.ConnectionError:
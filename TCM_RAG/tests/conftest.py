@@ -0,0 +1,173 @@
+# tests/conftest.py
+import fnmatch
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+# 与服务入口一致，以 TCM_RAG 目录为导入根（config./services./models./utils.）
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+class FakeRedis:
+    """内存中的Redis替身，只实现缓存与单飞锁用到的命令，并记录调用次数以检查往返次数
+
+    SET 的 ex 参数与单飞锁的续期脚本按真实时间过期，其余键不过期。
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.expires = {}
+        self.published = []
+        self.calls = []
+
+    def _key(self, key):
+        return key.encode() if isinstance(key, str) else key
+
+    def _expire_stale(self, key):
+        if key in self.expires and self.expires[key] <= time.monotonic():
+            self.data.pop(key, None)
+            del self.expires[key]
+
+    def get(self, key):
+        self.calls.append("get")
+        key = self._key(key)
+        self._expire_stale(key)
+        return self.data.get(key)
+
+    def exists(self, key):
+        self.calls.append("exists")
+        return int(self.get(key) is not None)
+
+    def set(self, key, value, nx=False, ex=None):
+        self.calls.append("set")
+        key = self._key(key)
+        self._expire_stale(key)
+        if nx and key in self.data:
+            return None
+        self.data[key] = value.encode() if isinstance(value, str) else value
+        if ex is not None:
+            self.expires[key] = time.monotonic() + ex
+        return True
+
+    def eval(self, script, num_keys, key, token, *args):
+        """单飞锁的释放/续期脚本：仅当锁仍由 token 持有时生效"""
+        self.calls.append("eval")
+        key = self._key(key)
+        if self.get(key) != self._key(token):
+            return 0
+        if "expire" in script:
+            self.expires[key] = time.monotonic() + float(args[0])
+            return 1
+        self.data.pop(key, None)
+        self.expires.pop(key, None)
+        return 1
+
+    def mget(self, keys):
+        self.calls.append("mget")
+        return [self.data.get(self._key(key)) for key in keys]
+
+    def setex(self, key, ttl, value):
+        self.calls.append("setex")
+        self.data[self._key(key)] = value.encode() if isinstance(value, str) else value
+        return True
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def publish(self, channel, message):
+        self.calls.append("publish")
+        self.published.append((channel, message))
+        return 0
+
+    def scan_iter(self, match="*", count=None):
+        self.calls.append("scan")
+        return [key for key in list(self.data) if fnmatch.fnmatchcase(key.decode(), match)]
+
+    def unlink(self, *keys):
+        self.calls.append("unlink")
+        return sum(self.data.pop(self._key(key), None) is not None for key in keys)
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def setex(self, key, ttl, value):
+        self.commands.append((key, ttl, value))
+
+    def execute(self):
+        self.client.calls.append("pipeline")
+        for key, _, value in self.commands:
+            self.client.data[self.client._key(key)] = value
+        return [True] * len(self.commands)
+
+
+class FakeAsyncRedis:
+    """异步客户端替身，与同步替身共享数据"""
+
+    def __init__(self, client: FakeRedis):
+        self.client = client
+
+    async def get(self, key):
+        return self.client.get(key)
+
+    async def setex(self, key, ttl, value):
+        return self.client.setex(key, ttl, value)
+
+    async def publish(self, channel, message):
+        return self.client.publish(channel, message)
+
+    async def set(self, key, value, nx=False, ex=None):
+        return self.client.set(key, value, nx=nx, ex=ex)
+
+    async def exists(self, key):
+        return self.client.exists(key)
+
+    async def eval(self, script, num_keys, key, token, *args):
+        return self.client.eval(script, num_keys, key, token, *args)
+
+
+@pytest.fixture
+def fake_redis():
+    return FakeRedis()
+
+
+@pytest.fixture
+def cache(fake_redis):
+    """使用Redis替身的 CacheManager（from_url 不会建立连接）"""
+    from utils.cache import CacheManager
+
+    manager = CacheManager()
+    manager.redis_client = fake_redis
+    manager.async_redis_client = FakeAsyncRedis(fake_redis)
+    return manager
+
+
+TINY_BERT_CHARS = "风湿困表证心脾两虚肾阴头部沉重痛胀遇雨天加四肢胸闷纳呆舌苔白腻脉濡悸中怦跳动惊惕不安夜寐多梦易醒腰膝酸软五烦热晕的主要症状有哪些，。？"
+
+
+@pytest.fixture(scope="session")
+def tiny_bert_path(tmp_path_factory):
+    """本地构造一个很小的随机BERT模型及其分词器（按字切分），不依赖网络下载"""
+    torch = pytest.importorskip("torch")
+    transformers = pytest.importorskip("transformers")
+
+    path = tmp_path_factory.mktemp("tiny_bert")
+    vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + sorted(set(TINY_BERT_CHARS))
+    (path / "vocab.txt").write_text("\n".join(vocab), encoding="utf-8")
+    transformers.BertTokenizerFast(vocab_file=str(path / "vocab.txt")).save_pretrained(str(path))
+
+    torch.manual_seed(0)
+    config = transformers.BertConfig(
+        vocab_size=len(vocab),
+        hidden_size=16,
+        num_hidden_layers=2,
+        num_attention_heads=2,
+        intermediate_size=32,
+        max_position_embeddings=64
+    )
+    transformers.BertModel(config).save_pretrained(str(path))
+    return str(path)
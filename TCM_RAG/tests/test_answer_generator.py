@@ -0,0 +1,113 @@
+# tests/test_answer_generator.py
+"""AnswerGenerator：异步生成在生成线程池中执行，不阻塞事件循环；只有前缀KV缓存的LLM使用静态前缀模板"""
+import asyncio
+import threading
+from types import SimpleNamespace
+
+from llama_index.core.schema import NodeWithScore, TextNode
+
+from config.settings import RetrievalConfig
+from services.answer_generator import AnswerGenerator, PROMPT_PREFIX, PROMPT_TEMPLATE, PROMPT_TEMPLATE_VERSION
+
+
+RESULTS = [NodeWithScore(node=TextNode(id_="n1", text="风湿困表证：头部沉重痛胀，遇阴雨天加重。"), score=0.8)]
+
+
+class BlockingLLM:
+    """complete 阻塞到 release 被设置为止，记录调用线程与提示词"""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.threads = []
+        self.prompts = []
+
+    def complete(self, prompt):
+        self.threads.append(threading.current_thread().name)
+        self.prompts.append(prompt)
+        assert self.release.wait(timeout=5)
+        return SimpleNamespace(text=" 祛风胜湿。 ")
+
+
+def test_agenerate_answer_does_not_block_event_loop():
+    llm = BlockingLLM()
+    generator = AnswerGenerator(llm, RetrievalConfig())
+
+    async def run():
+        task = asyncio.ensure_future(generator.agenerate_answer("头痛遇阴雨加重怎么办", RESULTS))
+        # 生成阻塞期间事件循环仍可调度其他协程
+        while not llm.threads:
+            await asyncio.sleep(0.01)
+        llm.release.set()
+        return await task
+
+    answer = asyncio.run(run())
+
+    assert answer["answer"] == "祛风胜湿。"
+    assert answer["confidence"] == 0.8
+    assert answer["sources"] and "头部沉重痛胀" in answer["context_used"]
+    assert llm.threads == ["generation_0"]
+
+
+def test_async_and_sync_answers_match():
+    llm = BlockingLLM()
+    llm.release.set()
+    generator = AnswerGenerator(llm, RetrievalConfig())
+
+    sync_answer = generator.generate_answer("头痛", RESULTS)
+    async_answer = asyncio.run(generator.agenerate_answer("头痛", RESULTS))
+
+    assert llm.prompts[0] == llm.prompts[1]
+    for key in ("answer", "sources", "context_used", "confidence"):
+        assert async_answer[key] == sync_answer[key]
+
+
+def test_empty_context_skips_llm():
+    llm = BlockingLLM()
+
+    answer = asyncio.run(AnswerGenerator(llm, RetrievalConfig()).agenerate_answer("头痛", []))
+
+    assert llm.prompts == [] and answer["sources"] == [] and answer["confidence"] == 0.0
+
+
+class PrefixCachingLLM(BlockingLLM):
+    """带 register_prefix 的LLM（如 PrefixCachedLLM），记录登记的前缀"""
+
+    def __init__(self, fail=False):
+        super().__init__()
+        self.release.set()
+        self.fail = fail
+        self.prefixes = {}
+
+    def register_prefix(self, version, prefix):
+        if self.fail:
+            raise RuntimeError("prefill failed")
+        self.prefixes[version] = prefix
+
+
+def test_baseline_template_without_prefix_cache():
+    llm = BlockingLLM()
+    llm.release.set()
+
+    AnswerGenerator(llm, RetrievalConfig()).generate_answer("头痛", RESULTS)
+
+    head, tail = PROMPT_TEMPLATE.split("{context_str}")
+    assert llm.prompts[0].startswith(head)
+    assert llm.prompts[0].endswith(tail.format(query_str="头痛"))
+
+
+def test_prefix_cached_llm_uses_static_prefix_template():
+    llm = PrefixCachingLLM()
+
+    AnswerGenerator(llm, RetrievalConfig()).generate_answer("头痛", RESULTS)
+
+    assert llm.prefixes == {PROMPT_TEMPLATE_VERSION: PROMPT_PREFIX}
+    assert llm.prompts[0].startswith(PROMPT_PREFIX)
+
+
+def test_failed_prefix_registration_keeps_baseline_template():
+    llm = PrefixCachingLLM(fail=True)
+
+    AnswerGenerator(llm, RetrievalConfig()).generate_answer("头痛", RESULTS)
+
+    assert not llm.prompts[0].startswith(PROMPT_PREFIX)
+    assert llm.prompts[0].startswith(PROMPT_TEMPLATE.split("\n")[0])
@@ -0,0 +1,106 @@
+# tests/test_batching.py
+"""MicroBatcher：并发提交合并为更少的批次，单个请求不空等，结果与异常按任务分发"""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from utils.batching import Histogram, MicroBatcher
+
+
+class GatedBatchFn:
+    """第一次调用阻塞到 release，期间到达的任务只能排队，记录每批内容"""
+
+    def __init__(self, fn=lambda items: [item * 10 for item in items]):
+        self.fn = fn
+        self.batches = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self, items):
+        self.batches.append(list(items))
+        self.started.set()
+        assert self.release.wait(timeout=5)
+        return self.fn(items)
+
+
+def test_single_request_is_not_delayed():
+    batcher = MicroBatcher("test", lambda items: items, max_wait_ms=2000)
+
+    start = time.monotonic()
+    assert batcher(1) == 1
+
+    assert time.monotonic() - start < 1.0
+
+
+def test_concurrent_callers_share_forward_calls():
+    batch_fn = GatedBatchFn()
+    batcher = MicroBatcher("test", batch_fn, max_batch_size=32, max_wait_ms=50)
+
+    first = batcher.submit(0)
+    assert batch_fn.started.wait(timeout=5)
+    futures = [batcher.submit(i) for i in range(1, 8)]
+    batch_fn.release.set()
+
+    assert first.result(timeout=5) == 0
+    assert [future.result(timeout=5) for future in futures] == [i * 10 for i in range(1, 8)]
+    assert batch_fn.batches == [[0], list(range(1, 8))]
+    assert batcher.get_stats()["num_batches"] == 2
+
+
+def test_async_callers_do_not_need_threads():
+    batch_fn = GatedBatchFn()
+    batcher = MicroBatcher("test", batch_fn, max_batch_size=32, max_wait_ms=50)
+
+    async def run():
+        first = asyncio.ensure_future(asyncio.wrap_future(batcher.submit(0)))
+        while not batch_fn.started.is_set():
+            await asyncio.sleep(0.01)
+        rest = [asyncio.wrap_future(batcher.submit(i)) for i in range(1, 20)]
+        batch_fn.release.set()
+        return await asyncio.gather(first, *rest)
+
+    assert asyncio.run(run()) == [i * 10 for i in range(20)]
+    assert len(batch_fn.batches) == 2
+
+
+def test_batch_size_budget_counts_item_size():
+    batch_fn = GatedBatchFn(lambda groups: [len(group) for group in groups])
+    batcher = MicroBatcher("test", batch_fn, max_batch_size=5, max_wait_ms=50, item_size=len)
+
+    batcher.submit(["a"])
+    assert batch_fn.started.wait(timeout=5)
+    futures = [batcher.submit(["x"] * 2) for _ in range(4)]
+    batch_fn.release.set()
+
+    assert [future.result(timeout=5) for future in futures] == [2, 2, 2, 2]
+    assert [sum(map(len, batch)) for batch in batch_fn.batches] == [1, 6, 2]
+
+
+def test_batch_errors_reach_every_caller():
+    def fail(items):
+        raise RuntimeError("model failed")
+
+    batcher = MicroBatcher("test", fail)
+
+    with pytest.raises(RuntimeError, match="model failed"):
+        batcher(1)
+
+
+def test_result_count_mismatch_is_an_error():
+    batcher = MicroBatcher("test", lambda items: [])
+
+    with pytest.raises(RuntimeError, match="returned 0 results"):
+        batcher(1)
+
+
+def test_histogram_buckets():
+    histogram = Histogram(max_bucket=4)
+    for value in (1, 3, 4, 9):
+        histogram.observe(value)
+
+    snapshot = histogram.snapshot()
+
+    assert snapshot["buckets"] == {"le_1": 1, "le_2": 0, "le_4": 2, "gt_4": 1}
+    assert snapshot["count"] == 4 and snapshot["mean"] == 4.25
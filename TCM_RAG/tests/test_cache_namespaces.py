@@ -0,0 +1,90 @@
+# tests/test_cache_namespaces.py
+"""缓存命名空间：版本由语料与模型身份决定，按命名空间定向清除，不影响同库的其他数据"""
+import json
+
+import pytest
+
+from config.settings import Settings
+from services.index_manifest import build_cache_namespaces
+
+
+REFS = [("n1", 0.9)]
+
+
+def test_namespace_versions_follow_corpus_and_models():
+    settings = Settings()
+    base = build_cache_namespaces(settings, "corpus-1")
+
+    assert set(base) == {"embeddings", "expansions", "queries"}
+    assert "queries" not in build_cache_namespaces(settings)
+    assert build_cache_namespaces(settings, "corpus-1") == base
+
+    changed_corpus = build_cache_namespaces(settings, "corpus-2")
+    assert changed_corpus["queries"] != base["queries"]
+    assert changed_corpus["embeddings"] == base["embeddings"]
+
+    settings.model.rerank_model_path = "/models/other-reranker"
+    changed_reranker = build_cache_namespaces(settings, "corpus-1")
+    assert changed_reranker["queries"] != base["queries"]
+    assert changed_reranker["embeddings"] == base["embeddings"]
+
+    settings.model.embed_model_path = "/models/other-embedding"
+    changed_embedding = build_cache_namespaces(settings, "corpus-1")
+    assert changed_embedding["embeddings"] != base["embeddings"]
+    assert changed_embedding["queries"] != changed_reranker["queries"]
+
+
+def test_version_change_hides_old_entries(cache):
+    cache.set_namespace_versions({"queries": "v1"})
+    cache.cache_query_results("头痛", REFS)
+
+    cache.set_namespace_versions({"queries": "v2"})
+    assert cache.get_query_results("头痛") is None
+
+    cache.set_namespace_versions({"queries": "v1"})
+    assert cache.get_query_results("头痛") == REFS
+
+
+def test_unknown_namespace_rejected(cache):
+    with pytest.raises(ValueError):
+        cache.set_namespace_versions({"answers": "v1"})
+    with pytest.raises(ValueError):
+        cache.invalidate_namespaces(["answers"])
+
+
+def test_invalidate_only_targets_namespace(cache, fake_redis):
+    cache.invalidation_channel = "tcm_rag:l1"
+    for version in ("v1", "v2"):
+        cache.set_namespace_versions({"queries": version, "expansions": version})
+        cache.cache_query_results("头痛", REFS)
+        cache.cache_query_expansions("头痛", ["头痛", "头疼"])
+    fake_redis.data[b"session:42"] = b"other app"
+    fake_redis.published.clear()
+
+    deleted = cache.invalidate_namespaces(["queries"])
+
+    assert deleted == {"queries": 2}
+    assert sorted(key.split(b":")[0] for key in fake_redis.data) == [b"expansions", b"expansions", b"session"]
+    assert cache.get_query_results("头痛") is None
+    assert cache.get_query_expansions("头痛") == ["头痛", "头疼"]
+    [(_, message)] = fake_redis.published
+    assert json.loads(message)["prefixes"] == ["queries:"]
+
+
+def test_service_clear_cache(cache, fake_redis, monkeypatch):
+    rag_service = pytest.importorskip("services.rag_service")
+    monkeypatch.setattr(rag_service, "cache_manager", cache)
+    service = rag_service.EnterpriseRAGService()
+    cleared = []
+    service.semantic_cache = type("FakeSemanticCache", (), {"clear": lambda self: cleared.append(True)})()
+    cache.cache_query_results("头痛", REFS)
+    cache.cache_embeddings("头痛", [0.1, 0.2])
+
+    assert service.clear_cache(["nonsense"])["success"] is False
+
+    result = service.clear_cache(["queries", "answers"])
+
+    assert result["success"] and result["deleted"] == {"queries": 1}
+    assert cleared == [True]
+    assert cache.get_query_results("头痛") is None
+    assert cache.get_embeddings("头痛") is not None
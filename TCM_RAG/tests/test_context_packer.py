@@ -0,0 +1,103 @@
+# tests/test_context_packer.py
+"""ContextPacker：完全相同句去重、相邻切块边缘半句去除、按预算选句，嵌入句数上限"""
+import pytest
+from llama_index.core.schema import NodeRelationship, NodeWithScore, RelatedNodeInfo, TextNode
+
+from services.context_packer import ContextPacker
+
+
+def chunk(text, score=0.5, doc_id=None, start=None):
+    relationships = {NodeRelationship.SOURCE: RelatedNodeInfo(node_id=doc_id)} if doc_id else {}
+    end = start + len(text) if start is not None else None
+    node = TextNode(text=text, relationships=relationships, start_char_idx=start, end_char_idx=end)
+    return NodeWithScore(node=node, score=score)
+
+
+def sentences(candidates):
+    return [(c.chunk, c.text) for c in candidates]
+
+
+class FakeEmbedModel:
+    """句子含“头痛”时与问题同向"""
+
+    def __init__(self):
+        self.batches = []
+
+    def get_query_embedding(self, query):
+        return [1.0, 0.0]
+
+    def get_text_embedding_batch(self, texts):
+        self.batches.append(list(texts))
+        return [[1.0, 0.0] if "头痛" in text else [0.0, 1.0] for text in texts]
+
+
+def test_exact_duplicates_dropped_but_short_sentences_kept():
+    packer = ContextPacker()
+
+    candidates = packer._candidates([
+        chunk("风湿困表证头痛。遇阴雨天加重。"),
+        chunk("遇阴雨天加重。头痛。"),
+    ])
+
+    # “头痛。”是前一句的子串，但属于另一条独立资料，不应被当作重叠去掉
+    assert sentences(candidates) == [(0, "风湿困表证头痛。"), (0, "遇阴雨天加重。"), (1, "头痛。")]
+
+
+def test_truncated_edges_of_neighbouring_chunks_dropped():
+    text = "头部沉重。四肢困重，关节酸痛。舌苔白腻。"
+    full = chunk(text, doc_id="d1", start=0)
+    head_cut = chunk("关节酸痛。舌苔白腻。", doc_id="d1", start=text.index("关节"))
+    tail_cut = chunk("头部沉重。四肢困重", doc_id="d1", start=0)
+
+    candidates = ContextPacker()._candidates([full, head_cut, tail_cut])
+
+    assert sentences(candidates) == [(0, "头部沉重。"), (0, "四肢困重，关节酸痛。"), (0, "舌苔白腻。")]
+
+
+def test_edge_fragments_of_unrelated_chunks_kept():
+    packer = ContextPacker()
+    text = "四肢困重，关节酸痛。"
+
+    other_document = packer._candidates([chunk(text, doc_id="d1", start=0), chunk("关节酸痛。", doc_id="d2", start=0)])
+    far_apart = packer._candidates([chunk(text, doc_id="d1", start=0), chunk("关节酸痛。", doc_id="d1", start=500)])
+
+    assert sentences(other_document)[-1] == (1, "关节酸痛。")
+    assert sentences(far_apart)[-1] == (1, "关节酸痛。")
+
+
+def test_within_budget_keeps_everything():
+    context, sources, stats = ContextPacker(max_chars=100).pack("头痛", [chunk("头痛。"), chunk("恶寒。")])
+
+    assert context == "[资料1] 头痛。\n\n[资料2] 恶寒。"
+    assert [source["index"] for source in sources] == [1, 2]
+    assert stats["selected_sentences"] == stats["candidate_sentences"] == 2
+
+
+def test_over_budget_selects_relevant_sentences_in_order():
+    embed_model = FakeEmbedModel()
+    packer = ContextPacker(max_chars=20, chunk_weight=0.0, embed_model=embed_model)
+
+    context, sources, _ = packer.pack("头痛怎么办", [chunk("舌苔白腻。脉浮。头痛恶寒。四肢困重。头痛遇风加重。")])
+
+    assert context == "[资料1] 头痛恶寒。……头痛遇风加重。"
+    assert len(sources) == 1
+
+
+def test_embedding_capped_after_lexical_preselection():
+    embed_model = FakeEmbedModel()
+    packer = ContextPacker(max_chars=10, embed_model=embed_model, max_embedded_sentences=2)
+    results = [chunk("舌苔白腻。头痛恶寒。脉浮紧。头痛。四肢困重。")]
+    candidates = packer._candidates(results)
+
+    packer._score_sentences("头痛恶寒", candidates)
+
+    assert embed_model.batches == [["头痛恶寒。", "头痛。"]]
+    relevance = {c.text: c.relevance for c in candidates}
+    assert relevance["头痛恶寒。"] == pytest.approx(1.0)
+    assert max(relevance["舌苔白腻。"], relevance["脉浮紧。"], relevance["四肢困重。"]) < -1.0
+
+
+def test_missing_embed_model_falls_back_to_lexical():
+    assert ContextPacker(sentence_scoring="embedding").sentence_scoring == "lexical"
+    with pytest.raises(ValueError):
+        ContextPacker(sentence_scoring="bm25")
@@ -0,0 +1,67 @@
+# tests/test_docstore.py
+"""检索结果缓存只存 (node_id, score)：JSON序列化，命中时由 NodeDocstore 还原节点"""
+import json
+
+from llama_index.core import Document
+from llama_index.core.schema import TextNode
+
+from services.docstore import NodeDocstore
+
+
+DOCUMENTS = [Document(id_="d0", text="风湿困表证"), Document(id_="d1", text="心脾两虚")]
+
+
+class FakeVectorStore:
+    def __init__(self, nodes):
+        self.nodes = {node.node_id: node for node in nodes}
+        self.requests = []
+
+    def get_nodes(self, node_ids):
+        self.requests.append(list(node_ids))
+        return [self.nodes[node_id] for node_id in node_ids if node_id in self.nodes]
+
+
+def test_refs_are_compact_json(cache, fake_redis):
+    cache.l1 = None
+    cache.cache_query_results("头痛", [("c1", 0.91), ("d0", 0.5)])
+
+    [raw] = fake_redis.data.values()
+
+    assert json.loads(raw) == [["c1", 0.91], ["d0", 0.5]]
+    assert cache.get_query_results("头痛") == [("c1", 0.91), ("d0", 0.5)]
+
+
+def test_documents_and_registered_chunks_resolve_locally():
+    store = FakeVectorStore([])
+    docstore = NodeDocstore(DOCUMENTS, store)
+    docstore.add([TextNode(id_="c1", text="头部沉重")])
+
+    nodes = docstore.get_many(["c1", "d1"])
+
+    assert [node.node_id for node in nodes] == ["c1", "d1"]
+    assert store.requests == []
+
+
+def test_missing_nodes_fetched_from_vector_store_once():
+    store = FakeVectorStore([TextNode(id_="c2", text="四肢困重")])
+    docstore = NodeDocstore(DOCUMENTS, store)
+
+    assert [node.node_id for node in docstore.get_many(["d0", "c2"])] == ["d0", "c2"]
+    assert [node.node_id for node in docstore.get_many(["c2"])] == ["c2"]
+
+    assert store.requests == [["c2"]]
+
+
+def test_unresolvable_node_is_a_miss():
+    docstore = NodeDocstore(DOCUMENTS, FakeVectorStore([]))
+
+    assert docstore.get_many(["d0", "deleted"]) is None
+    assert NodeDocstore(DOCUMENTS).get_many(["deleted"]) is None
+
+
+def test_chunks_evicted_lru_but_documents_stay():
+    docstore = NodeDocstore(DOCUMENTS, max_nodes=2)
+    docstore.add([TextNode(id_=f"c{i}", text=str(i)) for i in range(3)] + DOCUMENTS)
+
+    assert docstore.get_many(["c0"]) is None
+    assert [node.node_id for node in docstore.get_many(["c1", "c2", "d0", "d1"])] == ["c1", "c2", "d0", "d1"]
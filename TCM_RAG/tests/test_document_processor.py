@@ -0,0 +1,145 @@
+# tests/test_document_processor.py
+"""DocumentProcessor：稳定ID、哈希未变化时跳过分块、解析失败、按需创建解析进程池"""
+import json
+from concurrent.futures import Future
+
+import pytest
+
+from services import document_processor
+from services.document_processor import DocumentProcessor, FIELDS_METADATA_KEY
+
+
+RECORDS = [
+    {"id": 1, "pattern": "风湿困表证", "symptom": "头部沉重痛胀，遇阴雨天加重。四肢困重，胸闷纳呆。"},
+    {"id": 2, "pattern": "心脾两虚", "symptom": "心中怦怦跳动，惊惕不安。夜寐不安，多梦易醒。"},
+]
+
+
+def write_json(path, records=RECORDS):
+    path.write_text(json.dumps(records, ensure_ascii=False), encoding="utf-8")
+    return path
+
+
+class InlineExecutor:
+    """在当前进程同步执行的进程池替身，记录创建参数"""
+
+    created = []
+
+    def __init__(self, max_workers, mp_context, initializer, initargs):
+        self.created.append(max_workers)
+        initializer(*initargs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def submit(self, fn, *args):
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+
+@pytest.fixture
+def inline_pool(monkeypatch):
+    InlineExecutor.created = []
+    monkeypatch.setattr(document_processor, "ProcessPoolExecutor", InlineExecutor)
+    return InlineExecutor.created
+
+
+def test_process_file_has_stable_ids_and_fields(tmp_path):
+    path = write_json(tmp_path / "tcm.json")
+    processor = DocumentProcessor()
+
+    first = processor.process_file(path)
+    second = processor.process_file(path)
+
+    assert first.error is None and first.final
+    assert [doc.doc_id for doc in first.documents] == [doc.doc_id for doc in second.documents]
+    assert [node.node_id for node in first.nodes] == [node.node_id for node in second.nodes]
+    assert first.documents[0].metadata[FIELDS_METADATA_KEY]["pattern"] == "风湿困表证"
+    assert all(FIELDS_METADATA_KEY not in node.metadata for node in first.nodes)
+
+
+def test_unchanged_file_is_parsed_but_not_chunked(tmp_path):
+    path = write_json(tmp_path / "tcm.json")
+    processor = DocumentProcessor()
+    file_hash = processor.process_file(path).file_hash
+
+    processed = processor.process_file(path, known_hash=file_hash)
+
+    assert processed.nodes is None
+    assert len(processed.documents) == 2
+
+
+def test_unparsable_file_returns_error_not_empty(tmp_path):
+    path = tmp_path / "broken.json"
+    path.write_text('[{"pattern": "心脾两虚"', encoding="utf-8")
+
+    processed = DocumentProcessor().process_file(path, known_hash="old")
+
+    assert processed.error
+    assert processed.file_hash == "old"
+    assert processed.documents == [] and processed.nodes is None
+
+
+def test_unchanged_corpus_never_creates_a_pool(tmp_path, inline_pool):
+    processor = DocumentProcessor()
+    for i in range(3):
+        write_json(tmp_path / f"f{i}.json")
+    known = {str(p.file_path): p.file_hash for p in processor.iter_processed_files(str(tmp_path), workers=1)}
+
+    results = list(processor.iter_processed_files(str(tmp_path), workers=4, known_hashes=known, parallel_min_bytes=0))
+
+    assert inline_pool == []
+    assert len(results) == 3 and all(p.nodes is None for p in results)
+
+
+def test_small_change_is_processed_serially(tmp_path, inline_pool):
+    for i in range(3):
+        write_json(tmp_path / f"f{i}.json")
+
+    results = list(DocumentProcessor().iter_processed_files(str(tmp_path), workers=4))
+
+    assert inline_pool == []
+    assert len(results) == 3 and all(p.nodes for p in results)
+
+
+def test_pool_sized_to_changed_files(tmp_path, inline_pool):
+    processor = DocumentProcessor()
+    for i in range(3):
+        write_json(tmp_path / f"f{i}.json")
+    known = {str(tmp_path / "f0.json"): processor.process_file(tmp_path / "f0.json").file_hash}
+
+    results = list(processor.iter_processed_files(str(tmp_path), workers=8, known_hashes=known, parallel_min_bytes=1))
+
+    assert inline_pool == [2]
+    by_path = {p.file_path: p for p in results}
+    assert by_path[str(tmp_path / "f0.json")].nodes is None
+    assert by_path[str(tmp_path / "f1.json")].nodes and by_path[str(tmp_path / "f2.json")].nodes
+
+
+def test_large_file_is_streamed_in_parts(tmp_path, monkeypatch):
+    monkeypatch.setattr(document_processor, "STREAM_CHUNK_BATCH", 2)
+    records = [dict(RECORDS[i % 2], id=i) for i in range(5)]
+    path = tmp_path / "tcm.jsonl"
+    path.write_text("\n".join(json.dumps(r, ensure_ascii=False) for r in records), encoding="utf-8")
+
+    parts = list(DocumentProcessor().iter_file_parts(path))
+
+    assert [len(part.documents) for part in parts] == [2, 2, 1]
+    assert [part.final for part in parts] == [False, False, True]
+    assert all(part.nodes and part.error is None for part in parts)
+    assert len({doc.doc_id for part in parts for doc in part.documents}) == 5
+
+
+def test_stream_error_yields_error_part(tmp_path, monkeypatch):
+    monkeypatch.setattr(document_processor, "STREAM_CHUNK_BATCH", 1)
+    path = tmp_path / "tcm.jsonl"
+    path.write_text(json.dumps(RECORDS[0], ensure_ascii=False) + "\n{broken\n", encoding="utf-8")
+
+    parts = list(DocumentProcessor().iter_file_parts(path))
+
+    assert not parts[0].final and len(parts[0].documents) == 1
+    assert parts[-1].error
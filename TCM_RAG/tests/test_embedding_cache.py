@@ -0,0 +1,66 @@
+# tests/test_embedding_cache.py
+"""CacheManager 向量批量读写：一次 MGET / 一次 pipeline，按 float32/float16 原始字节存储"""
+import numpy as np
+import pytest
+
+
+TEXTS = ["风湿困表证", "心脾两虚", "肾阴虚证"]
+EMBEDDINGS = [[0.1, -0.2, 0.3], [1.0, 0.0, -1.0], [0.25, 0.5, 0.75]]
+
+
+@pytest.fixture
+def redis_only(cache):
+    """关闭L1，每次读取都落到Redis"""
+    cache.l1 = None
+    return cache
+
+
+def test_batch_round_trip_costs_one_call_each_way(redis_only, fake_redis):
+    redis_only.cache_embeddings_batch(TEXTS, EMBEDDINGS)
+    assert fake_redis.calls == ["pipeline"]
+
+    fake_redis.calls.clear()
+    cached = redis_only.get_embeddings_batch(TEXTS + ["未缓存"])
+
+    assert fake_redis.calls == ["mget"]
+    np.testing.assert_allclose(cached[:3], EMBEDDINGS, rtol=1e-6)
+    assert cached[3] is None
+
+
+@pytest.mark.parametrize("dtype, itemsize, rtol", [("float32", 4, 1e-7), ("float16", 2, 1e-3)])
+def test_embeddings_stored_as_raw_bytes(redis_only, fake_redis, dtype, itemsize, rtol):
+    redis_only.configure_embeddings(dtype)
+
+    redis_only.cache_embeddings("风湿困表证", EMBEDDINGS[0])
+
+    [raw] = fake_redis.data.values()
+    assert len(raw) == 3 * itemsize
+    np.testing.assert_allclose(redis_only.get_embeddings("风湿困表证"), EMBEDDINGS[0], rtol=rtol)
+
+
+def test_dtype_is_part_of_the_key(redis_only):
+    redis_only.cache_embeddings("风湿困表证", EMBEDDINGS[0])
+
+    redis_only.configure_embeddings("float16")
+
+    assert redis_only.get_embeddings("风湿困表证") is None
+
+
+def test_corrupt_value_reads_as_miss(redis_only, fake_redis):
+    fake_redis.data[redis_only._embedding_key("心脾两虚").encode()] = b"\x00" * 5
+
+    assert redis_only.get_embeddings_batch(["心脾两虚"]) == [None]
+
+
+def test_unknown_dtype_rejected(cache):
+    with pytest.raises(ValueError):
+        cache.configure_embeddings("float64")
+
+
+def test_redis_failure_degrades_to_misses(redis_only, fake_redis, monkeypatch):
+    def fail(keys):
+        raise ConnectionError("redis down")
+
+    monkeypatch.setattr(fake_redis, "mget", fail)
+
+    assert redis_only.get_embeddings_batch(TEXTS) == [None, None, None]
@@ -0,0 +1,106 @@
+# tests/test_embeddings.py
+"""EnterpriseEmbedding：长度分桶组批不超过token预算，与定长分批结果一致且顺序不变；缓存命中与新计算结果按原顺序合并；并发查询合并编码"""
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+
+from models import embeddings as embeddings_module
+from models.embeddings import EnterpriseEmbedding
+
+
+TEXTS = [
+    "头痛",
+    "头部沉重痛胀，遇阴雨天加重，四肢困重，胸闷纳呆，舌苔白腻，脉濡",
+    "心悸",
+    "心中怦怦跳动，惊惕不安，夜寐不安，多梦易醒",
+    "腰膝酸软，五心烦热",
+    "脉濡",
+    "四肢困重，胸闷纳呆",
+]
+
+
+def make_embedding(model_path, **kwargs):
+    return EnterpriseEmbedding(model_path, device="cpu", use_cache=False, **kwargs)
+
+
+def test_default_batching_is_fixed(tiny_bert_path):
+    embedding = make_embedding(tiny_bert_path)
+
+    assert embedding.batching == "fixed"
+    assert embedding.embed_batch_size == embedding.batch_size
+
+
+def test_length_batches_respect_token_budget(tiny_bert_path):
+    embedding = make_embedding(tiny_bert_path, batching="length", max_batch_tokens=60)
+    lengths = [len(ids) for ids in embedding.tokenizer(TEXTS)["input_ids"]]
+
+    batches = embedding._length_bucketed_batches(TEXTS)
+
+    assert sorted(i for batch in batches for i in batch) == list(range(len(TEXTS)))
+    for batch in batches:
+        padded_len = max(lengths[i] for i in batch)
+        assert len(batch) == 1 or len(batch) * padded_len <= 60
+        assert lengths[batch[0]] == padded_len
+    assert len(batches) > 1
+
+
+def test_length_and_fixed_batching_match(tiny_bert_path):
+    fixed = make_embedding(tiny_bert_path, batching="fixed", batch_size=3)
+    length = make_embedding(tiny_bert_path, batching="length", max_batch_tokens=60)
+    single = np.array([fixed._get_text_embedding(text) for text in TEXTS])
+
+    fixed_result = np.array(fixed.get_text_embedding_batch(TEXTS))
+    length_result = np.array(length.get_text_embedding_batch(TEXTS))
+
+    # padding位置被attention mask屏蔽，分批方式只影响浮点误差；逐条比对也验证了结果顺序
+    np.testing.assert_allclose(fixed_result, single, atol=1e-5)
+    np.testing.assert_allclose(length_result, single, atol=1e-5)
+    np.testing.assert_allclose(np.linalg.norm(length_result, axis=1), 1.0, rtol=1e-5)
+
+
+def test_cached_and_computed_embeddings_keep_order(tiny_bert_path, cache, fake_redis, monkeypatch):
+    monkeypatch.setattr(embeddings_module, "cache_manager", cache)
+    cache.l1 = None
+    embedding = EnterpriseEmbedding(tiny_bert_path, device="cpu", use_cache=True)
+    embedding._embed_batch(TEXTS[1::2])
+    fake_redis.calls.clear()
+
+    result = embedding._embed_batch(TEXTS)
+
+    assert fake_redis.calls == ["mget", "pipeline"]
+    expected = make_embedding(tiny_bert_path)._encode(TEXTS)
+    np.testing.assert_allclose(result, expected, atol=1e-5)
+
+
+def test_concurrent_async_queries_share_forward_calls(tiny_bert_path):
+    embedding = make_embedding(tiny_bert_path)
+    embedding.enable_query_batching(max_batch_size=32, max_wait_ms=50)
+    encode, calls = embedding._encode, []
+    started, release = threading.Event(), threading.Event()
+
+    def gated_encode(sentences):
+        calls.append(list(sentences))
+        started.set()
+        assert release.wait(timeout=5)
+        return encode(sentences)
+
+    object.__setattr__(embedding, "_encode", gated_encode)
+
+    async def run():
+        first = asyncio.ensure_future(embedding.aget_query_embedding(TEXTS[0]))
+        while not started.is_set():
+            await asyncio.sleep(0.01)
+        rest = [asyncio.ensure_future(embedding.aget_query_embedding(text)) for text in TEXTS[1:]]
+        await asyncio.sleep(0.05)
+        release.set()
+        return await asyncio.gather(first, *rest)
+
+    results = asyncio.run(run())
+
+    assert len(calls) == 2 and calls[1] == TEXTS[1:]
+    np.testing.assert_allclose(results, encode(TEXTS), atol=1e-5)
@@ -0,0 +1,92 @@
+# tests/test_field_index.py
+"""FieldIndex：证型名精确查找、字段加权BM25、字段向量与保存/加载"""
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from services.document_processor import FIELDS_METADATA_KEY
+from services.field_index import FieldIndex
+
+
+WEIGHTS = {"pattern": 2.0, "symptom": 1.0}
+
+
+def make_doc(**fields):
+    return SimpleNamespace(metadata={FIELDS_METADATA_KEY: fields})
+
+
+DOCUMENTS = [
+    make_doc(pattern="风湿困表证", symptom="头部沉重痛胀，四肢困重"),
+    make_doc(pattern="心脾两虚", symptom="心悸失眠，多梦易醒"),
+    make_doc(pattern="肾阴虚证", symptom="腰膝酸软，五心烦热，头晕"),
+    SimpleNamespace(metadata={}),  # 非结构化文档
+]
+
+
+@pytest.fixture
+def index():
+    return FieldIndex.build(DOCUMENTS, field_weights=WEIGHTS)
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("风湿困表证", [0]),
+    ("风湿困表", [0]),
+    ("心脾 两虚？", [1]),
+    ("肾阴虚。", [2]),
+    ("肾阴虚的症状", []),
+    ("虚证", []),
+    ("", []),
+])
+def test_lookup_pattern_matches_whole_query_only(index, query, expected):
+    assert index.lookup_pattern(query) == expected
+
+
+def test_short_pattern_keeps_suffix():
+    # 两个字的证型名不去掉“证/型”后缀，避免只剩一个字
+    short = FieldIndex.build([make_doc(pattern="虚证")], field_weights=WEIGHTS)
+    assert short.lookup_pattern("虚证") == [0]
+    assert short.lookup_pattern("虚") == []
+
+
+def test_search_weights_fields(index):
+    results = index.search("头晕 四肢困重", top_k=3)
+
+    assert results[0][0] == 0
+    assert {doc for doc, _ in results} == {0, 2}
+
+    index.field_weights = {"pattern": 0.0, "symptom": 0.0}
+    assert index.search("头晕", top_k=3) == []
+
+
+def test_pattern_weight_outranks_symptom_mention():
+    docs = [make_doc(pattern="心脾两虚", symptom="乏力"), make_doc(pattern="气虚", symptom="心脾两虚样表现，乏力")]
+
+    results = FieldIndex.build(docs, field_weights={"pattern": 3.0, "symptom": 1.0}).search("心脾两虚", top_k=2)
+
+    assert [doc for doc, _ in results] == [0, 1]
+
+
+def test_dense_search_takes_best_field_per_document(index):
+    vectors = {"心悸失眠，多梦易醒": [1.0, 0.0], "腰膝酸软，五心烦热，头晕": [0.0, 1.0], "头部沉重痛胀，四肢困重": [0.6, 0.8]}
+    embed_model = SimpleNamespace(get_text_embedding_batch=lambda texts: [vectors[text] for text in texts])
+    index.build_field_embeddings(DOCUMENTS, embed_model, ["symptom"])
+
+    results = index.dense_search([1.0, 0.0], top_k=2)
+
+    assert [doc for doc, _ in results] == [1, 0]
+    assert results[0][1] == pytest.approx(1.0)
+    doc_ids, matrix = index.field_embeddings["symptom"]
+    assert doc_ids.tolist() == [0, 1, 2]
+    np.testing.assert_allclose(np.linalg.norm(matrix, axis=1), 1.0, rtol=1e-6)
+
+
+def test_save_and_load_round_trip(index, tmp_path):
+    index.save(tmp_path / "fields")
+
+    loaded = FieldIndex.load(tmp_path / "fields")
+
+    assert loaded.pattern_lookup == index.pattern_lookup
+    assert loaded.field_weights == WEIGHTS
+    assert loaded.search("头晕", top_k=2) == index.search("头晕", top_k=2)
+    assert FieldIndex.load(tmp_path / "fields", field_weights={"symptom": 1.0}).field_weights == {"symptom": 1.0}
@@ -0,0 +1,92 @@
+# tests/test_index_manifest.py
+"""IndexManifest：文件/节点哈希比对、落盘与签名校验"""
+from llama_index.core.schema import TextNode
+
+from services.index_manifest import IndexManifest, node_content_hash
+
+
+SIGNATURE = {"embed_model_path": "bge", "dim": 4, "chunk_size": 512}
+
+
+def make_node(node_id: str, text: str) -> TextNode:
+    return TextNode(id_=node_id, text=text)
+
+
+def test_diff_nodes_returns_only_changed_nodes(tmp_path):
+    manifest = IndexManifest(str(tmp_path / "manifest.json"), SIGNATURE)
+    a, b = make_node("a", "气虚"), make_node("b", "血虚")
+    manifest.update_file("f.json", "h1", {"a": node_content_hash(a), "b": node_content_hash(b)})
+
+    changed_b = make_node("b", "血虚证")
+    new_c = make_node("c", "阴虚")
+    upsert, hashes = manifest.diff_nodes("f.json", [a, changed_b, new_c])
+
+    assert [node.node_id for node in upsert] == ["b", "c"]
+    assert set(hashes) == {"a", "b", "c"}
+    assert manifest.stale_node_ids("f.json", set(hashes)) == []
+    assert manifest.stale_node_ids("f.json", {"a"}) == ["b"]
+
+
+def test_new_file_nodes_are_all_upserted(tmp_path):
+    manifest = IndexManifest(str(tmp_path / "manifest.json"), SIGNATURE)
+    nodes = [make_node("a", "气虚"), make_node("b", "血虚")]
+
+    upsert, _ = manifest.diff_nodes("new.json", nodes)
+
+    assert upsert == nodes
+    assert manifest.stale_node_ids("new.json", {"a", "b"}) == []
+
+
+def test_removed_files_and_merge_nodes(tmp_path):
+    manifest = IndexManifest(str(tmp_path / "manifest.json"), SIGNATURE)
+    manifest.update_file("keep.json", "h1", {"a": "x"})
+    manifest.update_file("gone.json", "h2", {"b": "y"})
+
+    assert manifest.removed_files({"keep.json"}) == ["gone.json"]
+
+    # 未处理完的文件只合并节点，保留原哈希，下次构建会重新处理
+    manifest.merge_nodes("keep.json", {"c": "z"})
+    manifest.merge_nodes("partial.json", {"d": "w"})
+    assert manifest.file_hashes() == {"keep.json": "h1", "gone.json": "h2", "partial.json": ""}
+    assert sorted(manifest.file_node_ids("keep.json")) == ["a", "c"]
+
+
+def test_save_and_load_round_trip(tmp_path):
+    path = str(tmp_path / "index" / "manifest.json")
+    manifest = IndexManifest(path, SIGNATURE)
+    manifest.update_file("f.json", "h1", {"a": "x", "b": "y"})
+    manifest.save()
+
+    loaded = IndexManifest.load(path, SIGNATURE)
+
+    assert loaded.files == manifest.files
+    assert loaded.num_nodes == 2
+    assert loaded.fingerprint() == manifest.fingerprint()
+
+
+def test_signature_change_yields_empty_manifest(tmp_path):
+    path = str(tmp_path / "manifest.json")
+    manifest = IndexManifest(path, SIGNATURE)
+    manifest.update_file("f.json", "h1", {"a": "x"})
+    manifest.save()
+
+    loaded = IndexManifest.load(path, dict(SIGNATURE, chunk_size=256))
+
+    assert loaded.is_empty
+
+
+def test_corrupt_manifest_yields_empty_manifest(tmp_path):
+    path = tmp_path / "manifest.json"
+    path.write_text("{not json", encoding="utf-8")
+
+    assert IndexManifest.load(str(path), SIGNATURE).is_empty
+
+
+def test_fingerprint_tracks_file_hashes(tmp_path):
+    manifest = IndexManifest(str(tmp_path / "manifest.json"), SIGNATURE)
+    manifest.update_file("f.json", "h1", {"a": "x"})
+    before = manifest.fingerprint()
+
+    manifest.update_file("f.json", "h2", {"a": "x"})
+
+    assert manifest.fingerprint() != before
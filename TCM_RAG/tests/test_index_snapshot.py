@@ -0,0 +1,90 @@
+# tests/test_index_snapshot.py
+"""索引快照：写入、LATEST 指针、加载与按文件产出快照向量"""
+import numpy as np
+import pytest
+from llama_index.core import Document
+from llama_index.core.schema import TextNode
+
+from services.index_snapshot import load_snapshot, write_snapshot
+from services.sparse_index import BM25Index
+
+
+SIGNATURE = {"embed_model_path": "bge", "dim": 3}
+
+
+def make_corpus():
+    documents = [
+        Document(id_="d1", text="风湿困表证 头部沉重", metadata={"file_path": "a.json", "file_hash": "ha"}),
+        Document(id_="d2", text="心脾两虚 心悸失眠", metadata={"file_path": "b.json", "file_hash": "hb"}),
+    ]
+    nodes = [
+        TextNode(id_="n1", text="风湿困表证", metadata={"file_path": "a.json"}),
+        TextNode(id_="n2", text="头部沉重", metadata={"file_path": "a.json"}),
+        TextNode(id_="n3", text="心脾两虚", metadata={"file_path": "b.json"}),
+    ]
+    embeddings = [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0]]
+    return documents, nodes, embeddings
+
+
+def write(tmp_path, version="v1", **kwargs):
+    documents, nodes, embeddings = make_corpus()
+    return write_snapshot(
+        output_dir=str(tmp_path),
+        version=version,
+        nodes=nodes,
+        embeddings=embeddings,
+        documents=documents,
+        bm25=BM25Index.build([doc.text for doc in documents]),
+        signature=SIGNATURE,
+        **kwargs
+    )
+
+
+def test_round_trip_through_latest_pointer(tmp_path):
+    write(tmp_path, "v1")
+    write(tmp_path, "v2")
+
+    snapshot = load_snapshot(str(tmp_path))
+
+    assert snapshot.version == "v2"
+    assert snapshot.manifest["signature"] == SIGNATURE
+    assert snapshot.manifest["files"] == {"a.json": "ha", "b.json": "hb"}
+    assert snapshot.manifest["embed_dim"] == 3
+    assert [node.node_id for node in snapshot.nodes] == ["n1", "n2", "n3"]
+    assert isinstance(snapshot.embeddings, np.memmap)
+    assert snapshot.bm25.search("心悸", top_k=1)[0][0] == 1
+
+
+def test_no_latest_keeps_previous_version(tmp_path):
+    write(tmp_path, "v1")
+    write(tmp_path, "v2", update_latest=False)
+
+    assert load_snapshot(str(tmp_path)).version == "v1"
+    assert load_snapshot(str(tmp_path / "v2")).version == "v2"
+
+
+def test_existing_version_is_not_overwritten(tmp_path):
+    write(tmp_path, "v1")
+    with pytest.raises(FileExistsError):
+        write(tmp_path, "v1")
+
+
+def test_missing_snapshot(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        load_snapshot(str(tmp_path))
+
+
+def test_iter_processed_files_yields_rows_of_changed_files(tmp_path):
+    write(tmp_path)
+    snapshot = load_snapshot(str(tmp_path))
+
+    parts = {part.file_path: part for part in snapshot.iter_processed_files({"b.json": "hb"})}
+
+    changed = parts["a.json"]
+    assert [node.node_id for node in changed.nodes] == ["n1", "n2"]
+    np.testing.assert_array_equal(changed.embeddings, [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0]])
+    assert [doc.doc_id for doc in changed.documents] == ["d1"]
+
+    unchanged = parts["b.json"]
+    assert unchanged.nodes is None and unchanged.embeddings is None
+    assert [doc.doc_id for doc in unchanged.documents] == ["d2"]
@@ -0,0 +1,94 @@
+# tests/test_json_stream.py
+"""iter_json_records：任意读取块大小下与 json.loads 结果一致，偏移可用于断点续读"""
+import codecs
+import json
+
+import pytest
+
+from utils.json_stream import iter_json_records
+
+
+CHUNK_SIZES = [1, 2, 3, 5, 7, 64]
+
+ARRAYS = {
+    "numbers": "[1234567, 2, 3.5, -0.25, 1e5, 2E-3, 0]",
+    "literals": "[true, false, null, true]",
+    "strings": '["桂枝汤", "a\\u00e9\\"b\\\\", "换行\\n制表\\t", "", "😀"]',
+    "records": json.dumps([
+        {"pattern": "风湿困表证", "dose": 12.5, "herbs": ["苏叶", "羌活"]},
+        {"pattern": "心脾两虚", "dose": 100, "note": "引号\"与反斜杠\\"},
+    ], ensure_ascii=False),
+    "nested": "[[1, 22], {\"a\": [333]}, [], {}]",
+    "whitespace": "  [\n  1 ,\n\t22\r\n ,333  ]\n",
+}
+
+
+def write(tmp_path, name: str, text: str, bom: bool = False):
+    path = tmp_path / name
+    path.write_bytes((codecs.BOM_UTF8 if bom else b"") + text.encode("utf-8"))
+    return path
+
+
+@pytest.mark.parametrize("chunk_size", CHUNK_SIZES)
+@pytest.mark.parametrize("name", sorted(ARRAYS))
+def test_top_level_array(tmp_path, name, chunk_size):
+    text = ARRAYS[name]
+    path = write(tmp_path, "data.json", text)
+
+    records = list(iter_json_records(path, chunk_size=chunk_size))
+
+    assert [record.value for record in records] == json.loads(text)
+    assert [record.index for record in records] == list(range(len(records)))
+
+
+@pytest.mark.parametrize("chunk_size", CHUNK_SIZES)
+def test_concatenated_values(tmp_path, chunk_size):
+    path = write(tmp_path, "data.json", '12 345\n{"a": 1}{"b": "x"} "s" true 6.5')
+
+    values = [record.value for record in iter_json_records(path, chunk_size=chunk_size)]
+
+    assert values == [12, 345, {"a": 1}, {"b": "x"}, "s", True, 6.5]
+
+
+@pytest.mark.parametrize("chunk_size", CHUNK_SIZES)
+def test_byte_offsets_resume_after_any_record(tmp_path, chunk_size):
+    text = ARRAYS["records"]
+    path = write(tmp_path, "data.json", text, bom=True)
+    raw = path.read_bytes()
+    records = list(iter_json_records(path, chunk_size=chunk_size))
+
+    for record in records:
+        assert json.loads(raw[record.start_offset:record.end_offset].decode("utf-8")) == record.value
+
+    first = records[0]
+    resumed = list(iter_json_records(
+        path, start_offset=first.end_offset, start_index=first.index + 1, chunk_size=chunk_size
+    ))
+    assert [(r.index, r.value) for r in resumed] == [(r.index, r.value) for r in records[1:]]
+
+
+def test_json_lines(tmp_path):
+    lines = [{"pattern": "风湿困表证"}, {"pattern": "心脾两虚", "dose": 1234567}]
+    path = write(tmp_path, "data.jsonl", "\n".join(json.dumps(line, ensure_ascii=False) for line in lines) + "\n\n")
+
+    records = list(iter_json_records(path))
+
+    assert [record.value for record in records] == lines
+    resumed = list(iter_json_records(path, start_offset=records[0].end_offset, start_index=1))
+    assert [(r.index, r.value) for r in resumed] == [(1, lines[1])]
+
+
+@pytest.mark.parametrize("chunk_size", CHUNK_SIZES)
+def test_truncated_file_raises(tmp_path, chunk_size):
+    path = write(tmp_path, "data.json", '[{"pattern": "心脾两虚"}, {"pattern": "风湿')
+
+    records = iter_json_records(path, chunk_size=chunk_size)
+
+    assert next(records).value == {"pattern": "心脾两虚"}
+    with pytest.raises(json.JSONDecodeError):
+        next(records)
+
+
+def test_empty_file_and_empty_array(tmp_path):
+    assert list(iter_json_records(write(tmp_path, "empty.json", "  \n"))) == []
+    assert list(iter_json_records(write(tmp_path, "array.json", "[ ]"), chunk_size=1)) == []
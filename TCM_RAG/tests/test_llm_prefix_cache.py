@@ -0,0 +1,102 @@
+# tests/test_llm_prefix_cache.py
+"""前缀KV缓存与流式取消：用极小的HF模型验证贪心解码在复用前缀缓存前后输出一致"""
+import threading
+
+import pytest
+
+torch = pytest.importorskip("torch")
+transformers = pytest.importorskip("transformers")
+tokenizers = pytest.importorskip("tokenizers")
+pytest.importorskip("llama_index.llms.huggingface")
+
+from llama_index.llms.huggingface import HuggingFaceLLM
+from models.hf_llm import HFGenerationLLM, PrefixCachedLLM
+
+
+PREFIX = "You are a helpful assistant. Answer the question using the material below.\n\n"
+PROMPTS = [
+    PREFIX + "Material: Ginseng tonifies qi.\nQuestion: What does ginseng do?\nAnswer:",
+    PREFIX + "Material: Angelica nourishes blood.\nQuestion: What does angelica do?\nAnswer:",
+]
+
+
+def tiny_gpt2():
+    """本地构造一个很小的随机GPT2及按字切分的分词器，不依赖网络下载"""
+    vocab = {"<unk>": 0, "<eos>": 1}
+    for char in sorted(set("".join(PROMPTS))):
+        vocab.setdefault(char, len(vocab))
+    backend = tokenizers.Tokenizer(tokenizers.models.WordLevel(vocab, unk_token="<unk>"))
+    backend.pre_tokenizer = tokenizers.pre_tokenizers.Split(tokenizers.Regex("."), behavior="isolated")
+    backend.decoder = tokenizers.decoders.Fuse()
+    tokenizer = transformers.PreTrainedTokenizerFast(
+        tokenizer_object=backend,
+        unk_token="<unk>",
+        eos_token="<eos>",
+        pad_token="<eos>",
+        model_input_names=["input_ids", "attention_mask"]
+    )
+
+    torch.manual_seed(0)
+    # 初始化方差取大一些，随机模型的贪心输出不至于全是同一个字符
+    config = transformers.GPT2Config(
+        vocab_size=len(vocab),
+        n_positions=256,
+        n_embd=32,
+        n_layer=2,
+        n_head=2,
+        initializer_range=0.5,
+        bos_token_id=1,
+        eos_token_id=1,
+        pad_token_id=1
+    )
+    return transformers.GPT2LMHeadModel(config).eval(), tokenizer
+
+
+@pytest.fixture(scope="module")
+def hf_llm():
+    model, tokenizer = tiny_gpt2()
+    return HuggingFaceLLM(
+        model=model,
+        tokenizer=tokenizer,
+        max_new_tokens=16,
+        generate_kwargs={"do_sample": False}
+    )
+
+
+@pytest.fixture(scope="module")
+def cached_llm(hf_llm):
+    llm = PrefixCachedLLM(hf_llm)
+    llm.register_prefix("test", PREFIX)
+    return llm
+
+
+@pytest.mark.parametrize("prompt", PROMPTS)
+def test_prefix_cache_keeps_greedy_output(hf_llm, cached_llm, prompt):
+    hits = cached_llm.get_stats()["prefix_hits"]
+    expected = HFGenerationLLM(hf_llm).complete(prompt).text
+
+    assert cached_llm.complete(prompt).text == expected
+    assert cached_llm.get_stats()["prefix_hits"] == hits + 1
+
+
+def test_prefix_cache_reused_across_requests(cached_llm):
+    # generate 会原地扩展缓存：每次请求必须使用独立副本，重复请求结果不变
+    first = cached_llm.complete(PROMPTS[0]).text
+    cached_llm.complete(PROMPTS[1])
+    assert cached_llm.complete(PROMPTS[0]).text == first
+
+
+def test_stream_matches_complete(cached_llm):
+    chunks = list(cached_llm.stream_complete(PROMPTS[0]))
+
+    assert "".join(chunk.delta for chunk in chunks) == cached_llm.complete(PROMPTS[0]).text
+
+
+def test_stop_event_ends_generation(cached_llm):
+    stop = threading.Event()
+    stop.set()
+
+    text = "".join(chunk.delta for chunk in cached_llm.stream_complete(PROMPTS[0], stop_event=stop))
+
+    # 停止条件在生成第一个token后即生效
+    assert len(cached_llm.tokenizer(text, add_special_tokens=False)["input_ids"]) <= 1
@@ -0,0 +1,185 @@
+# tests/test_local_vector_store.py
+"""LocalVectorStore：写入、删除、重新打开、检索、压缩与读写锁"""
+import os
+import threading
+
+import numpy as np
+import pytest
+from llama_index.core.schema import TextNode
+from llama_index.core.vector_stores.types import (
+    FilterOperator,
+    MetadataFilter,
+    MetadataFilters,
+    VectorStoreQuery,
+)
+
+from services.local_vector_store import (
+    COMPACTING_SUFFIX,
+    LOG_FILE,
+    VECTORS_FILE,
+    LocalVectorStore,
+    _ReadWriteLock,
+    hnswlib,
+)
+
+
+DIM = 4
+INDEX_TYPES = ["FLAT", pytest.param("HNSW", marks=pytest.mark.skipif(hnswlib is None, reason="hnswlib is not installed"))]
+
+
+def unit(i: int) -> list:
+    vector = [0.0] * DIM
+    vector[i % DIM] = 1.0
+    return vector
+
+
+def make_node(node_id: str, axis: int, **metadata) -> TextNode:
+    return TextNode(id_=node_id, text=f"text {node_id}", embedding=unit(axis), metadata=metadata)
+
+
+def open_store(path, index_type="FLAT", **kwargs) -> LocalVectorStore:
+    return LocalVectorStore(persist_dir=str(path), dim=DIM, index_type=index_type, **kwargs)
+
+
+def top_ids(store, axis: int, k: int = 1, **kwargs) -> list:
+    result = store.query(VectorStoreQuery(query_embedding=unit(axis), similarity_top_k=k, **kwargs))
+    return result.ids
+
+
+@pytest.mark.parametrize("index_type", INDEX_TYPES)
+def test_insert_query_delete_reopen(tmp_path, index_type):
+    store = open_store(tmp_path, index_type)
+    store.add([make_node("a", 0), make_node("b", 1), make_node("c", 2)])
+
+    result = store.query(VectorStoreQuery(query_embedding=unit(1), similarity_top_k=1))
+    assert result.ids == ["b"]
+    assert result.similarities[0] == pytest.approx(1.0, abs=1e-5)
+    assert result.nodes[0].get_content() == "text b"
+
+    store.delete_nodes(["b"])
+    assert "b" not in top_ids(store, 1, k=3)
+    store.persist()
+
+    reopened = open_store(tmp_path, index_type, compact_ratio=0)
+    assert sorted(top_ids(reopened, 0, k=3)) == ["a", "c"]
+    assert top_ids(reopened, 2) == ["c"]
+
+
+def test_add_same_id_replaces_node(tmp_path):
+    store = open_store(tmp_path, compact_ratio=0)
+    store.add([make_node("a", 0), make_node("b", 1)])
+    store.add([make_node("a", 2)])
+
+    assert top_ids(store, 2) == ["a"]
+    assert sorted(top_ids(store, 0, k=5)) == ["a", "b"]
+    assert store.num_dead_rows == 1
+
+    reopened = open_store(tmp_path, compact_ratio=0)
+    assert top_ids(reopened, 2) == ["a"]
+
+
+def test_query_many_matches_query(tmp_path):
+    store = open_store(tmp_path)
+    store.add([make_node(f"n{i}", i) for i in range(DIM)])
+    queries = [VectorStoreQuery(query_embedding=unit(i), similarity_top_k=2) for i in range(DIM)]
+
+    batched = store.query_many(queries)
+
+    for query, result in zip(queries, batched):
+        assert result.ids == store.query(query).ids
+
+
+def test_filters_restrict_candidates(tmp_path):
+    store = open_store(tmp_path)
+    store.add([make_node("a", 0, file_path="x.json"), make_node("b", 0, file_path="y.json")])
+    filters = MetadataFilters(filters=[MetadataFilter(key="file_path", value="y.json", operator=FilterOperator.EQ)])
+
+    assert top_ids(store, 0, k=2, filters=filters) == ["b"]
+
+
+def test_compact_drops_dead_rows(tmp_path):
+    store = open_store(tmp_path, compact_ratio=0)
+    store.add([make_node(f"n{i}", i) for i in range(8)])
+    store.delete_nodes([f"n{i}" for i in range(0, 8, 2)])
+    store.add([make_node("n1", 3)])
+    vectors_before = os.path.getsize(tmp_path / VECTORS_FILE)
+
+    store.compact()
+
+    assert store.num_dead_rows == 0
+    assert os.path.getsize(tmp_path / VECTORS_FILE) < vectors_before
+    with open(tmp_path / LOG_FILE, encoding="utf-8") as f:
+        assert len(f.readlines()) == 4
+    assert sorted(top_ids(store, 1, k=8)) == ["n1", "n3", "n5", "n7"]
+    assert top_ids(store, 1) == ["n5"]
+
+    reopened = open_store(tmp_path)
+    assert sorted(top_ids(reopened, 1, k=8)) == ["n1", "n3", "n5", "n7"]
+
+
+def test_compacts_on_load_and_persist_above_ratio(tmp_path):
+    store = open_store(tmp_path, compact_ratio=0)
+    store.add([make_node(f"n{i}", i) for i in range(10)])
+    store.delete_nodes(["n0", "n1", "n2"])
+    assert store.num_dead_rows == 3
+
+    assert open_store(tmp_path, compact_ratio=0.5).num_dead_rows == 3
+    assert open_store(tmp_path, compact_ratio=0.3).num_dead_rows == 0
+
+    store = open_store(tmp_path, compact_ratio=0.3)
+    store.delete_nodes(["n3", "n4", "n5"])
+    store.persist()
+    assert store.num_dead_rows == 0
+    assert sorted(top_ids(store, 0, k=10)) == ["n6", "n7", "n8", "n9"]
+
+
+def test_recovers_interrupted_compaction(tmp_path):
+    path = tmp_path / "store"
+    store = open_store(path, compact_ratio=0)
+    store.add([make_node("a", 0), make_node("b", 1)])
+    # 新目录已写好、原目录已移走时中断
+    os.replace(path, tmp_path / ("store" + COMPACTING_SUFFIX))
+
+    assert sorted(top_ids(open_store(path), 0, k=2)) == ["a", "b"]
+    assert not (tmp_path / ("store" + COMPACTING_SUFFIX)).exists()
+
+
+def test_reads_run_concurrently_and_writes_wait():
+    lock = _ReadWriteLock()
+    second_reader = threading.Event()
+    writer_done = threading.Event()
+
+    def read():
+        with lock.read():
+            second_reader.set()
+
+    def write():
+        with lock.write():
+            writer_done.set()
+
+    with lock.read():
+        threading.Thread(target=read).start()
+        assert second_reader.wait(1)
+
+        threading.Thread(target=write).start()
+        assert not writer_done.wait(0.1)
+    assert writer_done.wait(1)
+
+
+def test_dim_mismatch_is_rejected(tmp_path):
+    open_store(tmp_path).add([make_node("a", 0)])
+    with pytest.raises(ValueError):
+        LocalVectorStore(persist_dir=str(tmp_path), dim=DIM + 1, index_type="FLAT")
+    with pytest.raises(ValueError):
+        open_store(tmp_path).add([TextNode(id_="x", text="x", embedding=[1.0] * (DIM + 1))])
+
+
+def test_float16_store_round_trips(tmp_path):
+    store = open_store(tmp_path, dtype="float16")
+    store.add([make_node("a", 0), make_node("b", 1)])
+
+    reopened = open_store(tmp_path, dtype="float16")
+
+    result = reopened.query(VectorStoreQuery(query_embedding=unit(1), similarity_top_k=1))
+    assert result.ids == ["b"]
+    assert np.isclose(result.similarities[0], 1.0, atol=1e-3)
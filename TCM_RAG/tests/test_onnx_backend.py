@@ -0,0 +1,99 @@
+# tests/test_onnx_backend.py
+"""ONNX后端：导出文件位置、已导出时不重复导出、CLS + L2归一化输出，以及与PyTorch的精度漂移"""
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from models import onnx_backend
+from models.onnx_backend import OnnxEncoder, onnx_model_paths, prepare_onnx_model
+
+
+class FakeSession:
+    """返回固定 last_hidden_state 的推理会话替身，记录喂入的张量"""
+
+    def __init__(self, last_hidden_state, input_names):
+        self.last_hidden_state = last_hidden_state
+        self.input_names = input_names
+        self.feeds = None
+
+    def get_inputs(self):
+        return [SimpleNamespace(name=name) for name in self.input_names]
+
+    def run(self, output_names, feeds):
+        self.feeds = feeds
+        return [self.last_hidden_state]
+
+
+@pytest.fixture
+def fake_ort(monkeypatch):
+    sessions = []
+
+    def make_session(path, options, providers):
+        session = FakeSession(
+            np.array([[[3.0, 4.0], [9.0, 9.0]], [[0.0, 2.0], [9.0, 9.0]]], dtype=np.float32),
+            ["input_ids", "attention_mask"]
+        )
+        sessions.append(session)
+        return session
+
+    monkeypatch.setattr(onnx_backend, "ort", SimpleNamespace(
+        SessionOptions=lambda: SimpleNamespace(),
+        GraphOptimizationLevel=SimpleNamespace(ORT_ENABLE_ALL="all"),
+        InferenceSession=make_session
+    ))
+    return sessions
+
+
+def test_model_paths_use_model_directory_name():
+    paths = onnx_model_paths("/models/bge-large-zh/", ".cache/onnx")
+
+    assert paths["fp32"] == Path(".cache/onnx/bge-large-zh/model.onnx")
+    assert paths["int8"] == Path(".cache/onnx/bge-large-zh/model.int8.onnx")
+
+
+def test_encoder_takes_cls_and_normalizes(fake_ort):
+    encoder = OnnxEncoder(Path("model.onnx"), intra_op_threads=2)
+
+    embeddings = encoder.encode({
+        "input_ids": np.array([[1, 2], [3, 4]], dtype=np.int32),
+        "attention_mask": np.ones((2, 2), dtype=np.int32),
+        "token_type_ids": np.zeros((2, 2), dtype=np.int32),
+    })
+
+    np.testing.assert_allclose(embeddings, [[0.6, 0.8], [0.0, 1.0]], rtol=1e-6)
+    feeds = fake_ort[0].feeds
+    assert set(feeds) == {"input_ids", "attention_mask"}
+    assert all(value.dtype == np.int64 for value in feeds.values())
+
+
+def test_existing_export_is_reused(tmp_path, monkeypatch):
+    target = onnx_model_paths("bge", str(tmp_path))["int8"]
+    target.parent.mkdir(parents=True)
+    target.write_bytes(b"onnx")
+    monkeypatch.setattr(onnx_backend, "export_onnx", pytest.fail)
+
+    assert prepare_onnx_model("bge", tokenizer=None, cache_dir=str(tmp_path)) == target
+
+
+def test_missing_onnxruntime_raises_import_error(monkeypatch):
+    monkeypatch.setattr(onnx_backend, "ort", None)
+
+    with pytest.raises(ImportError, match="onnxruntime"):
+        OnnxEncoder(Path("model.onnx"))
+
+
+def test_export_matches_torch(tiny_bert_path, tmp_path):
+    pytest.importorskip("onnxruntime")
+    pytest.importorskip("onnx")
+    from transformers import AutoModel, AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(tiny_bert_path)
+    model = AutoModel.from_pretrained(tiny_bert_path)
+
+    onnx_path = prepare_onnx_model(tiny_bert_path, tokenizer, str(tmp_path), quantize=False, torch_model=model)
+    report = onnx_backend.check_accuracy(model, tokenizer, onnx_path, onnx_backend.SAMPLE_TEXTS[:3])
+
+    assert onnx_path.exists()
+    assert report["max_cosine_drift"] < 1e-4
@@ -0,0 +1,137 @@
+# tests/test_openai_llm.py
+"""OpenAICompatibleLLM：用 httpx.MockTransport 模拟 OpenAI 兼容的 /completions 接口"""
+import json
+import subprocess
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+
+from models.llm import OpenAICompatibleLLM
+
+
+API_BASE = "http://llm.test/v1"
+ROOT = Path(__file__).resolve().parents[1]
+
+
+class ClosableStream(httpx.SyncByteStream):
+    """逐块返回SSE事件，记录读取进度和是否被关闭"""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.sent = 0
+        self.closed = False
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            self.sent += 1
+            yield chunk
+
+    def close(self):
+        self.closed = True
+
+
+def sse(*events) -> list:
+    return [f"data: {event}\n\n".encode("utf-8") for event in events]
+
+
+def text_event(text: str) -> str:
+    return json.dumps({"choices": [{"index": 0, "text": text}]}, ensure_ascii=False)
+
+
+def make_llm(handler, **kwargs) -> OpenAICompatibleLLM:
+    return OpenAICompatibleLLM(
+        api_base=API_BASE,
+        model="tcm-test",
+        api_key="secret",
+        max_new_tokens=32,
+        temperature=0.0,
+        transport=httpx.MockTransport(handler),
+        **kwargs
+    )
+
+
+def test_complete():
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(200, json={"choices": [{"index": 0, "text": "气血两虚"}]})
+
+    llm = make_llm(handler)
+    response = llm.complete("问题", max_tokens=8)
+
+    assert response.text == "气血两虚"
+    request = requests[0]
+    assert request.method == "POST"
+    assert request.url == f"{API_BASE}/completions"
+    assert request.headers["Authorization"] == "Bearer secret"
+    payload = json.loads(request.content)
+    assert payload == {"model": "tcm-test", "prompt": "问题", "max_tokens": 8, "temperature": 0.0, "stream": False}
+    assert llm.get_stats()["requests"] == 1
+
+
+def test_stream_complete_stops_at_done():
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert json.loads(request.content)["stream"] is True
+        events = sse(text_event("气"), text_event(""), text_event("血"), "[DONE]", text_event("不应出现"))
+        return httpx.Response(200, headers={"content-type": "text/event-stream"}, stream=ClosableStream(events))
+
+    chunks = list(make_llm(handler).stream_complete("问题"))
+
+    assert [chunk.delta for chunk in chunks] == ["气", "血"]
+    assert chunks[-1].text == "气血"
+
+
+def test_http_error():
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(503, json={"error": "overloaded"})
+
+    llm = make_llm(handler)
+    with pytest.raises(httpx.HTTPStatusError):
+        llm.complete("问题")
+    with pytest.raises(httpx.HTTPStatusError):
+        list(llm.stream_complete("问题"))
+
+    assert llm.get_stats()["errors"] == 2
+
+
+def test_closing_stream_early_closes_response():
+    stream = ClosableStream(sse(*[text_event(str(i)) for i in range(100)], "[DONE]"))
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, headers={"content-type": "text/event-stream"}, stream=stream)
+
+    chunks = make_llm(handler).stream_complete("问题")
+    assert next(chunks).delta == "0"
+    chunks.close()
+
+    assert stream.closed
+    assert stream.sent < 100
+
+
+def test_stop_event_closes_response():
+    stream = ClosableStream(sse(*[text_event(str(i)) for i in range(100)], "[DONE]"))
+    stop = threading.Event()
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, headers={"content-type": "text/event-stream"}, stream=stream)
+
+    deltas = []
+    for chunk in make_llm(handler).stream_complete("问题", stop_event=stop):
+        deltas.append(chunk.delta)
+        stop.set()
+
+    assert deltas == ["0"]
+    assert stream.closed
+
+
+def test_import_does_not_load_torch():
+    # 外部补全服务的客户端不需要 torch/transformers，只有进程内HF后端（models/hf_llm.py）才加载
+    code = "import sys, models.llm; print('torch' in sys.modules, 'transformers' in sys.modules)"
+    output = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True).stdout
+
+    assert output.split() == ["False", "False"]
@@ -0,0 +1,396 @@
+# tests/test_retriever.py
+"""EnterpriseRetriever：请求内重排分数复用、候选对上限、跳过重排、并发检索、异步路径与跨请求微批（模型、向量库与Redis均为替身）"""
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import pytest
+from llama_index.core import Document
+from llama_index.core.schema import NodeRelationship, NodeWithScore, RelatedNodeInfo, TextNode
+
+retriever_module = pytest.importorskip("services.retriever")
+
+from config.settings import RetrievalConfig
+from services.retriever import EnterpriseRetriever
+
+
+DOCUMENTS = [
+    Document(id_="d0", text="风湿困表证：头部沉重痛胀，遇阴雨天加重"),
+    Document(id_="d1", text="心脾两虚：心悸失眠，多梦易醒"),
+    Document(id_="d2", text="肾阴虚证：腰膝酸软，五心烦热"),
+    Document(id_="d3", text="肝阳上亢：头痛眩晕，急躁易怒"),
+]
+
+
+def chunk(node_id, doc_id, text):
+    return TextNode(id_=node_id, text=text, relationships={NodeRelationship.SOURCE: RelatedNodeInfo(node_id=doc_id)})
+
+
+CHUNKS = {
+    "c0": chunk("c0", "d0", "头部沉重痛胀"),
+    "c1": chunk("c1", "d1", "心悸失眠"),
+    "c2": chunk("c2", "d2", "腰膝酸软"),
+    "c3": chunk("c3", "d3", "头痛眩晕"),
+}
+
+
+class FakeVectorRetriever:
+    """按查询文本返回预设的分块排名，每次返回新的 NodeWithScore（重排会改写分数）"""
+
+    def __init__(self, rankings):
+        self.rankings = rankings
+        self.queries = []
+
+    def retrieve(self, query):
+        query = getattr(query, "query_str", query)
+        self.queries.append(query)
+        return [NodeWithScore(node=CHUNKS[node_id], score=score) for node_id, score in self.rankings.get(query, [])]
+
+    async def aretrieve(self, query):
+        return self.retrieve(query)
+
+
+class FakeEmbedModel:
+    def __init__(self):
+        self.calls = []
+
+    def get_query_embedding(self, query):
+        self.calls.append([query])
+        return [float(len(query)), 1.0]
+
+    def get_query_embeddings(self, queries):
+        self.calls.append(list(queries))
+        return [[float(len(query)), 1.0] for query in queries]
+
+
+class FakeReranker:
+    """按文本查分数的重排模型替身，记录每次 predict 的候选对"""
+
+    def __init__(self, scores=None, default=0.1):
+        self.scores = scores or {}
+        self.default = default
+        self.calls = []
+
+    def predict(self, pairs, batch_size=32):
+        self.calls.append(list(pairs))
+        return [self.scores.get(text, self.default) for _, text in pairs]
+
+    @property
+    def scored_texts(self):
+        return [text for call in self.calls for _, text in call]
+
+
+class FakeLLM:
+    def __init__(self, text):
+        self.text = text
+        self.prompts = []
+
+    def complete(self, prompt):
+        self.prompts.append(prompt)
+        return SimpleNamespace(text=self.text)
+
+
+@pytest.fixture(autouse=True)
+def fake_cache(cache, monkeypatch):
+    monkeypatch.setattr(retriever_module, "cache_manager", cache)
+    return cache
+
+
+def make_retriever(rankings, reranker=None, embed_model=None, **config):
+    config.setdefault("term_dictionary_path", None)
+    return EnterpriseRetriever(
+        vector_retriever=FakeVectorRetriever(rankings),
+        documents=DOCUMENTS,
+        rerank_model_path="unused",
+        config=RetrievalConfig(**config),
+        embed_model=embed_model,
+        reranker=reranker or FakeReranker()
+    )
+
+
+def test_expansion_only_scores_new_candidates():
+    reranker = FakeReranker({"头痛眩晕": 0.9})
+    retriever = make_retriever(
+        {"头痛": [("c0", 0.8)], "头疼": [("c0", 0.8), ("c3", 0.7)]},
+        reranker=reranker,
+        embed_model=FakeEmbedModel(),
+        similarity_top_k=2
+    )
+
+    results, total, method = retriever._rank_candidates(
+        "头痛", retriever._dense_retrieve("头痛"), [], llm=FakeLLM("头疼")
+    )
+
+    assert len(reranker.calls) == 2
+    assert reranker.calls[1] == [("头痛", "头痛眩晕")]
+    assert sorted(reranker.scored_texts) == sorted(set(reranker.scored_texts))
+    assert [r.node.node_id for r in results] == ["c3"]
+    assert method == "hybrid_expanded" and total == 2
+
+
+def test_expansion_without_new_candidates_does_not_rerank_again():
+    reranker = FakeReranker()
+    retriever = make_retriever(
+        {"头痛": [("c0", 0.8)], "头疼": [("c0", 0.8)]},
+        reranker=reranker,
+        embed_model=FakeEmbedModel()
+    )
+
+    retriever._rank_candidates("头痛", retriever._dense_retrieve("头痛"), [], llm=FakeLLM("头疼"))
+
+    assert len(reranker.calls) == 1
+
+
+def test_max_rerank_pairs_caps_scoring_across_expansion():
+    reranker = FakeReranker()
+    retriever = make_retriever(
+        {"头痛": [("c0", 0.9), ("c1", 0.8)], "头疼": [("c2", 0.9), ("c3", 0.8)]},
+        reranker=reranker,
+        embed_model=FakeEmbedModel(),
+        max_rerank_pairs=3
+    )
+
+    _, total, _ = retriever._rank_candidates("头痛", retriever._dense_retrieve("头痛"), [], llm=FakeLLM("头疼"))
+
+    assert len(reranker.scored_texts) == 3
+    assert reranker.calls[0] == [("头痛", "头部沉重痛胀"), ("头痛", "心悸失眠")]
+    assert total == 3
+
+
+def test_cap_keeps_scored_candidates_first():
+    retriever = make_retriever({}, max_rerank_pairs=2)
+    results = [NodeWithScore(node=CHUNKS[node_id], score=0.0) for node_id in ("c0", "c1", "c2", "c3")]
+
+    capped = retriever._cap_rerank_candidates(results, {"c2": 0.5})
+
+    assert [r.node.node_id for r in capped] == ["c0", "c2"]
+
+
+def dense(*ranking):
+    return [NodeWithScore(node=CHUNKS[node_id], score=score) for node_id, score in ranking]
+
+
+def sparse(*ranking):
+    return [NodeWithScore(node=DOCUMENTS[int(doc_id[1:])], score=score) for doc_id, score in ranking]
+
+
+@pytest.mark.parametrize("dense_ids, sparse_ids, expected", [
+    (["c0", "c1", "c2"], ["d0", "d1", "d2"], True),
+    (["c0", "c1", "c2"], ["d0", "d3"], False),
+    (["c0", "c1"], ["d1", "d0"], True),
+    (["c0"], [], False),
+])
+def test_rankings_agree_compares_documents(dense_ids, sparse_ids, expected):
+    retriever = make_retriever({}, rerank_agreement_top_n=3, rerank_agreement_threshold=0.6)
+
+    agree = retriever._rankings_agree(
+        dense(*[(node_id, 0.5) for node_id in dense_ids]),
+        sparse(*[(doc_id, 1.0) for doc_id in sparse_ids])
+    )
+
+    assert agree is expected
+
+
+@pytest.mark.parametrize("fusion_mode", ["rrf", "weighted"])
+def test_skipped_rerank_reports_dense_scores_and_applies_threshold(fusion_mode):
+    reranker = FakeReranker()
+    retriever = make_retriever(
+        {}, reranker=reranker, fusion_mode=fusion_mode, rerank_policy="adaptive",
+        score_threshold=0.4, min_good_results=2
+    )
+
+    results, total, method = retriever._rank_candidates(
+        "头痛",
+        dense(("c0", 0.82), ("c1", 0.65), ("c2", 0.3)),
+        sparse(("d0", 9.0), ("d1", 7.0), ("d2", 5.0), ("d3", 1.0))
+    )
+
+    assert reranker.calls == []
+    assert method == f"hybrid_{fusion_mode}_no_rerank" and total == 4
+    assert [(r.node.node_id, r.score) for r in results] == [("c0", 0.82), ("c1", 0.65)]
+
+
+def test_adaptive_reranks_when_too_few_results_pass_threshold():
+    reranker = FakeReranker({"头部沉重痛胀": 0.9, "心悸失眠": 0.8})
+    retriever = make_retriever(
+        {}, reranker=reranker, fusion_mode="rrf", rerank_policy="adaptive", min_good_results=2
+    )
+
+    results, _, method = retriever._rank_candidates(
+        "头痛", dense(("c0", 0.5), ("c1", 0.2)), sparse(("d0", 9.0), ("d1", 7.0))
+    )
+
+    assert len(reranker.calls) == 1
+    assert method == "hybrid_rrf"
+    assert [(r.node.node_id, r.score) for r in results] == [("c0", 0.9), ("c1", 0.8)]
+
+
+def test_never_policy_returns_filtered_fusion_order():
+    reranker = FakeReranker()
+    retriever = make_retriever({}, reranker=reranker, fusion_mode="rrf", rerank_policy="never")
+
+    results, _, _ = retriever._rank_candidates(
+        "头痛", dense(("c1", 0.3), ("c0", 0.7)), sparse(("d3", 9.0), ("d0", 7.0))
+    )
+
+    assert reranker.calls == []
+    assert [(r.node.node_id, r.score) for r in results] == [("c0", 0.7)]
+
+
+def test_rrf_fusion_is_document_level():
+    retriever = make_retriever({}, fusion_mode="rrf", rrf_k=60)
+
+    fused = retriever._fuse_results(dense(("c1", 0.9), ("c0", 0.8)), sparse(("d0", 9.0), ("d2", 5.0)))
+
+    assert [r.node.node_id for r in fused] == ["c0", "c1", "d2"]
+    assert fused[0].score == pytest.approx(1 / 62 + 1 / 61)
+    assert fused[1].score == pytest.approx(1 / 61)
+
+
+class FakeManyVectorStore:
+    """支持 query_many 的向量库替身：一次调用完成多个查询向量的检索，按查询向量首维（查询长度）返回预设排名"""
+
+    def __init__(self, rankings):
+        self.rankings = rankings
+        self.calls = []
+
+    def query_many(self, queries):
+        self.calls.append(len(queries))
+        results = []
+        for query in queries:
+            ids = self.rankings[int(query.query_embedding[0])]
+            results.append(SimpleNamespace(nodes=[CHUNKS[node_id] for node_id in ids], similarities=[0.9] * len(ids)))
+        return results
+
+
+def test_expansion_variants_embedded_and_searched_once():
+    embed_model = FakeEmbedModel()
+    retriever = make_retriever({}, embed_model=embed_model)
+    retriever.vector_store = FakeManyVectorStore({2: ["c3"], 3: ["c1", "c2"]})
+
+    results = retriever._dense_retrieve_many(["头疼", "头部疼"])
+
+    assert embed_model.calls == [["头疼", "头部疼"]]
+    assert retriever.vector_store.calls == [2]
+    assert [[r.node.node_id for r in rs] for rs in results] == [["c3"], ["c1", "c2"]]
+
+
+def test_expansion_without_query_many_searches_each_variant():
+    embed_model = FakeEmbedModel()
+    retriever = make_retriever({"头疼": [("c3", 0.9)], "头部疼": [("c1", 0.8)]}, embed_model=embed_model)
+
+    results = retriever._dense_retrieve_many(["头疼", "头部疼"])
+
+    assert embed_model.calls == [["头疼", "头部疼"]]
+    assert [[r.node.node_id for r in rs] for rs in results] == [["c3"], ["c1"]]
+
+
+def test_sparse_retrieval_runs_concurrently_with_dense():
+    sparse_started = threading.Event()
+
+    class BlockingVectorRetriever(FakeVectorRetriever):
+        def retrieve(self, query):
+            # 稀疏检索在后台线程中开始后密集检索才返回；串行执行时这里会超时
+            assert sparse_started.wait(timeout=5)
+            return super().retrieve(query)
+
+    retriever = make_retriever({}, reranker=FakeReranker(default=0.9))
+    retriever.vector_retriever = BlockingVectorRetriever({"头痛": [("c3", 0.9)]})
+    sparse_retrieve = retriever._sparse_retrieve
+
+    def tracked_sparse(query, top_k):
+        sparse_started.set()
+        return sparse_retrieve(query, top_k)
+
+    retriever._sparse_retrieve = tracked_sparse
+
+    result = retriever.hybrid_retrieve("头痛", use_cache=False)
+
+    assert {r.node.node_id for r in result.nodes} >= {"c3", "d3"}
+
+
+def test_async_retrieval_matches_sync(fake_cache):
+    rankings = {"头痛": [("c3", 0.9), ("c0", 0.6)]}
+    reranker = FakeReranker({"头痛眩晕": 0.9, "肝阳上亢：头痛眩晕，急躁易怒": 0.8})
+    sync_result = make_retriever(rankings, reranker=reranker, embed_model=FakeEmbedModel()).hybrid_retrieve(
+        "头痛", use_cache=False
+    )
+    retriever = make_retriever(rankings, reranker=reranker, embed_model=FakeEmbedModel())
+
+    async def run():
+        first = await retriever.ahybrid_retrieve("头痛")
+        second = await retriever.ahybrid_retrieve("头痛")
+        return first, second
+
+    first, second = asyncio.run(run())
+
+    expected = [(r.node.node_id, r.score) for r in sync_result.nodes]
+    assert [(r.node.node_id, r.score) for r in first.nodes] == expected
+    assert first.method_used == sync_result.method_used and not first.cache_hit
+    assert second.cache_hit and [(r.node.node_id, r.score) for r in second.nodes] == expected
+
+
+def test_async_rerank_runs_on_rerank_executor():
+    threads = []
+
+    class RecordingReranker(FakeReranker):
+        def predict(self, pairs, batch_size=32):
+            threads.append(threading.current_thread().name)
+            return super().predict(pairs, batch_size)
+
+    retriever = make_retriever({"头痛": [("c3", 0.9)]}, reranker=RecordingReranker(default=0.9))
+
+    asyncio.run(retriever.ahybrid_retrieve("头痛", use_cache=False))
+
+    assert threads and all(name.startswith("rerank") for name in threads)
+
+
+def test_concurrent_async_reranks_are_coalesced():
+    started, release = threading.Event(), threading.Event()
+
+    class GatedReranker(FakeReranker):
+        batch_sizes = []
+
+        def predict(self, pairs, batch_size=32):
+            self.batch_sizes.append(batch_size)
+            started.set()
+            assert release.wait(timeout=5)
+            return super().predict(pairs, batch_size)
+
+    reranker = GatedReranker({"头痛眩晕": 0.9})
+    retriever = make_retriever({}, reranker=reranker, batch_size=8, rerank_workers=1)
+    retriever.enable_rerank_batching(max_batch_pairs=64, max_wait_ms=50)
+    pairs = [("头痛", "头痛眩晕"), ("头痛", "心悸失眠")]
+
+    async def run():
+        first = asyncio.ensure_future(retriever._apredict_pairs(pairs))
+        while not started.is_set():
+            await asyncio.sleep(0.01)
+        # rerank_workers=1：调用方若占用线程池线程等待，这些请求无法同时排队
+        rest = [asyncio.ensure_future(retriever._apredict_pairs(pairs)) for _ in range(6)]
+        await asyncio.sleep(0.05)
+        release.set()
+        return await asyncio.gather(first, *rest)
+
+    results = asyncio.run(run())
+
+    assert results == [[0.9, 0.1]] * 7
+    assert len(reranker.calls) == 2 and len(reranker.calls[1]) == 12
+    assert reranker.batch_sizes == [64, 64]
+
+
+def test_cached_refs_rehydrate_in_another_worker(fake_cache):
+    rankings = {"头痛": [("c3", 0.9)]}
+    first = make_retriever(rankings, reranker=FakeReranker(default=0.9)).hybrid_retrieve("头痛")
+    fake_cache.l1.clear()
+
+    other = make_retriever({}, reranker=FakeReranker(default=0.9))
+    other.docstore.vector_store = SimpleNamespace(get_nodes=lambda node_ids: [CHUNKS[i] for i in node_ids if i in CHUNKS])
+    cached = other.hybrid_retrieve("头痛")
+
+    assert cached.cache_hit and cached.method_used == "cache"
+    assert [(r.node.node_id, r.score) for r in cached.nodes] == [(r.node.node_id, r.score) for r in first.nodes]
+
+    other.docstore.vector_store = SimpleNamespace(get_nodes=lambda node_ids: [])
+    other.docstore._nodes.clear()
+    assert not other.hybrid_retrieve("头痛").cache_hit
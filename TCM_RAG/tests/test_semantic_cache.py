@@ -0,0 +1,101 @@
+# tests/test_semantic_cache.py
+"""SemanticAnswerCache：相似度阈值、关键术语签名门控、TTL、误命中上报与审计记录"""
+import pytest
+
+from services import semantic_cache as semantic_cache_module
+from services.semantic_cache import SemanticAnswerCache, lexical_overlap
+from services.term_dictionary import TermDictionary
+
+
+ANSWER = {"answer": "滋阴补肾", "sources": [{"id": "d2"}], "confidence": 0.9, "context_used": "肾阴虚证"}
+
+TERMS = TermDictionary([
+    {"terms": ["肾阴虚", "肾阴不足"], "type": "pattern"},
+    {"terms": ["肾阳虚", "肾阳不足"], "type": "pattern"},
+    {"terms": ["当归"], "type": "herb"},
+])
+
+
+@pytest.fixture
+def cache():
+    return SemanticAnswerCache(dim=3, threshold=0.95, max_entries=4, ttl=60, term_fn=TERMS.key_terms)
+
+
+def test_hit_above_threshold_returns_stored_answer(cache):
+    cache.store("肾阴虚怎么调理", [1.0, 0.0, 0.0], ANSWER)
+
+    hit = cache.lookup("肾阴不足怎么调理", [0.99, 0.1, 0.0])
+
+    assert hit["answer"] == "滋阴补肾" and hit["sources"] == ANSWER["sources"]
+    assert hit["matched_question"] == "肾阴虚怎么调理"
+    assert hit["similarity"] == pytest.approx(0.995, abs=1e-3)
+    assert cache.lookup("肾阴虚怎么调理", [0.0, 1.0, 0.0]) is None
+    stats = cache.get_stats()
+    assert stats["hits"] == 1 and stats["lookups"] == 2 and stats["hit_rate"] == 0.5
+
+
+@pytest.mark.parametrize("stored, asked", [
+    ("肾阴虚怎么调理", "肾阳虚怎么调理"),
+    ("孕妇能吃当归吗", "孕妇不能吃当归吗"),
+    ("头痛加重怎么办", "头痛减轻怎么办"),
+])
+def test_key_term_mismatch_is_not_served(cache, stored, asked):
+    cache.store(stored, [1.0, 0.0, 0.0], ANSWER)
+
+    assert cache.lookup(asked, [1.0, 0.0, 0.0]) is None
+
+    [record] = cache.get_audit_log()
+    assert not record["served"] and record["suspect"] and record["differing_terms"]
+    assert cache.get_stats()["term_mismatches"] == 1
+
+
+def test_matching_signature_preferred_over_closer_mismatch(cache):
+    cache.store("肾阳虚怎么调理", [1.0, 0.0, 0.0], dict(ANSWER, answer="温补肾阳"))
+    cache.store("肾阴虚怎么调理", [0.97, 0.24, 0.0], ANSWER)
+
+    hit = cache.lookup("肾阴不足怎么调理", [1.0, 0.0, 0.0])
+
+    assert hit["answer"] == "滋阴补肾"
+
+
+def test_low_lexical_overlap_hit_flagged_suspect(cache):
+    cache.store("肾阴虚怎么调理", [1.0, 0.0, 0.0], ANSWER)
+
+    assert cache.lookup("肾阴不足吃什么好", [1.0, 0.0, 0.0]) is not None
+
+    [record] = cache.get_audit_log()
+    assert record["served"] and record["suspect"]
+    assert record["lexical_overlap"] == pytest.approx(lexical_overlap("肾阴不足吃什么好", "肾阴虚怎么调理"))
+    assert cache.get_stats()["suspect_hits"] == 1
+
+
+def test_entries_expire(cache, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(semantic_cache_module.time, "time", lambda: now[0])
+    cache.store("肾阴虚怎么调理", [1.0, 0.0, 0.0], ANSWER)
+
+    now[0] += 61
+
+    assert cache.lookup("肾阴虚怎么调理", [1.0, 0.0, 0.0]) is None
+    assert cache.get_stats()["size"] == 0
+
+
+def test_same_question_overwrites_and_ring_buffer_wraps(cache):
+    cache.store("肾阴虚怎么调理", [1.0, 0.0, 0.0], ANSWER)
+    cache.store("肾阴虚怎么调理", [1.0, 0.0, 0.0], dict(ANSWER, answer="新答案"))
+    assert cache.get_stats()["size"] == 1
+
+    for i in range(4):
+        cache.store(f"问题{i}", [0.0, 1.0, float(i)], ANSWER)
+
+    assert cache.lookup("肾阴虚怎么调理", [1.0, 0.0, 0.0]) is None
+    assert cache.get_stats()["size"] == 4
+
+
+def test_report_false_hit_removes_entry(cache):
+    cache.store("肾阴虚怎么调理", [1.0, 0.0, 0.0], ANSWER)
+
+    assert cache.report_false_hit("肾阴不足怎么调理", [1.0, 0.0, 0.0])
+    assert cache.lookup("肾阴不足怎么调理", [1.0, 0.0, 0.0]) is None
+    assert not cache.report_false_hit("肾阴不足怎么调理", [1.0, 0.0, 0.0])
+    assert cache.get_stats()["false_hit_reports"] == 1
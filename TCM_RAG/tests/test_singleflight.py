@@ -0,0 +1,216 @@
+# tests/test_singleflight.py
+"""SingleFlight：进程内合并、跨进程等待他人结果、持锁续期，以及 leader 中止时跟随者重新执行"""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from utils.singleflight import SingleFlight
+
+
+class Cancelled(BaseException):
+    """模拟 leader 被取消/中断（非 Exception）"""
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.01)
+
+
+def run_in_thread(fn):
+    result = {}
+
+    def target():
+        try:
+            result["value"] = fn()
+        except BaseException as e:
+            result["error"] = e
+
+    thread = threading.Thread(target=target)
+    thread.start()
+    return thread, result
+
+
+def test_local_callers_share_one_execution():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        assert release.wait(timeout=5)
+        return {"answer": "祛风胜湿"}
+
+    threads = [run_in_thread(lambda: flight.do("k", fn)) for _ in range(5)]
+    wait_until(lambda: flight.get_stats()["local_coalesced"] == 4)
+    release.set()
+    for thread, _ in threads:
+        thread.join(timeout=5)
+
+    results = [result["value"] for _, result in threads]
+    assert calls == [1]
+    assert sorted(shared for _, shared in results) == [False, True, True, True, True]
+    assert all(value == {"answer": "祛风胜湿"} for value, _ in results)
+    assert flight.get_stats()["inflight"] == 0
+
+
+def test_without_redis_no_lock_round_trips(fake_redis):
+    flight = SingleFlight()
+
+    assert flight.do("k", lambda: 1) == (1, False)
+    assert fake_redis.calls == []
+
+
+def test_remote_follower_waits_for_leader_result(fake_redis):
+    worker_a = SingleFlight(redis_client=fake_redis, poll_ms=10)
+    worker_b = SingleFlight(redis_client=fake_redis, poll_ms=10)
+    release = threading.Event()
+
+    def leader():
+        assert release.wait(timeout=5)
+        return {"answer": "A"}
+
+    thread, result_a = run_in_thread(lambda: worker_a.do("k", leader))
+    wait_until(lambda: fake_redis.exists("singleflight:lock:k"))
+    thread_b, result_b = run_in_thread(lambda: worker_b.do("k", lambda: pytest.fail("worker B must not execute")))
+    time.sleep(0.05)
+    release.set()
+    thread.join(timeout=5)
+    thread_b.join(timeout=5)
+
+    assert result_a["value"] == ({"answer": "A"}, False)
+    assert result_b["value"] == ({"answer": "A"}, True)
+    assert worker_b.get_stats()["remote_coalesced"] == 1
+    assert not fake_redis.exists("singleflight:lock:k")
+
+
+def test_remote_follower_runs_itself_when_leader_fails(fake_redis):
+    worker_a = SingleFlight(redis_client=fake_redis, poll_ms=10)
+    worker_b = SingleFlight(redis_client=fake_redis, poll_ms=10)
+    release = threading.Event()
+
+    def failing_leader():
+        assert release.wait(timeout=5)
+        raise RuntimeError("generation failed")
+
+    thread, result_a = run_in_thread(lambda: worker_a.do("k", failing_leader))
+    wait_until(lambda: fake_redis.exists("singleflight:lock:k"))
+    thread_b, result_b = run_in_thread(lambda: worker_b.do("k", lambda: {"answer": "B"}))
+    time.sleep(0.05)
+    release.set()
+    thread.join(timeout=5)
+    thread_b.join(timeout=5)
+
+    assert isinstance(result_a["error"], RuntimeError)
+    assert result_b["value"] == ({"answer": "B"}, False)
+
+
+def test_lock_renewed_while_leader_runs(fake_redis):
+    worker_a = SingleFlight(redis_client=fake_redis, lock_ttl=1, poll_ms=10)
+    worker_b = SingleFlight(redis_client=fake_redis, lock_ttl=1, poll_ms=10)
+
+    def slow_leader():
+        time.sleep(1.6)
+        return {"answer": "A"}
+
+    thread, _ = run_in_thread(lambda: worker_a.do("k", slow_leader))
+    wait_until(lambda: fake_redis.exists("singleflight:lock:k"))
+
+    # 锁的TTL为1秒，执行1.6秒的 leader 续期后锁一直有效，其他进程继续等待而不是重复执行
+    assert worker_b.do("k", lambda: pytest.fail("lock expired while leader was running")) == ({"answer": "A"}, True)
+    thread.join(timeout=5)
+
+
+def test_unshareable_result_not_published(fake_redis):
+    flight = SingleFlight(redis_client=fake_redis, shareable=lambda response: "error" not in response)
+
+    flight.do("k", lambda: {"error": "boom"})
+
+    assert fake_redis.get("singleflight:result:k") is None
+
+
+def test_leader_abort_makes_follower_rerun():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def aborted_leader():
+        assert release.wait(timeout=5)
+        raise Cancelled()
+
+    leader_thread, leader_result = run_in_thread(lambda: flight.do("k", aborted_leader))
+    wait_until(lambda: flight.get_stats()["inflight"] == 1)
+    follower_thread, follower_result = run_in_thread(lambda: flight.do("k", lambda: "follower"))
+    wait_until(lambda: flight.get_stats()["local_coalesced"] == 1)
+    release.set()
+    leader_thread.join(timeout=5)
+    follower_thread.join(timeout=5)
+
+    assert isinstance(leader_result["error"], Cancelled)
+    assert follower_result["value"] == ("follower", False)
+    assert flight.get_stats()["leader_aborts"] == 1
+
+
+def test_leader_exception_reaches_followers():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def failing_leader():
+        assert release.wait(timeout=5)
+        raise RuntimeError("generation failed")
+
+    leader_thread, _ = run_in_thread(lambda: flight.do("k", failing_leader))
+    wait_until(lambda: flight.get_stats()["inflight"] == 1)
+    follower_thread, follower_result = run_in_thread(lambda: flight.do("k", lambda: "follower"))
+    wait_until(lambda: flight.get_stats()["local_coalesced"] == 1)
+    release.set()
+    leader_thread.join(timeout=5)
+    follower_thread.join(timeout=5)
+
+    assert isinstance(follower_result["error"], RuntimeError)
+
+
+def test_async_cancelled_leader_makes_follower_rerun():
+    flight = SingleFlight()
+
+    async def slow():
+        await asyncio.sleep(10)
+
+    async def follower():
+        return "follower"
+
+    async def run():
+        leader = asyncio.ensure_future(flight.ado("k", slow))
+        await asyncio.sleep(0.01)
+        waiting = asyncio.ensure_future(flight.ado("k", follower))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await waiting
+
+    assert asyncio.run(run()) == ("follower", False)
+    assert flight.get_stats()["leader_aborts"] == 1
+
+
+def test_async_remote_follower_and_lock_renewal(cache, fake_redis):
+    client = cache.async_redis_client
+    worker_a = SingleFlight(redis_client=fake_redis, async_redis_client=client, lock_ttl=1, poll_ms=10)
+    worker_b = SingleFlight(redis_client=fake_redis, async_redis_client=client, lock_ttl=1, poll_ms=10)
+
+    async def slow_leader():
+        await asyncio.sleep(1.6)
+        return {"answer": "A"}
+
+    async def must_not_run():
+        pytest.fail("worker B must not execute")
+
+    async def run():
+        leader = asyncio.ensure_future(worker_a.ado("k", slow_leader))
+        await asyncio.sleep(0.05)
+        return await asyncio.gather(leader, worker_b.ado("k", must_not_run))
+
+    assert asyncio.run(run()) == [({"answer": "A"}, False), ({"answer": "A"}, True)]
+    assert not fake_redis.exists("singleflight:lock:k")
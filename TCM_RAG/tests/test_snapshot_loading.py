@@ -0,0 +1,140 @@
+# tests/test_snapshot_loading.py
+"""快照模式的索引构建：每个版本独立集合，已写入的版本由后启动的实例直接挂载"""
+from types import SimpleNamespace
+
+import pytest
+from llama_index.core import Document, Settings as LlamaSettings
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.embeddings import MockEmbedding
+from llama_index.core.schema import TextNode
+
+rag_service = pytest.importorskip("services.rag_service")
+
+from services.index_snapshot import load_snapshot, write_snapshot
+from services.local_vector_store import LocalVectorStore
+from services.sparse_index import BM25Index
+
+
+def write(output_dir, version):
+    documents = [
+        Document(id_="d1", text="风湿困表证", metadata={"file_path": "a.json", "file_hash": "ha"}),
+        Document(id_="d2", text="心脾两虚", metadata={"file_path": "b.json", "file_hash": "hb"}),
+    ]
+    nodes = [
+        TextNode(id_="n1", text="风湿困表证", metadata={"file_path": "a.json"}),
+        TextNode(id_="n2", text="头部沉重", metadata={"file_path": "a.json"}),
+        TextNode(id_="n3", text="心脾两虚", metadata={"file_path": "b.json"}),
+    ]
+    write_snapshot(
+        output_dir=str(output_dir),
+        version=version,
+        nodes=nodes,
+        embeddings=[[1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0]],
+        documents=documents,
+        bm25=BM25Index.build([doc.text for doc in documents]),
+        signature={"dim": 3}
+    )
+
+
+class FakeMilvusClient:
+    """按集合名记录属性，多个实例共用，模拟共享的Milvus服务"""
+
+    def __init__(self):
+        self.properties = {}
+
+    def describe_collection(self, collection_name):
+        return {"properties": dict(self.properties.get(collection_name, {}))}
+
+    def flush(self, collection_name):
+        pass
+
+    def alter_collection_properties(self, collection_name, properties):
+        self.properties.setdefault(collection_name, {}).update(properties)
+
+
+class FakeMilvusStore(LocalVectorStore):
+    collection_name: str
+    upsert_mode: bool = False
+
+    _shared_client: FakeMilvusClient = PrivateAttr()
+    _added: list = PrivateAttr()
+
+    def __init__(self, shared_client, added, **kwargs):
+        super().__init__(**kwargs)
+        self._shared_client = shared_client
+        self._added = added
+
+    @property
+    def client(self):
+        return self._shared_client
+
+    def add(self, nodes, embeddings=None, **add_kwargs):
+        self._added.extend(node.node_id for node in nodes)
+        return super().add(nodes, embeddings=embeddings, **add_kwargs)
+
+
+@pytest.fixture
+def cluster(tmp_path, monkeypatch):
+    """共享的“Milvus”：集合数据在同一目录，属性在同一客户端"""
+    monkeypatch.setattr(rag_service, "MilvusVectorStore", FakeMilvusStore)
+    monkeypatch.setattr(rag_service, "build_index_signature", lambda settings, dim: {"dim": dim})
+    monkeypatch.setattr(LlamaSettings, "_embed_model", MockEmbedding(embed_dim=3))
+    return SimpleNamespace(client=FakeMilvusClient(), root=tmp_path, collections=set())
+
+
+def start_pod(cluster, name):
+    service = rag_service.EnterpriseRAGService()
+    service.settings.app.cache_dir = str(cluster.root / name)
+    service.embed_model = SimpleNamespace(embed_dim=3)
+    service.added = []
+
+    def create_store(overwrite, collection_name, upsert=False):
+        assert not overwrite
+        cluster.collections.add(collection_name)
+        return FakeMilvusStore(
+            cluster.client,
+            service.added,
+            persist_dir=str(cluster.root / "milvus" / collection_name),
+            dim=3,
+            index_type="FLAT",
+            collection_name=collection_name,
+            upsert_mode=upsert
+        )
+
+    service._create_vector_store = create_store
+    return service
+
+
+def load(service, snapshot_dir):
+    snapshot = load_snapshot(str(snapshot_dir))
+    return service._build_index(snapshot.iter_processed_files, snapshot=snapshot)
+
+
+def test_second_pod_mounts_loaded_snapshot_without_writing(cluster):
+    write(cluster.root / "snapshots", "v1")
+
+    first = start_pod(cluster, "pod-a")
+    first_documents = load(first, cluster.root / "snapshots")
+    assert sorted(first.added) == ["n1", "n2", "n3"]
+    assert first.vector_store.upsert_mode
+
+    second = start_pod(cluster, "pod-b")
+    second_documents = load(second, cluster.root / "snapshots")
+
+    assert second.added == []
+    assert [doc.doc_id for doc in second_documents] == [doc.doc_id for doc in first_documents]
+    assert second.corpus_version == first.corpus_version
+
+
+def test_each_snapshot_version_gets_its_own_collection(cluster):
+    write(cluster.root / "snapshots", "v1")
+    load(start_pod(cluster, "pod-a"), cluster.root / "snapshots")
+
+    write(cluster.root / "snapshots", "v2")
+    pod = start_pod(cluster, "pod-c")
+    load(pod, cluster.root / "snapshots")
+
+    assert sorted(pod.added) == ["n1", "n2", "n3"]
+    assert cluster.collections == {"enterprise_rag_v1", "enterprise_rag_v2"}
+    assert cluster.client.properties["enterprise_rag_v1"][rag_service.SNAPSHOT_VERSION_PROPERTY] == "v1"
+    assert cluster.client.properties["enterprise_rag_v2"][rag_service.SNAPSHOT_VERSION_PROPERTY] == "v2"
@@ -0,0 +1,84 @@
+# tests/test_sparse_index.py
+"""BM25Index：CSR倒排打分与逐文档公式一致，保存/加载后结果不变"""
+import math
+from collections import Counter
+
+import pytest
+
+from services.sparse_index import BM25Index, ChineseTokenizer
+
+
+TEXTS = [
+    "患者头部沉重痛胀，遇阴雨天加重，四肢困重",
+    "心中怦怦跳动，惊惕不安，夜寐不安，多梦易醒",
+    "头痛头晕，心烦易怒，口苦，夜寐不安",
+    "腰膝酸软，头晕耳鸣，五心烦热",
+    "Ginseng tonifies qi",
+]
+
+
+def reference_scores(texts, query, tokenizer, k1=1.5, b=0.75):
+    """逐文档计算的BM25（与 BM25Index 的 idf 形式一致）"""
+    docs = [Counter(tokenizer(text)) for text in texts]
+    lengths = [sum(doc.values()) for doc in docs]
+    avgdl = sum(lengths) / len(docs)
+    scores = [0.0] * len(docs)
+    for term, qtf in Counter(tokenizer(query)).items():
+        df = sum(1 for doc in docs if term in doc)
+        if not df:
+            continue
+        idf = math.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+        for i, doc in enumerate(docs):
+            tf = doc.get(term, 0)
+            if tf:
+                norm = k1 * (1 - b + b * lengths[i] / avgdl)
+                scores[i] += qtf * idf * tf * (k1 + 1) / (tf + norm)
+    return scores
+
+
+def test_bigram_tokenizer():
+    tokenizer = ChineseTokenizer("bigram")
+
+    assert tokenizer("头痛头晕") == ["头痛", "痛头", "头晕"]
+    assert tokenizer("气") == ["气"]
+    assert tokenizer("BM25 检索") == ["bm25", "检索"]
+
+
+def test_unknown_tokenizer_mode():
+    with pytest.raises(ValueError):
+        ChineseTokenizer("whitespace")
+
+
+@pytest.mark.parametrize("query", ["头晕", "夜寐不安 头痛", "ginseng qi", "头晕头晕"])
+def test_scores_match_reference_formula(query):
+    tokenizer = ChineseTokenizer("bigram")
+    index = BM25Index.build(TEXTS, tokenizer=tokenizer)
+
+    expected = reference_scores(TEXTS, query, tokenizer)
+    results = index.search(query, top_k=len(TEXTS))
+
+    assert results, query
+    assert [doc for doc, _ in results] == sorted(
+        [i for i, score in enumerate(expected) if score > 0], key=lambda i: -expected[i]
+    )
+    for doc, score in results:
+        assert score == pytest.approx(expected[doc], rel=1e-5)
+
+
+def test_top_k_and_unknown_terms():
+    index = BM25Index.build(TEXTS)
+
+    assert len(index.search("夜寐不安", top_k=1)) == 1
+    assert index.search("桂枝汤", top_k=5) == []
+    assert index.search("头晕", top_k=0) == []
+
+
+def test_save_and_load_round_trip(tmp_path):
+    index = BM25Index.build(TEXTS, tokenizer=ChineseTokenizer("bigram"), k1=1.2, b=0.6)
+    index.save(tmp_path / "bm25")
+
+    loaded = BM25Index.load(tmp_path / "bm25")
+
+    assert (loaded.k1, loaded.b, loaded.num_docs, loaded.tokenizer.mode) == (1.2, 0.6, len(TEXTS), "bigram")
+    for query in ["头晕", "夜寐不安 头痛", "ginseng"]:
+        assert loaded.search(query, top_k=3) == index.search(query, top_k=3)
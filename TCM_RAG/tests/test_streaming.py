@@ -0,0 +1,152 @@
+# tests/test_streaming.py
+"""流式问答：事件顺序 sources -> token... -> final，客户端断开时停止生成，失败时发送 error 事件"""
+import asyncio
+import json
+import threading
+from types import SimpleNamespace
+
+import pytest
+from llama_index.core.schema import NodeWithScore, TextNode
+
+from config.settings import RetrievalConfig
+from services.answer_generator import AnswerGenerator
+
+pytest.importorskip("services.rag_service")
+
+from services.rag_service import EnterpriseRAGService
+from services.retriever import RetrievalResult
+
+
+RESULTS = [NodeWithScore(node=TextNode(id_="n1", text="风湿困表证：头部沉重痛胀，遇阴雨天加重。"), score=0.8)]
+DELTAS = ["祛风", "", "胜湿", "。"]
+
+
+class StreamingLLM:
+    """逐段产出 delta；记录 stop_event，且在 stop 被设置后不再产出"""
+
+    def __init__(self, deltas=DELTAS, fail_after=None):
+        self.deltas = deltas
+        self.fail_after = fail_after
+        self.stop_events = []
+        self.produced = 0
+
+    def stream_complete(self, prompt, stop_event=None):
+        self.stop_events.append(stop_event)
+        for i, delta in enumerate(self.deltas):
+            if self.fail_after is not None and i == self.fail_after:
+                raise RuntimeError("llm failed")
+            if stop_event.is_set():
+                return
+            self.produced += 1
+            yield SimpleNamespace(delta=delta)
+
+
+class FakeRetriever:
+    def __init__(self, fail=False):
+        self.fail = fail
+
+    async def ahybrid_retrieve(self, query, llm=None, use_cache=True, debug=False):
+        if self.fail:
+            raise RuntimeError("milvus down")
+        return RetrievalResult(nodes=RESULTS, retrieval_time=0.01, cache_hit=False, method_used="hybrid", total_candidates=1)
+
+
+def collect(stream):
+    async def run():
+        return [item async for item in stream]
+    return asyncio.run(run())
+
+
+def make_service(llm, retriever=None):
+    service = EnterpriseRAGService()
+    service.is_initialized = True
+    service.llm = llm
+    service.retriever = retriever or FakeRetriever()
+    service.answer_generator = AnswerGenerator(llm, RetrievalConfig())
+    return service
+
+
+def test_astream_answer_event_order():
+    generator = AnswerGenerator(StreamingLLM(), RetrievalConfig())
+
+    events = collect(generator.astream_answer("头痛", RESULTS))
+
+    kinds = [kind for kind, _ in events]
+    assert kinds == ["sources", "token", "token", "token", "answer"]
+    assert [payload for kind, payload in events if kind == "token"] == ["祛风", "胜湿", "。"]
+    answer = events[-1][1]
+    assert answer["answer"] == "祛风胜湿。" and answer["confidence"] == 0.8
+    assert answer["sources"] == events[0][1]
+
+
+def test_early_close_stops_generation():
+    llm = StreamingLLM(deltas=["a"] * 1000)
+    generator = AnswerGenerator(llm, RetrievalConfig())
+
+    async def run():
+        stream = generator.astream_answer("头痛", RESULTS)
+        async for kind, _ in stream:
+            if kind == "token":
+                break
+        await stream.aclose()
+
+    asyncio.run(run())
+
+    [stop_event] = llm.stop_events
+    assert isinstance(stop_event, threading.Event) and stop_event.is_set()
+    assert llm.produced < 1000
+
+
+def test_llm_failure_ends_with_error_answer():
+    generator = AnswerGenerator(StreamingLLM(fail_after=2), RetrievalConfig())
+
+    events = collect(generator.astream_answer("头痛", RESULTS))
+
+    assert [kind for kind, _ in events] == ["sources", "token", "answer"]
+    assert events[-1][1]["error"] == "llm failed"
+
+
+def test_service_stream_emits_sources_tokens_final():
+    service = make_service(StreamingLLM())
+
+    events = collect(service.astream_query("头痛遇阴雨加重怎么办", include_debug=True))
+
+    assert [event["event"] for event in events] == ["sources", "token", "token", "token", "final"]
+    assert events[0]["data"]["sources"] and events[0]["data"]["retrieval_time"] == 0.01
+    final = events[-1]["data"]
+    assert final["answer"] == "祛风胜湿。"
+    assert "sources" not in final and final["num_sources"] == 1
+    assert 0 <= final["time_to_first_token"] <= final["total_time"]
+    assert final["debug"]["retrieval_scores"] == [0.8]
+    json.dumps(final, ensure_ascii=False, default=str)
+
+
+@pytest.mark.parametrize("question, initialized, retriever_fails, error", [
+    ("头痛", False, False, "Service not initialized"),
+    ("   ", True, False, "Invalid query"),
+    ("头痛", True, True, "milvus down"),
+])
+def test_service_stream_errors(question, initialized, retriever_fails, error):
+    service = make_service(StreamingLLM(), FakeRetriever(fail=retriever_fails))
+    service.is_initialized = initialized
+
+    events = collect(service.astream_query(question))
+
+    assert [event["event"] for event in events] == ["error"]
+    assert events[0]["data"]["error"] == error
+
+
+def test_sse_endpoint_formats_events(monkeypatch):
+    pytest.importorskip("fastapi")
+    from fastapi.testclient import TestClient
+    from api import main as api_main
+
+    monkeypatch.setattr(api_main, "rag_service", make_service(StreamingLLM()))
+
+    response = TestClient(api_main.app).post("/query/stream", json={"query": "头痛"})
+
+    assert response.headers["content-type"].startswith("text/event-stream")
+    blocks = [block for block in response.text.split("\n\n") if block]
+    events = [block.split("\n")[0].removeprefix("event: ") for block in blocks]
+    assert events == ["sources", "token", "token", "token", "final"]
+    assert json.loads(blocks[1].split("\n")[1].removeprefix("data: ")) == {"delta": "祛风"}
@@ -0,0 +1,104 @@
+# tests/test_term_dictionary.py
+"""TermDictionary：同义词组合并、语料证型挖掘、最长不重叠匹配、规范化、关键术语签名与离线改写"""
+from types import SimpleNamespace
+
+from llama_index.core import Document
+
+from services.document_processor import FIELDS_METADATA_KEY
+from services.term_dictionary import TermDictionary, build_term_dictionary, _llm_synonyms
+
+
+GROUPS = [
+    {"terms": ["失眠", "不寐", "睡不着"], "type": "symptom"},
+    {"terms": ["心悸", "心慌"], "type": "symptom"},
+    {"terms": ["心脾两虚", "心脾两虚证"], "type": "pattern"},
+    {"terms": ["咳"], "type": "symptom"},
+]
+
+
+def make_dictionary():
+    return TermDictionary(GROUPS)
+
+
+def pattern_doc(pattern):
+    return Document(text=pattern, metadata={FIELDS_METADATA_KEY: {"pattern": pattern}})
+
+
+def test_single_char_terms_dropped_and_overlapping_groups_merged():
+    dictionary = make_dictionary()
+
+    assert dictionary.add_group(["咳"]) == -1
+    assert dictionary.add_group(["不 寐", "夜寐不安"]) == 0
+
+    assert dictionary.groups[0]["terms"] == ["失眠", "不寐", "睡不着", "夜寐不安"]
+    assert len(dictionary.groups) == 3
+    assert len(dictionary) == 8
+
+
+def test_mine_documents_adds_pattern_suffix_variants():
+    dictionary = make_dictionary()
+
+    mined = dictionary.mine_documents([pattern_doc("风湿困表证"), pattern_doc("心脾两虚型"), Document(text="无字段")])
+
+    assert mined == 4
+    assert dictionary.groups[-1] == {"type": "pattern", "terms": ["风湿困表", "风湿困表证", "风湿困表型"]}
+    assert dictionary.groups[2]["terms"] == ["心脾两虚", "心脾两虚证", "心脾两虚型"]
+
+
+def test_match_prefers_longest_without_overlap():
+    dictionary = make_dictionary()
+
+    matches = dictionary.match("心脾两虚证失眠心悸")
+
+    assert [(start, end) for start, end, _ in matches] == [(0, 5), (5, 7), (7, 9)]
+    assert [group for _, _, group in matches] == [2, 0, 1]
+
+
+def test_normalize_and_key_terms():
+    dictionary = make_dictionary()
+
+    assert dictionary.normalize("睡不着 心慌怎么办") == "失眠心悸怎么办"
+    assert dictionary.key_terms("睡不着心慌怎么办") == dictionary.key_terms("失眠心悸怎么办")
+    # 术语内部的“不”不算否定词，术语以外的“不”算
+    assert dictionary.key_terms("睡不着怎么办") == ("失眠",)
+    assert dictionary.key_terms("失眠不加重怎么办") == ("不", "加重", "失眠")
+
+
+def test_expand_rewrites_terms_with_synonyms():
+    dictionary = make_dictionary()
+
+    assert dictionary.expand("失眠心悸怎么办", max_variants=2) == ["失眠心悸怎么办", "不寐心慌怎么办", "睡不着心慌怎么办"]
+    assert dictionary.expand("头痛怎么办") == ["头痛怎么办"]
+    # 只差证型后缀的说法不作为改写
+    assert dictionary.expand("心脾两虚证吃什么") == ["心脾两虚证吃什么"]
+
+
+def test_save_load_round_trip(tmp_path):
+    dictionary = make_dictionary()
+    path = tmp_path / "terms" / "tcm_terms.json"
+
+    dictionary.save(str(path))
+    loaded = TermDictionary.load(str(path))
+
+    assert loaded.groups == dictionary.groups
+    assert loaded.expand("失眠") == dictionary.expand("失眠")
+
+
+def test_build_term_dictionary_merges_file_and_corpus(tmp_path):
+    path = tmp_path / "tcm_terms.json"
+    make_dictionary().save(str(path))
+    documents = [pattern_doc("风湿困表证")]
+
+    from_file = build_term_dictionary(documents, str(path))
+    corpus_only = build_term_dictionary(documents, str(tmp_path / "missing.json"))
+
+    assert len(from_file.groups) == 4
+    assert [group["terms"][0] for group in corpus_only.groups] == ["风湿困表"]
+    assert build_term_dictionary([], None).groups == []
+
+
+def test_llm_synonyms_parsed_and_filtered():
+    llm = SimpleNamespace(complete=lambda prompt: SimpleNamespace(text="1. 不寐\n- 睡不着\n失眠\nInsomnia\n夜寐不安。\n目不瞑"))
+
+    assert _llm_synonyms(llm, "失眠", 2) == ["不寐", "睡不着"]
+    assert _llm_synonyms(llm, "失眠", 5) == ["不寐", "睡不着", "目不瞑"]
@@ -0,0 +1,147 @@
+# tests/test_two_tier_cache.py
+"""两级缓存：L1的LRU淘汰与TTL、L1/L2命中计数与回填、跨进程失效通知"""
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from utils import cache as cache_module
+from utils.cache import LRUCache
+
+
+REFS = [("n1", 0.9), ("n2", 0.5)]
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache_module.time, "monotonic", clock)
+    return clock
+
+
+def test_lru_evicts_least_recently_used():
+    lru = LRUCache(max_items=2, ttl=60)
+    lru.set("a", b"1")
+    lru.set("b", b"2")
+    lru.get("a")
+
+    lru.set("c", b"3")
+
+    assert lru.get("b") is None
+    assert lru.get("a") == b"1" and lru.get("c") == b"3"
+    assert len(lru) == 2
+
+
+def test_lru_entries_expire(clock):
+    lru = LRUCache(max_items=10, ttl=60)
+    lru.set("a", b"1")
+    lru.set("b", b"2", ttl=5)  # 条目TTL不超过L1的TTL
+    lru.set("c", b"3", ttl=3600)
+
+    clock.now += 10
+    assert lru.get("a") == b"1" and lru.get("b") is None
+
+    clock.now += 60
+    assert lru.get("a") is None and lru.get("c") is None
+
+
+def test_delete_prefix():
+    lru = LRUCache()
+    lru.set("queries:v1:a", b"1")
+    lru.set("embeddings:v1:a", b"2")
+
+    lru.delete_prefix("queries:")
+
+    assert lru.get("queries:v1:a") is None and lru.get("embeddings:v1:a") == b"2"
+
+
+def test_l1_hit_skips_redis(cache, fake_redis):
+    cache.cache_query_results("头痛", REFS)
+    fake_redis.calls.clear()
+
+    assert cache.get_query_results("头痛") == REFS
+    assert cache.get_query_results("头痛") == REFS
+
+    assert fake_redis.calls == []
+    stats = cache.get_stats()
+    assert stats["l1_hits"] == 2 and stats["l2_hits"] == 0 and stats["l1_hit_rate"] == 1.0
+
+
+def test_l2_hit_backfills_l1(cache, fake_redis):
+    cache.cache_query_results("头痛", REFS)
+    cache.l1.clear()
+
+    assert cache.get_query_results("头痛") == REFS
+    assert cache.get_query_results("头痛") == REFS
+
+    assert fake_redis.calls.count("mget") == 1
+    stats = cache.get_stats()
+    assert (stats["l1_hits"], stats["l1_misses"], stats["l2_hits"], stats["l2_misses"]) == (1, 1, 1, 0)
+    assert cache.get_query_results("心悸") is None
+    assert cache.get_stats()["l2_misses"] == 1
+
+
+def test_async_path_uses_both_tiers(cache, fake_redis):
+    async def run():
+        await cache.acache_query_results("头痛", REFS)
+        cache.l1.clear()
+        first = await cache.aget_query_results("头痛")
+        second = await cache.aget_query_results("头痛")
+        return first, second
+
+    assert asyncio.run(run()) == (REFS, REFS)
+    stats = cache.get_stats()
+    assert stats["l1_hits"] == 1 and stats["l2_hits"] == 1
+
+
+def test_writes_publish_invalidation(cache, fake_redis):
+    cache.invalidation_channel = "tcm_rag:l1"
+
+    cache.cache_query_results("头痛", REFS)
+
+    [(channel, message)] = fake_redis.published
+    payload = json.loads(message)
+    assert channel == "tcm_rag:l1"
+    assert payload["sender"] == cache.instance_id
+    assert payload["keys"] == [cache._make_key("queries", "头痛")]
+
+
+def test_invalidation_from_other_worker_drops_l1(cache):
+    key = cache._make_key("queries", "头痛")
+    cache.l1.set(key, b"[]")
+    cache.l1.set("embeddings:default:x", b"")
+
+    cache._handle_invalidation({"data": json.dumps({"sender": cache.instance_id, "keys": [key]})})
+    assert cache.l1.get(key) == b"[]"
+
+    cache._handle_invalidation({"data": json.dumps({"sender": "other", "keys": [key]})})
+    assert cache.l1.get(key) is None
+
+    cache._handle_invalidation({"data": json.dumps({"sender": "other", "keys": ["*"]})})
+    assert len(cache.l1) == 0
+
+
+def test_configure_from_app_config(cache):
+    app_config = SimpleNamespace(
+        redis_url=cache.redis_url,
+        embedding_cache_dtype="float16",
+        embedding_cache_ttl=60,
+        l1_cache_max_items=0,
+        l1_cache_ttl=30,
+        cache_invalidation_channel=None
+    )
+
+    cache.configure(app_config)
+
+    assert cache.l1 is None and cache.embedding_dtype == "float16"
+    cache.cache_query_results("头痛", REFS)
+    assert cache.get_query_results("头痛") == REFS
@@ -0,0 +1,150 @@
+# utils/batching.py
+import time
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional
+
+from utils.logger import logger
+
+
+class Histogram:
+    """按2的幂分桶的计数直方图（1, 2, 4, 8, ...），线程安全"""
+
+    def __init__(self, max_bucket: int = 1024):
+        self.buckets = [1]
+        while self.buckets[-1] < max_bucket:
+            self.buckets.append(self.buckets[-1] * 2)
+        self.counts = [0] * (len(self.buckets) + 1)  # 最后一个为溢出桶
+        self.total = 0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: int):
+        with self._lock:
+            for i, upper in enumerate(self.buckets):
+                if value <= upper:
+                    self.counts[i] += 1
+                    break
+            else:
+                self.counts[-1] += 1
+            self.total += value
+            self.count += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            buckets = {f"le_{upper}": c for upper, c in zip(self.buckets, self.counts)}
+            buckets[f"gt_{self.buckets[-1]}"] = self.counts[-1]
+            return {
+                "count": self.count,
+                "mean": self.total / self.count if self.count else 0.0,
+                "buckets": buckets
+            }
+
+
+class MicroBatcher:
+    """跨请求微批调度器
+
+    并发请求通过 submit() 提交单个任务，后台线程把排队中的任务合并为一批调用 batch_fn，
+    再把结果按顺序分发回各自的 Future。攒批在达到 max_batch_size（按 item_size 累计）
+    或最早任务等待超过 max_wait_ms 时结束；没有其他排队任务时立即执行。
+    异步调用方用 asyncio.wrap_future(batcher.submit(item)) 在事件循环中等待，不占用线程。
+    batch_fn 接收任务列表，返回等长的结果列表。
+    """
+
+    def __init__(
+            self,
+            name: str,
+            batch_fn: Callable[[List[Any]], List[Any]],
+            max_batch_size: int = 32,
+            max_wait_ms: float = 5.0,
+            item_size: Optional[Callable[[Any], int]] = None
+    ):
+        self.name = name
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.item_size = item_size or (lambda item: 1)
+
+        self._queue: "queue.Queue" = queue.Queue()
+        self.queue_depth = Histogram()
+        self.batch_size = Histogram()
+        self.num_batches = 0
+
+        self._worker = threading.Thread(target=self._run, name=f"microbatch-{name}", daemon=True)
+        self._worker.start()
+
+    def submit(self, item: Any) -> Future:
+        future: Future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def __call__(self, item: Any) -> Any:
+        """提交并等待结果"""
+        return self.submit(item).result()
+
+    def _collect(self) -> List[tuple]:
+        """阻塞等待第一个任务，取走已排队的任务；确有并发时再在时间与大小预算内继续攒批
+
+        取到第一个任务后队列为空（没有并发请求）时立即执行，不为等不来的任务空等 max_wait。
+        """
+        first = self._queue.get()
+        self.queue_depth.observe(self._queue.qsize() + 1)
+
+        batch = [first]
+        size = self.item_size(first[0])
+        while size < self.max_batch_size:
+            try:
+                entry = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(entry)
+            size += self.item_size(entry[0])
+        if len(batch) == 1:
+            return batch
+
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                entry = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(entry)
+            size += self.item_size(entry[0])
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            items = [item for item, _ in batch]
+            futures = [future for _, future in batch]
+            self.batch_size.observe(sum(self.item_size(item) for item in items))
+            self.num_batches += 1
+
+            try:
+                results = self.batch_fn(items)
+                if len(results) != len(items):
+                    raise RuntimeError(
+                        f"Batch function of '{self.name}' returned {len(results)} results for {len(items)} items"
+                    )
+            except Exception as e:
+                logger.log_error(e, {"batcher": self.name, "batch_size": len(items)})
+                for future in futures:
+                    future.set_exception(e)
+                continue
+
+            for future, result in zip(futures, results):
+                future.set_result(result)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "pending": self._queue.qsize(),
+            "num_batches": self.num_batches,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "queue_depth": self.queue_depth.snapshot(),
+            "batch_size": self.batch_size.snapshot()
+        }
@@ -1,63 +1,413 @@
 # utils/cache.py
 import redis
+import redis.asyncio as aioredis
 import json
+import uuid
+import time
 import hashlib
-from typing import Any, Optional, List
+import threading
+from collections import OrderedDict
+from typing import Any, Optional, List, Dict, Tuple
 from datetime import timedelta
-import pickle
+
+import numpy as np
+from utils.logger import logger
+
+
+EMBEDDING_DTYPES = ("float32", "float16")
+NAMESPACES = ("queries", "embeddings", "expansions")
+_CLEAR_ALL = "*"
+
+
+class LRUCache:
+    """进程内LRU缓存（L1），按条数限制容量，条目带过期时间，线程安全
+
+    保存的是与Redis中相同的序列化字节，每次命中都会重新反序列化，
+    调用方拿到的对象互不共享。
+    """
+
+    def __init__(self, max_items: int = 10000, ttl: float = 300):
+        self.max_items = max_items
+        self.ttl = ttl
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (过期时刻, 值)
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        ttl = min(ttl, self.ttl) if ttl else self.ttl
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_items:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_prefix(self, prefix: str):
+        with self._lock:
+            for key in [key for key in self._data if key.startswith(prefix)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
 
 
 class CacheManager:
-    def __init__(self, redis_url: str = "redis://localhost:6379/0"):
+    """两级缓存：进程内LRU（L1）+ Redis（L2）
+
+    读取先查L1，未命中再查Redis并回填L1；写入同时写两级。
+    配置 invalidation_channel 后，写入与清空会通过Redis pub/sub 通知其他工作进程丢弃各自的L1条目。
+
+    键格式为 {命名空间}:{版本}:{md5}，命名空间见 NAMESPACES。版本由语料与模型身份决定，
+    版本变化后旧键不再被访问、按TTL自然过期；invalidate_namespaces 可按命名空间定向清除。
+    """
+
+    def __init__(
+            self,
+            redis_url: str = "redis://localhost:6379/0",
+            embedding_dtype: str = "float32",
+            embedding_ttl: int = 86400,  # 24小时
+            l1_max_items: int = 10000,
+            l1_ttl: float = 300
+    ):
+        self.redis_url = redis_url
         self.redis_client = redis.from_url(redis_url)
+        self.async_redis_client = aioredis.from_url(redis_url)
         self.default_ttl = 3600  # 1小时
+        self.configure_embeddings(embedding_dtype, embedding_ttl)
+
+        self.l1: Optional[LRUCache] = LRUCache(l1_max_items, l1_ttl) if l1_max_items > 0 else None
+        self.namespace_versions: Dict[str, str] = {namespace: "default" for namespace in NAMESPACES}
+        self.instance_id = uuid.uuid4().hex
+        self.invalidation_channel: Optional[str] = None
+        self._pubsub_thread = None
+        self._stats = {"l1_hits": 0, "l1_misses": 0, "l2_hits": 0, "l2_misses": 0}
+        self._stats_lock = threading.Lock()
+
+    def configure(self, app_config):
+        """按 AppConfig 配置Redis连接、向量缓存精度、L1容量/TTL与跨进程失效通知"""
+        if app_config.redis_url != self.redis_url:
+            self.redis_url = app_config.redis_url
+            self.redis_client = redis.from_url(app_config.redis_url)
+            self.async_redis_client = aioredis.from_url(app_config.redis_url)
+        self.configure_embeddings(app_config.embedding_cache_dtype, app_config.embedding_cache_ttl)
+
+        if app_config.l1_cache_max_items > 0:
+            self.l1 = LRUCache(app_config.l1_cache_max_items, app_config.l1_cache_ttl)
+        else:
+            self.l1 = None
+
+        self._stop_invalidation_listener()
+        self.invalidation_channel = app_config.cache_invalidation_channel
+        if self.invalidation_channel and self.l1 is not None:
+            self._start_invalidation_listener()
+
+        logger.logger.info(
+            f"Cache configured: l1_max_items={app_config.l1_cache_max_items}, "
+            f"l1_ttl={app_config.l1_cache_ttl}s, invalidation_channel={self.invalidation_channel}"
+        )
+
+    def set_namespace_versions(self, versions: Dict[str, str]):
+        unknown = set(versions) - set(NAMESPACES)
+        if unknown:
+            raise ValueError(f"Unknown cache namespaces: {sorted(unknown)}")
+        self.namespace_versions.update(versions)
+        logger.logger.info(f"Cache namespace versions: {self.namespace_versions}")
+
+    def configure_embeddings(self, dtype: str, ttl: int = 86400):
+        """设置向量缓存的存储精度（float32 | float16）与过期时间"""
+        if dtype not in EMBEDDING_DTYPES:
+            raise ValueError(f"Unsupported embedding cache dtype: {dtype}")
+        self.embedding_dtype = dtype
+        self.embedding_ttl = ttl
+
+    # ===== 跨进程L1失效 =====
+
+    def _start_invalidation_listener(self):
+        pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(**{self.invalidation_channel: self._handle_invalidation})
+        self._pubsub_thread = pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+
+    def _stop_invalidation_listener(self):
+        if self._pubsub_thread is not None:
+            self._pubsub_thread.stop()
+            self._pubsub_thread = None
+
+    def _handle_invalidation(self, message: Dict[str, Any]):
+        try:
+            payload = json.loads(message["data"])
+            if payload["sender"] == self.instance_id or self.l1 is None:
+                return
+            for prefix in payload.get("prefixes", []):
+                self.l1.delete_prefix(prefix)
+            for key in payload.get("keys", []):
+                if key == _CLEAR_ALL:
+                    self.l1.clear()
+                    break
+                self.l1.delete(key)
+        except Exception as e:
+            logger.log_error(e, {"operation": "cache_invalidation"})
+
+    def _publish_invalidation(self, keys: List[str], prefixes: Optional[List[str]] = None):
+        if not self.invalidation_channel or not (keys or prefixes):
+            return
+        try:
+            self.redis_client.publish(
+                self.invalidation_channel,
+                json.dumps({"sender": self.instance_id, "keys": keys, "prefixes": prefixes or []})
+            )
+        except Exception as e:
+            logger.log_error(e, {"operation": "cache_invalidation_publish"})
+
+    # ===== 两级读写 =====
+
+    def _count(self, name: str, n: int = 1):
+        if n:
+            with self._stats_lock:
+                self._stats[name] += n
+
+    def _get_raw_many(self, keys: List[str]) -> List[Optional[bytes]]:
+        """先查L1，剩余的键一次 MGET 从Redis读取并回填L1"""
+        values: List[Optional[bytes]] = [None] * len(keys)
+        missing = []
+        for i, key in enumerate(keys):
+            value = self.l1.get(key) if self.l1 is not None else None
+            if value is None:
+                missing.append(i)
+            else:
+                values[i] = value
+        self._count("l1_hits", len(keys) - len(missing))
+        self._count("l1_misses", len(missing))
+        if not missing:
+            return values
+
+        remote = self.redis_client.mget([keys[i] for i in missing])
+        l2_hits = 0
+        for i, value in zip(missing, remote):
+            if value is not None:
+                values[i] = value
+                l2_hits += 1
+                if self.l1 is not None:
+                    self.l1.set(keys[i], value)
+        self._count("l2_hits", l2_hits)
+        self._count("l2_misses", len(missing) - l2_hits)
+        return values
+
+    def _set_raw_many(self, items: Dict[str, bytes], ttl: int):
+        """写入L1，并通过非事务 pipeline 批量 SETEX 写入Redis"""
+        if self.l1 is not None:
+            for key, value in items.items():
+                self.l1.set(key, value, ttl)
+        pipe = self.redis_client.pipeline(transaction=False)
+        for key, value in items.items():
+            pipe.setex(key, ttl, value)
+        pipe.execute()
+        self._publish_invalidation(list(items))
 
-    def _make_key(self, prefix: str, *args) -> str:
+    async def _aget_raw(self, key: str) -> Optional[bytes]:
+        """异步读取：L1命中直接返回，否则通过异步Redis客户端读取并回填L1"""
+        value = self.l1.get(key) if self.l1 is not None else None
+        if value is not None:
+            self._count("l1_hits")
+            return value
+        self._count("l1_misses")
+
+        value = await self.async_redis_client.get(key)
+        self._count("l2_hits" if value is not None else "l2_misses")
+        if value is not None and self.l1 is not None:
+            self.l1.set(key, value)
+        return value
+
+    async def _aset_raw(self, key: str, value: bytes, ttl: int):
+        if self.l1 is not None:
+            self.l1.set(key, value, ttl)
+        await self.async_redis_client.setex(key, ttl, value)
+        if self.invalidation_channel:
+            try:
+                await self.async_redis_client.publish(
+                    self.invalidation_channel,
+                    json.dumps({"sender": self.instance_id, "keys": [key]})
+                )
+            except Exception as e:
+                logger.log_error(e, {"operation": "cache_invalidation_publish"})
+
+    def _get_raw(self, key: str) -> Optional[bytes]:
+        return self._get_raw_many([key])[0]
+
+    def _set_raw(self, key: str, value: bytes, ttl: int):
+        self._set_raw_many({key: value}, ttl)
+
+    def clear_local(self, publish: bool = True):
+        """清空本进程L1，publish=True 时通知其他进程同样清空"""
+        if self.l1 is not None:
+            self.l1.clear()
+        if publish:
+            self._publish_invalidation([_CLEAR_ALL])
+
+    def invalidate_namespaces(self, namespaces: Optional[List[str]] = None) -> Dict[str, int]:
+        """按命名空间定向清除（包含所有版本），返回各命名空间删除的Redis键数量
+
+        用 SCAN + UNLINK 分批删除，不影响同一Redis库中的其他数据。
+        """
+        namespaces = list(NAMESPACES if namespaces is None else namespaces)
+        unknown = set(namespaces) - set(NAMESPACES)
+        if unknown:
+            raise ValueError(f"Unknown cache namespaces: {sorted(unknown)}")
+
+        deleted = {}
+        for namespace in namespaces:
+            prefix = f"{namespace}:"
+            count = 0
+            batch = []
+            for key in self.redis_client.scan_iter(match=f"{prefix}*", count=1000):
+                batch.append(key)
+                if len(batch) >= 500:
+                    count += self.redis_client.unlink(*batch)
+                    batch = []
+            if batch:
+                count += self.redis_client.unlink(*batch)
+            deleted[namespace] = count
+            if self.l1 is not None:
+                self.l1.delete_prefix(prefix)
+
+        self._publish_invalidation([], [f"{namespace}:" for namespace in namespaces])
+        logger.logger.info(f"Cache namespaces invalidated: {deleted}")
+        return deleted
+
+    def get_stats(self) -> Dict[str, Any]:
+        """各级缓存的命中/未命中计数与命中率"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        for tier in ("l1", "l2"):
+            lookups = stats[f"{tier}_hits"] + stats[f"{tier}_misses"]
+            stats[f"{tier}_hit_rate"] = stats[f"{tier}_hits"] / lookups if lookups else 0.0
+        stats["l1_size"] = len(self.l1) if self.l1 is not None else 0
+        stats["namespace_versions"] = dict(self.namespace_versions)
+        return stats
+
+    def _make_key(self, namespace: str, *args) -> str:
         key_data = "|".join(str(arg) for arg in args)
         key_hash = hashlib.md5(key_data.encode()).hexdigest()
-        return f"{prefix}:{key_hash}"
+        return f"{namespace}:{self.namespace_versions[namespace]}:{key_hash}"
+
+    # 检索结果只缓存 (node_id, score) 列表（JSON），节点由检索器从进程内docstore还原
+
+    @staticmethod
+    def _encode_refs(refs: List[Tuple[str, float]]) -> bytes:
+        return json.dumps([[node_id, float(score)] for node_id, score in refs]).encode("utf-8")
 
-    def get_query_results(self, query: str) -> Optional[List[Any]]:
-        key = self._make_key("query", query)
+    @staticmethod
+    def _decode_refs(data: bytes) -> List[Tuple[str, float]]:
+        return [(node_id, score) for node_id, score in json.loads(data)]
+
+    def get_query_results(self, query: str) -> Optional[List[Tuple[str, float]]]:
+        key = self._make_key("queries", query)
         try:
-            cached = self.redis_client.get(key)
+            cached = self._get_raw(key)
             if cached:
-                return pickle.loads(cached)
+                return self._decode_refs(cached)
         except Exception as e:
             logger.log_error(e, {"operation": "cache_get", "key": key})
         return None
 
-    def cache_query_results(self, query: str, results: List[Any], ttl: int = None):
-        key = self._make_key("query", query)
+    def cache_query_results(self, query: str, refs: List[Tuple[str, float]], ttl: int = None):
+        key = self._make_key("queries", query)
         try:
-            self.redis_client.setex(
-                key,
-                ttl or self.default_ttl,
-                pickle.dumps(results)
-            )
+            self._set_raw(key, self._encode_refs(refs), ttl or self.default_ttl)
         except Exception as e:
             logger.log_error(e, {"operation": "cache_set", "key": key})
 
-    def get_embeddings(self, text: str) -> Optional[List[float]]:
-        key = self._make_key("embedding", text)
+    async def aget_query_results(self, query: str) -> Optional[List[Tuple[str, float]]]:
+        key = self._make_key("queries", query)
+        try:
+            cached = await self._aget_raw(key)
+            if cached:
+                return self._decode_refs(cached)
+        except Exception as e:
+            logger.log_error(e, {"operation": "cache_aget", "key": key})
+        return None
+
+    async def acache_query_results(self, query: str, refs: List[Tuple[str, float]], ttl: int = None):
+        key = self._make_key("queries", query)
+        try:
+            await self._aset_raw(key, self._encode_refs(refs), ttl or self.default_ttl)
+        except Exception as e:
+            logger.log_error(e, {"operation": "cache_aset", "key": key})
+
+    def get_query_expansions(self, query: str) -> Optional[List[str]]:
+        key = self._make_key("expansions", query)
         try:
-            cached = self.redis_client.get(key)
+            cached = self._get_raw(key)
             if cached:
                 return json.loads(cached)
         except Exception as e:
-            logger.log_error(e, {"operation": "embedding_cache_get"})
+            logger.log_error(e, {"operation": "expansion_cache_get", "key": key})
         return None
 
-    def cache_embeddings(self, text: str, embedding: List[float]):
-        key = self._make_key("embedding", text)
+    def cache_query_expansions(self, query: str, expansions: List[str], ttl: int = None):
+        key = self._make_key("expansions", query)
         try:
-            self.redis_client.setex(
-                key,
-                86400,  # 24小时
-                json.dumps(embedding)
+            self._set_raw(key, json.dumps(expansions, ensure_ascii=False).encode("utf-8"), ttl or self.default_ttl)
+        except Exception as e:
+            logger.log_error(e, {"operation": "expansion_cache_set", "key": key})
+
+    def _embedding_key(self, text: str) -> str:
+        # 向量以原始字节存储，精度包含在命名空间版本中，另在哈希中带上精度以防版本未设置时误读旧值
+        return self._make_key("embeddings", self.embedding_dtype, text)
+
+    def _encode_embedding(self, embedding: List[float]) -> bytes:
+        return np.asarray(embedding, dtype=self.embedding_dtype).tobytes()
+
+    def _decode_embedding(self, raw: bytes) -> Optional[List[float]]:
+        if not raw or len(raw) % np.dtype(self.embedding_dtype).itemsize:
+            return None
+        return np.frombuffer(raw, dtype=self.embedding_dtype).astype(np.float32).tolist()
+
+    def get_embeddings_batch(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """批量读取向量（L1 + 一次 MGET），未命中的位置为 None"""
+        if not texts:
+            return []
+        try:
+            values = self._get_raw_many([self._embedding_key(text) for text in texts])
+            return [self._decode_embedding(raw) for raw in values]
+        except Exception as e:
+            logger.log_error(e, {"operation": "embedding_cache_mget", "num_texts": len(texts)})
+        return [None] * len(texts)
+
+    def cache_embeddings_batch(self, texts: List[str], embeddings: List[List[float]], ttl: int = None):
+        """批量写入向量，Redis侧一次往返"""
+        if not texts:
+            return
+        try:
+            self._set_raw_many(
+                {self._embedding_key(text): self._encode_embedding(emb) for text, emb in zip(texts, embeddings)},
+                ttl or self.embedding_ttl
             )
         except Exception as e:
-            logger.log_error(e, {"operation": "embedding_cache_set"})
+            logger.log_error(e, {"operation": "embedding_cache_mset", "num_texts": len(texts)})
+
+    def get_embeddings(self, text: str) -> Optional[List[float]]:
+        return self.get_embeddings_batch([text])[0]
+
+    def cache_embeddings(self, text: str, embedding: List[float]):
+        self.cache_embeddings_batch([text], [embedding])
 
 
 cache_manager = CacheManager()
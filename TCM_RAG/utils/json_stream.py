@@ -0,0 +1,147 @@
+# utils/json_stream.py
+import json
+import codecs
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Iterator, Optional
+
+
+READ_CHUNK_SIZE = 1 << 20  # 每次读取1MB
+JSON_LINES_SUFFIXES = {".jsonl", ".ndjson"}
+_WHITESPACE = " \t\r\n"
+_VALUE_DELIMITERS = _WHITESPACE + ",]"
+_SELF_DELIMITED_ENDS = "}]\""  # 对象、数组、字符串以结束符收尾，解码成功即完整
+
+
+@dataclass
+class JsonRecord:
+    """流式读取到的一条记录及其在文件中的字节范围"""
+    index: int         # 记录序号（从 start_index 开始计数）
+    start_offset: int  # 记录起始字节偏移
+    end_offset: int    # 记录结束字节偏移，中断后可从这里继续读取
+    value: Any
+
+
+def _detect_container(path: Path) -> Optional[str]:
+    """返回文件首个非空白字符（'[' 表示JSON数组，其余按JSON值序列处理）"""
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(4096)
+            if not chunk:
+                return None
+            stripped = chunk.lstrip(b" \t\r\n\xef\xbb\xbf")
+            if stripped:
+                return chr(stripped[0])
+
+
+def _iter_json_lines(path: Path, start_offset: int, start_index: int) -> Iterator[JsonRecord]:
+    index = start_index
+    offset = start_offset
+    with open(path, "rb") as f:
+        f.seek(start_offset)
+        for line in f:
+            line_start = offset
+            offset += len(line)
+            if not line.strip():
+                continue
+            yield JsonRecord(index, line_start, offset, json.loads(line))
+            index += 1
+
+
+def _iter_json_values(
+        path: Path,
+        start_offset: int,
+        start_index: int,
+        in_array: bool,
+        chunk_size: int
+) -> Iterator[JsonRecord]:
+    """增量解码JSON数组元素或连续的JSON值，缓冲区只保留尚未解析的部分"""
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    pos = 0                       # 缓冲区中下一个未解析字符的位置
+    pos_offset = start_offset     # pos 对应的字节偏移
+    index = start_index
+    eof = False
+    expect_open = in_array and start_offset == 0  # 从文件开头读取数组时需要先跳过 '['
+
+    with open(path, "rb") as f:
+        if start_offset == 0 and f.read(len(codecs.BOM_UTF8)) == codecs.BOM_UTF8:
+            pos_offset = len(codecs.BOM_UTF8)
+        f.seek(pos_offset)
+
+        def fill() -> bool:
+            """丢弃已解析部分并读入下一块"""
+            nonlocal buffer, pos, eof
+            chunk = f.read(chunk_size)
+            buffer = buffer[pos:] + text_decoder.decode(chunk, final=not chunk)
+            pos = 0
+            if not chunk:
+                eof = True
+            return bool(chunk)
+
+        def advance(end: int):
+            nonlocal pos, pos_offset
+            pos_offset += len(buffer[pos:end].encode("utf-8"))
+            pos = end
+
+        while True:
+            # 跳过空白和数组分隔符
+            while True:
+                end = pos
+                while end < len(buffer) and (buffer[end] in _WHITESPACE or (in_array and buffer[end] == ",")):
+                    end += 1
+                advance(end)
+                if pos < len(buffer) or not fill():
+                    break
+
+            if pos >= len(buffer):
+                return
+            if expect_open:
+                if buffer[pos] != "[":
+                    raise ValueError(f"Expected JSON array in {path}")
+                advance(pos + 1)
+                expect_open = False
+                continue
+            if in_array and buffer[pos] == "]":
+                return
+
+            # 解码一个完整的值：数字、true 等没有结束符的值可能被读取块截断（"3." 会解码为 3），
+            # 只有其后紧跟分隔符（或已到文件尾）时才接受，否则读入更多数据重新解码
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buffer, pos)
+                    if eof or (end < len(buffer) and (
+                            buffer[end - 1] in _SELF_DELIMITED_ENDS or buffer[end] in _VALUE_DELIMITERS)):
+                        break
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                fill()
+
+            record_start = pos_offset
+            advance(end)
+            yield JsonRecord(index, record_start, pos_offset, value)
+            index += 1
+
+
+def iter_json_records(
+        path: Path,
+        start_offset: int = 0,
+        start_index: int = 0,
+        chunk_size: int = READ_CHUNK_SIZE
+) -> Iterator[JsonRecord]:
+    """逐条读取大JSON文件，内存占用与文件大小无关
+
+    支持三种格式：JSON数组（逐个元素）、JSON Lines（.jsonl/.ndjson）、
+    以及单个或多个连续的JSON值。传入上次记录的 end_offset 和下一条序号即可断点续读。
+    """
+    path = Path(path)
+    if path.suffix in JSON_LINES_SUFFIXES:
+        yield from _iter_json_lines(path, start_offset, start_index)
+        return
+
+    container = _detect_container(path)
+    if container is None:
+        return
+    yield from _iter_json_values(path, start_offset, start_index, container == "[", chunk_size)
@@ -0,0 +1,311 @@
+# utils/singleflight.py
+import json
+import time
+import uuid
+import asyncio
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, Optional, Tuple, Awaitable
+
+from utils.logger import logger
+
+
+# 只释放自己持有的锁（锁可能已过期并被其他进程重新获取）
+_RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+# 只为自己持有的锁续期
+_RENEW_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("expire", KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+class _LeaderAborted(Exception):
+    """leader 被取消或中断，未产生结果；跟随者应重新执行而不是收到取消"""
+
+
+class SingleFlight:
+    """在途请求合并
+
+    同一进程内，相同键的并发调用只有第一个（leader）真正执行，其余调用等待它的 Future。
+    配置了Redis时，leader 还需获取跨进程锁：拿到锁的进程执行并把结果短暂写入Redis，
+    其他进程的 leader 轮询该结果，锁消失仍无结果（执行方失败或崩溃）时再自行执行。
+    持锁期间每 lock_ttl/3 续期一次，执行时间超过 lock_ttl 也不会被其他进程重复执行；
+    进程崩溃后锁最多 lock_ttl 秒后过期。
+    leader 被取消（如客户端断开）时，跟随者重新进入合并，由其中一个重新执行。
+    do/ado 返回 (结果, 是否复用了他人的结果)。
+    """
+
+    def __init__(
+            self,
+            redis_client=None,
+            async_redis_client=None,
+            lock_ttl: int = 60,
+            wait_timeout: float = 60.0,
+            result_ttl: int = 10,
+            poll_ms: float = 50.0,
+            shareable: Optional[Callable[[Any], bool]] = None
+    ):
+        self.redis_client = redis_client
+        self.async_redis_client = async_redis_client
+        self.lock_ttl = lock_ttl
+        self.wait_timeout = wait_timeout
+        self.result_ttl = result_ttl
+        self.poll_interval = poll_ms / 1000.0
+        self.shareable = shareable or (lambda result: True)
+
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._stats = {"leaders": 0, "local_coalesced": 0, "remote_coalesced": 0, "follower_timeouts": 0, "leader_aborts": 0}
+
+    @staticmethod
+    def _lock_key(key: str) -> str:
+        return f"singleflight:lock:{key}"
+
+    @staticmethod
+    def _result_key(key: str) -> str:
+        return f"singleflight:result:{key}"
+
+    def _join(self, key: str) -> Tuple[Future, bool]:
+        """返回 (Future, 是否为leader)"""
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self._stats["local_coalesced"] += 1
+                return future, False
+            future = Future()
+            self._inflight[key] = future
+            self._stats["leaders"] += 1
+            return future, True
+
+    def _leave(self, key: str, future: Future):
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def _resolve(self, key: str, future: Future, result: Any = None, error: Optional[BaseException] = None):
+        """先移出在途表再通知跟随者，重试的跟随者不会再拿到这个已结束的 Future"""
+        self._leave(key, future)
+        if error is None:
+            future.set_result(result)
+        elif isinstance(error, Exception):
+            future.set_exception(error)
+        else:
+            # 取消/中断属于 leader 自身，不能传给跟随者
+            with self._lock:
+                self._stats["leader_aborts"] += 1
+            future.set_exception(_LeaderAborted())
+
+    def _encode_result(self, result: Any) -> Optional[str]:
+        if not self.shareable(result):
+            return None
+        try:
+            return json.dumps(result, ensure_ascii=False, default=float)
+        except (TypeError, ValueError) as e:
+            logger.log_error(e, {"operation": "singleflight_encode"})
+            return None
+
+    def _publish_result(self, key: str, result: Any):
+        payload = self._encode_result(result)
+        if payload is None:
+            return
+        try:
+            self.redis_client.setex(self._result_key(key), self.result_ttl, payload)
+        except Exception as e:
+            logger.log_error(e, {"operation": "singleflight_publish", "key": key})
+
+    async def _apublish_result(self, key: str, result: Any):
+        payload = self._encode_result(result)
+        if payload is None:
+            return
+        try:
+            await self.async_redis_client.setex(self._result_key(key), self.result_ttl, payload)
+        except Exception as e:
+            logger.log_error(e, {"operation": "singleflight_publish", "key": key})
+
+    # ===== 同步 =====
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        future, leader = self._join(key)
+        if not leader:
+            try:
+                return future.result(timeout=self.wait_timeout), True
+            except FutureTimeoutError:
+                self._stats["follower_timeouts"] += 1
+                return fn(), False
+            except _LeaderAborted:
+                return self.do(key, fn)
+
+        try:
+            result, shared = self._run_distributed(key, fn)
+        except BaseException as e:
+            self._resolve(key, future, error=e)
+            raise
+        self._resolve(key, future, result)
+        return result, shared
+
+    def _renew_interval(self) -> float:
+        return max(self.lock_ttl / 3.0, 0.1)
+
+    def _renew_lock(self, key: str, token: str) -> bool:
+        try:
+            return bool(self.redis_client.eval(_RENEW_SCRIPT, 1, self._lock_key(key), token, self.lock_ttl))
+        except Exception as e:
+            logger.log_error(e, {"operation": "singleflight_renew", "key": key})
+            return True  # 暂时性错误，下个周期重试
+
+    def _start_renewal(self, key: str, token: str) -> threading.Event:
+        """后台线程为持有的锁续期，返回用于停止续期的事件"""
+        stop = threading.Event()
+
+        def renew():
+            while not stop.wait(self._renew_interval()):
+                if not self._renew_lock(key, token):
+                    logger.logger.warning(f"Single-flight lock lost while leader is running: {key}")
+                    return
+
+        threading.Thread(target=renew, name="singleflight-renew", daemon=True).start()
+        return stop
+
+    def _run_distributed(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        if self.redis_client is None:
+            return fn(), False
+
+        token = uuid.uuid4().hex
+        try:
+            acquired = self.redis_client.set(self._lock_key(key), token, nx=True, ex=self.lock_ttl)
+        except Exception as e:
+            logger.log_error(e, {"operation": "singleflight_lock", "key": key})
+            return fn(), False
+
+        if acquired:
+            stop_renewal = self._start_renewal(key, token)
+            try:
+                result = fn()
+                self._publish_result(key, result)
+                return result, False
+            finally:
+                stop_renewal.set()
+                try:
+                    self.redis_client.eval(_RELEASE_SCRIPT, 1, self._lock_key(key), token)
+                except Exception as e:
+                    logger.log_error(e, {"operation": "singleflight_unlock", "key": key})
+
+        result = self._wait_remote(key)
+        if result is not None:
+            self._stats["remote_coalesced"] += 1
+            return result, True
+        return fn(), False
+
+    def _wait_remote(self, key: str) -> Optional[Any]:
+        deadline = time.monotonic() + self.wait_timeout
+        try:
+            while time.monotonic() < deadline:
+                raw = self.redis_client.get(self._result_key(key))
+                if raw:
+                    return json.loads(raw)
+                if not self.redis_client.exists(self._lock_key(key)):
+                    raw = self.redis_client.get(self._result_key(key))
+                    return json.loads(raw) if raw else None
+                time.sleep(self.poll_interval)
+        except Exception as e:
+            logger.log_error(e, {"operation": "singleflight_wait", "key": key})
+            return None
+        self._stats["follower_timeouts"] += 1
+        return None
+
+    # ===== 异步 =====
+
+    async def ado(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        future, leader = self._join(key)
+        if not leader:
+            try:
+                return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), self.wait_timeout), True
+            except asyncio.TimeoutError:
+                self._stats["follower_timeouts"] += 1
+                return await fn(), False
+            except _LeaderAborted:
+                return await self.ado(key, fn)
+
+        try:
+            result, shared = await self._arun_distributed(key, fn)
+        except BaseException as e:
+            self._resolve(key, future, error=e)
+            raise
+        self._resolve(key, future, result)
+        return result, shared
+
+    async def _arun_distributed(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        client = self.async_redis_client
+        if client is None:
+            return await fn(), False
+
+        token = uuid.uuid4().hex
+        try:
+            acquired = await client.set(self._lock_key(key), token, nx=True, ex=self.lock_ttl)
+        except Exception as e:
+            logger.log_error(e, {"operation": "singleflight_lock", "key": key})
+            return await fn(), False
+
+        if acquired:
+            renewal = asyncio.ensure_future(self._arenew_until_cancelled(key, token))
+            try:
+                result = await fn()
+                await self._apublish_result(key, result)
+                return result, False
+            finally:
+                renewal.cancel()
+                try:
+                    await client.eval(_RELEASE_SCRIPT, 1, self._lock_key(key), token)
+                except Exception as e:
+                    logger.log_error(e, {"operation": "singleflight_unlock", "key": key})
+
+        result = await self._await_remote(key)
+        if result is not None:
+            self._stats["remote_coalesced"] += 1
+            return result, True
+        return await fn(), False
+
+    async def _arenew_until_cancelled(self, key: str, token: str):
+        """持锁期间定期续期，leader 结束时被取消"""
+        while True:
+            await asyncio.sleep(self._renew_interval())
+            try:
+                renewed = await self.async_redis_client.eval(_RENEW_SCRIPT, 1, self._lock_key(key), token, self.lock_ttl)
+            except Exception as e:
+                logger.log_error(e, {"operation": "singleflight_renew", "key": key})
+                continue
+            if not renewed:
+                logger.logger.warning(f"Single-flight lock lost while leader is running: {key}")
+                return
+
+    async def _await_remote(self, key: str) -> Optional[Any]:
+        client = self.async_redis_client
+        deadline = time.monotonic() + self.wait_timeout
+        try:
+            while time.monotonic() < deadline:
+                raw = await client.get(self._result_key(key))
+                if raw:
+                    return json.loads(raw)
+                if not await client.exists(self._lock_key(key)):
+                    raw = await client.get(self._result_key(key))
+                    return json.loads(raw) if raw else None
+                await asyncio.sleep(self.poll_interval)
+        except Exception as e:
+            logger.log_error(e, {"operation": "singleflight_wait", "key": key})
+            return None
+        self._stats["follower_timeouts"] += 1
+        return None
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["inflight"] = len(self._inflight)
+        return stats